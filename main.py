@@ -1,16 +1,25 @@
 from src.dataset_loader import (
-    load_beir_documents, 
+    iter_beir_documents,
+    open_corpus_store,
     load_beir_queries_and_qrels)
 from src.search_engine import (
-    build_tf_idf_matrix,
     build_inverted_index,
     query_vectorizer,
-    compute_cosine_similarity,
-    build_bm25_model,
-    compute_bm25_scores
+    batch_search_tfidf,
+    batch_search_bm25
 )
-from src.preprocessing import preprocess_documents, preprocess_both
-from src.perf_metrics import precision_recall_at_k, average_precision
+from src.query_cache import QueryResultCache
+from src.query_processor import (
+    compute_bm25_scores_pruned,
+    compute_bm25_scores_tiered,
+    compute_cosine_similarity_pruned,
+    compute_cosine_similarity_tiered,
+    compute_hybrid_scores
+)
+from src.index_store import add_champion_tiers, build_index_from_stream, index_exists, load_index, save_index
+from src.preprocessing import check_nltk_resources, iter_preprocessed, preprocess_documents, preprocess_both
+from src.evaluation import RunEvaluator, tier_recall
+import numpy as np
 import os
 import time
 
@@ -21,174 +30,269 @@ import time
 TOP_K = 5
 # Algoritmo por defecto: False = TF-IDF, True = BM25
 USE_BM25 = False
+# Fusión del modo híbrido: 'weighted' (puntajes normalizados) o 'rrf' (rango recíproco)
+HYBRID_FUSION = "weighted"
+# Peso de BM25 en la fusión ponderada (TF-IDF recibe el resto)
+HYBRID_ALPHA = 0.5
+# Número de consultas a evaluar en la evaluación automática (None = todas)
+QUERY_LIMIT = None
+# Directorio del índice persistido en disco
+INDEX_DIR = "src/index_cache"
+# Procesos para el preprocesamiento del corpus (None = todos los núcleos)
+PREPROCESS_JOBS = None
+# Campeones por término del primer nivel del índice (None = consultar siempre las postings completas)
+CHAMPION_SIZE = 256
+
+def main():
+    """
+    Carga el corpus, abre o construye el índice y ejecuta la interfaz de consola.
+    """
+    # Los recursos de NLTK se verifican localmente; no se descargan al arrancar
+    try:
+        check_nltk_resources()
+    except LookupError as e:
+        print(e)
+        return
+
+    # ───── Carga y preprocesamiento ─────
+    # Almacén columnar del corpus: los textos se leen bajo demanda por número de fila
+    corpus = open_corpus_store()
+    queries, qrels = load_beir_queries_and_qrels(limit=QUERY_LIMIT)
+
+    # Preprocesamiento textual de las consultas
+    preprocessed_queries = {qid: preprocess_both(qtext) for qid, qtext in queries.items()}
+
+    # ───── Abrir índice persistido ─────
+    index = None
+    if index_exists(INDEX_DIR):
+        try:
+            print("Abriendo índice desde disco...")
+            index = load_index(INDEX_DIR)
+        except ValueError as e:
+            print(f"No se pudo abrir el índice ({e}); se reconstruirá.")
+        else:
+            if index.document_ids != corpus.doc_ids():
+                print("El índice no corresponde al corpus actual; se reconstruirá.")
+                index = None
+
+    if index is None:
+        # Preprocesamiento e indexación en flujo: el corpus se lee, preprocesa e indexa por lotes
+        # (una sola pasada que produce el texto limpio y los tokens)
+        print("Construyendo índices TF-IDF y BM25...")
+        index = build_index_from_stream(
+            iter_preprocessed(iter_beir_documents(), n_jobs=PREPROCESS_JOBS), champion_size=CHAMPION_SIZE)
+        save_index(index, INDEX_DIR)
+    elif CHAMPION_SIZE is not None and (index.bm25_tier is None or index.bm25_tier.size != CHAMPION_SIZE):
+        # Índice guardado sin listas de campeones (o con otro tamaño): se construyen y se guardan
+        # para no repetirlo en cada arranque
+        print("Construyendo listas de campeones...")
+        add_champion_tiers(index, CHAMPION_SIZE)
+        save_index(index, INDEX_DIR)
 
-# ───── Carga y preprocesamiento ─────
-documents, document_ids = load_beir_documents() 
-queries, qrels = load_beir_queries_and_qrels(limit=50)
-
-# Preprocesamiento textual de los documentos
-df = preprocess_documents(documents)
-preprocessed_docs = df['prep_doc'].tolist()
-preprocessed_token_docs = preprocess_documents(documents, return_type='tokens')
-preprocessed_queries = {qid: preprocess_both(qtext) for qid, qtext in queries.items()}
-
-# ───── Crear índices ─────
-print("Construyendo índice TF-IDF...")
-tfidf_matrix, tfidf_vectorizer = build_tf_idf_matrix(preprocessed_docs)
-inverted_index = build_inverted_index(tfidf_matrix, tfidf_vectorizer)
-
-
-# ───── Construye modelo BM25 ─────
-print("Construyedo modelo BM25...")
-bm25_model = build_bm25_model(preprocessed_token_docs)
-
-
-# ───── Interfaz de consola ─────
-while True:
-    os.system('cls' if os.name == 'nt' else 'clear')  # Limpia pantalla
-    print("===== Sistema de Recuperación de Información =====")
-    print("Seleccione el algoritmo de recuperación:")
-    print("1. Similitud Coseno con TF-IDF")
-    print("2. BM25")
-    print("3. Evaluar automáticamente (TF-IDF y BM25)")
-    print("4. Mostrar índice invertido (TF-IDF)")
-    print("5. Imprimir corpus") 
-    print("6. Salir")
-
-    choice = input("Opción: ").strip()
-    
-    if choice == '1':
-        USE_BM25 = False
-    elif choice == '2':
-        USE_BM25 = True
-    elif choice == '3': 
-        # ───── Evaluación automática ─────
-        print("Ejecutando evaluación automática...")
-
-        # Inicialización de variables acumuladoras para métricas
-        total_precision_tfidf = 0.0
-        total_recall_tfidf = 0.0
-        total_precision_bm25 = 0.0
-        total_recall_bm25 = 0.0
-        num_queries = 0
-        total_map_tfidf = 0.0
-        total_map_bm25 = 0.0
-        num_queries = 0
-
-        start = time.time()
-        for query_id, query_text in queries.items():
-            # Obtener la versión preprocesada de la consulta
-            query_clean, query_tokens = preprocessed_queries[query_id]
-
-            # === Evaluación TF-IDF ===
-            query_vec = query_vectorizer(query_clean, tfidf_vectorizer)
-            results_tfidf, time_tfid = compute_cosine_similarity(tfidf_matrix, query_vec, df['document'])
-            top_results_tfidf = results_tfidf.head(TOP_K)
-            retrieved_tfidf_ids = [document_ids[i] for i in top_results_tfidf.index]
-
-            # === Evaluación BM25 ===
-            results_bm25, time_bm25 = compute_bm25_scores(bm25_model, query_tokens, df['document'])
-            top_results_bm25 = results_bm25.head(TOP_K)
-            retrieved_bm25_ids = [document_ids[i] for i in top_results_bm25.index]
-
-            # === Cálculo de métricas ===
-            # Obtener los documentos relevantes para la consulta
-            relevant_doc_ids = qrels[query_id]
-
-            # Calcular Precisión y Recall para cada modelo
-            prec_tfidf, rec_tfidf = precision_recall_at_k(relevant_doc_ids, retrieved_tfidf_ids, TOP_K)
-            prec_bm25, rec_bm25 = precision_recall_at_k(relevant_doc_ids, retrieved_bm25_ids, TOP_K)
-
-            # Calcular Promedio de Precisión (MAP)
-            ap_tfidf = average_precision(relevant_doc_ids, retrieved_tfidf_ids)
-            ap_bm25 = average_precision(relevant_doc_ids, retrieved_bm25_ids)
-
-            # Acumular métricas
-            total_precision_tfidf += prec_tfidf
-            total_recall_tfidf += rec_tfidf
-            total_precision_bm25 += prec_bm25
-            total_recall_bm25 += rec_bm25
-            total_map_tfidf += ap_tfidf
-            total_map_bm25 += ap_bm25
-
-            num_queries += 1
-
-        # === Promedios finales ===
-        # Calcular métricas promedio sobre todas las consultas evaluadas
-        mean_prec_tfidf = total_precision_tfidf / num_queries
-        mean_rec_tfidf = total_recall_tfidf / num_queries
-        mean_prec_bm25 = total_precision_bm25 / num_queries
-        mean_rec_bm25 = total_recall_bm25 / num_queries
-        mean_map_tfidf = total_map_tfidf / num_queries
-        mean_map_bm25 = total_map_bm25 / num_queries
-
-        end = time.time()
-
-        # Mostrar resultados por consola
-        print("\n--- Resultado de la Evaluación Automática ---")
-        print(f"Consultas evaluadas: {num_queries}")
-        print(f"\n[TF-IDF]")
-        print(f"Precisión promedio @ {TOP_K}: {mean_prec_tfidf:.2f}")
-        print(f"Recall promedio @ {TOP_K}:    {mean_rec_tfidf:.2f}")
-        print(f"MAP:                         {mean_map_tfidf:.4f}")
-        print(f"\n[BM25]")
-        print(f"Precisión promedio @ {TOP_K}: {mean_prec_bm25:.2f}")
-        print(f"Recall promedio @ {TOP_K}:    {mean_rec_bm25:.2f}")
-        print(f"MAP:                         {mean_map_bm25:.4f}")
-        print("tiempo promedio TF-IDF: {:.2f} segundos".format(time_tfid))
-        print("tiempo promedio BM25: {:.2f} segundos".format(time_bm25))
-        print(f"Tiempo total de evaluación: {end - start:.2f} segundos")
-        input("\nPresione Enter para continuar...")
-        continue
-    elif choice == '4':
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print("=== Índice Invertido (TF-IDF) ===")
-        for term, doc_indices in list(inverted_index.items()):
-            print(f"{term}: {doc_indices}")
-        input("\nPresione Enter para continuar...")
-        continue
-    elif choice == '5':
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print("=== Corpus original y preprocesado (primeros 10 documentos) ===")
-        print(df[['document', 'prep_doc']].head(10).to_string(index=False))
-        input("\nPresione Enter para continuar...")
-        continue
-    elif choice == '6':
-        print("Saliendo...")
-        break
-
-    else:
-        print("Opción inválida.")
-        input("Presione Enter para continuar...")
-        continue
-    
-    # Submenú de consultas
+    document_ids = index.document_ids
+    tfidf_vectorizer = index.tfidf_vectorizer
+    bm25_model = index.bm25_model
+    # Postings TF-IDF por término y sus cotas superiores para la poda dinámica
+    # (guardadas con el índice; no se copian)
+    tfidf_engine = index.tfidf_engine
+    # El índice invertido solo se usa para mostrarlo; se construye la primera vez que se pide
+    inverted_index = None
+    # Algoritmo seleccionado en el menú: 'tfidf', 'bm25' o 'hybrid'
+    model = 'bm25' if USE_BM25 else 'tfidf'
+    model_names = {'tfidf': 'TF-IDF', 'bm25': 'BM25', 'hybrid': 'Híbrido'}
+    hybrid_params = {'fusion': HYBRID_FUSION, 'alpha': HYBRID_ALPHA}
+    # Caché de resultados de las consultas interactivas, ligada a la versión del índice
+    result_cache = QueryResultCache(index_version=index.version)
+    bm25_params = {'k1': bm25_model.k1, 'b': bm25_model.b, 'epsilon': bm25_model.epsilon}
+    # Evaluador de corridas completas; se crea la primera vez que se evalúa
+    evaluator = None
+
+    # ───── Interfaz de consola ─────
     while True:
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print(f"=== Consulta ({'BM25' if USE_BM25 else 'TF-IDF'}) ===")
-        print("Escribe tu consulta o escribe 'volver' para regresar al menú.")
-        query = input("> ").strip()
+        os.system('cls' if os.name == 'nt' else 'clear')  # Limpia pantalla
+        print("===== Sistema de Recuperación de Información =====")
+        print("Seleccione el algoritmo de recuperación:")
+        print("1. Similitud Coseno con TF-IDF")
+        print("2. BM25")
+        print("3. Híbrido (BM25 + TF-IDF)")
+        print("4. Evaluar automáticamente (TF-IDF, BM25 e híbrido)")
+        print("5. Mostrar índice invertido (TF-IDF)")
+        print("6. Imprimir corpus") 
+        print("7. Salir")
+
+        choice = input("Opción: ").strip()
+
+        if choice == '1':
+            model = 'tfidf'
+        elif choice == '2':
+            model = 'bm25'
+        elif choice == '3':
+            model = 'hybrid'
+        elif choice == '4': 
+            # ───── Evaluación automática ─────
+            print("Ejecutando evaluación automática...")
+
+            start = time.perf_counter()
+            query_ids = list(queries)
+            # Los qrels se convierten a índices enteros una sola vez para todas las corridas
+            if evaluator is None:
+                evaluator = RunEvaluator(qrels, query_ids, document_ids)
+
+            # === Búsqueda por lotes: todas las consultas se puntúan a la vez ===
+            (top_tfidf, scores_tfidf), time_tfid = batch_search_tfidf(
+                tfidf_engine, tfidf_vectorizer, [preprocessed_queries[qid][0] for qid in query_ids], k=TOP_K)
+            (top_bm25, scores_bm25), time_bm25 = batch_search_bm25(
+                bm25_model, [preprocessed_queries[qid][1] for qid in query_ids], k=TOP_K)
+            # Híbrido: una sola pasada por consulta sobre las postings de ambos modelos
+            top_hybrid = np.full((len(query_ids), TOP_K), -1, dtype=np.int64)
+            time_hybrid = 0.0
+            for row, qid in enumerate(query_ids):
+                query_clean, query_tokens = preprocessed_queries[qid]
+                query_vec = query_vectorizer(query_clean, tfidf_vectorizer)
+                (indices, _, _), elapsed = compute_hybrid_scores(
+                    bm25_model, tfidf_engine.postings, query_vec, query_tokens, TOP_K,
+                    return_frame=False, **hybrid_params)
+                top_hybrid[row, :len(indices)] = indices
+                time_hybrid += elapsed
+
+            # Primer nivel: qué parte del top-k exacto recuperan las listas de campeones por sí solas
+            # y con qué frecuencia hay que recurrir a las postings completas
+            tier_results = {}
+            if index.bm25_tier is not None:
+                tier_rows = {name: np.full((len(query_ids), TOP_K), -1, dtype=np.int64) for name in ('TF-IDF', 'BM25')}
+                fallbacks = {'TF-IDF': 0, 'BM25': 0}
+                tier_times = {'TF-IDF': 0.0, 'BM25': 0.0}
+                for row, qid in enumerate(query_ids):
+                    query_clean, query_tokens = preprocessed_queries[qid]
+                    query_vec = query_vectorizer(query_clean, tfidf_vectorizer)
+                    for name, ((_, _, stats), elapsed) in (
+                            ('TF-IDF', compute_cosine_similarity_tiered(
+                                tfidf_engine.postings, tfidf_engine.max_scores, index.tfidf_tier, query_vec, TOP_K,
+                                return_frame=False)),
+                            ('BM25', compute_bm25_scores_tiered(
+                                bm25_model, index.bm25_tier, query_tokens, TOP_K, return_frame=False))):
+                        tier_docs = stats['tier_docs'][:TOP_K]
+                        tier_rows[name][row, :len(tier_docs)] = tier_docs
+                        fallbacks[name] += stats['fallback']
+                        tier_times[name] += elapsed
+                # Referencia: top-k exacto sin el relleno de puntaje cero del lote (el primer nivel
+                # solo retorna documentos que comparten algún término con la consulta)
+                for name, exact_rows, exact_scores in (('TF-IDF', top_tfidf, scores_tfidf),
+                                                       ('BM25', top_bm25, scores_bm25)):
+                    reference_rows = np.where(exact_scores > 0, exact_rows, -1)
+                    tier_results[name] = (tier_recall(reference_rows, tier_rows[name]).mean(),
+                                          fallbacks[name] / len(query_ids), tier_times[name])
+
+            # === Cálculo de métricas (vectorizado sobre todas las consultas) ===
+            num_queries = len(query_ids)
+            metrics = {
+                'TF-IDF': (evaluator.summary(top_tfidf, cutoffs=(TOP_K,)), time_tfid),
+                'BM25': (evaluator.summary(top_bm25, cutoffs=(TOP_K,)), time_bm25),
+                f"Híbrido ({HYBRID_FUSION})": (evaluator.summary(top_hybrid, cutoffs=(TOP_K,)), time_hybrid),
+            }
 
-        if query.lower() == 'volver':
+            end = time.perf_counter()
+
+            # Mostrar resultados por consola
+            print("\n--- Resultado de la Evaluación Automática ---")
+            print(f"Consultas evaluadas: {num_queries}")
+            for name, (summary, search_time) in metrics.items():
+                print(f"\n[{name}]")
+                print(f"Precisión promedio @ {TOP_K}: {summary[f'precision@{TOP_K}']:.2f}")
+                print(f"Recall promedio @ {TOP_K}:    {summary[f'recall@{TOP_K}']:.2f}")
+                print(f"nDCG @ {TOP_K}:                    {summary[f'ndcg@{TOP_K}']:.4f}")
+                print(f"MAP:                         {summary['map']:.4f}")
+                print(f"MRR:                         {summary['mrr']:.4f}")
+                print("Tiempo promedio por consulta: {:.6f} segundos".format(search_time / num_queries))
+            for name, (recall, fallback_rate, tier_time) in tier_results.items():
+                print(f"\n[{name} con primer nivel (r={index.bm25_tier.size})]")
+                print(f"Recall del primer nivel @ {TOP_K}: {recall:.4f}")
+                print(f"Tasa de respaldo:            {fallback_rate:.2%}")
+                print("Tiempo promedio por consulta: {:.6f} segundos".format(tier_time / num_queries))
+            print(f"\nTiempo total de evaluación: {end - start:.2f} segundos")
+            input("\nPresione Enter para continuar...")
+            continue
+        elif choice == '5':
+            os.system('cls' if os.name == 'nt' else 'clear')
+            print("=== Índice Invertido (TF-IDF) ===")
+            if inverted_index is None:
+                inverted_index = build_inverted_index(tfidf_engine.postings, tfidf_vectorizer)
+            for term, doc_indices in list(inverted_index.items()):
+                print(f"{term}: {doc_indices}")
+            input("\nPresione Enter para continuar...")
+            continue
+        elif choice == '6':
+            os.system('cls' if os.name == 'nt' else 'clear')
+            print("=== Corpus original y preprocesado (primeros 10 documentos) ===")
+            print(preprocess_documents(corpus.texts(range(min(10, len(corpus))))).to_string(index=False))
+            input("\nPresione Enter para continuar...")
+            continue
+        elif choice == '7':
+            print("Saliendo...")
             break
-        elif len(query) < 2:
-            print("Consulta muy corta.")
+
+        else:
+            print("Opción inválida.")
             input("Presione Enter para continuar...")
             continue
-        
-        # Procesamiento y búsqueda
-        query_clean, query_tokens = preprocess_both(query)
 
-        if USE_BM25:
-            results, measured_time = compute_bm25_scores(bm25_model, query_tokens, df["document"])
-        else:
-            query_vec = query_vectorizer(query_clean, tfidf_vectorizer)
-            results, measured_time = compute_cosine_similarity(tfidf_matrix, query_vec, df['document'])
+        # Submenú de consultas
+        while True:
+            os.system('cls' if os.name == 'nt' else 'clear')
+            print(f"=== Consulta ({model_names[model]}) ===")
+            print("Escribe tu consulta o escribe 'volver' para regresar al menú.")
+            query = input("> ").strip()
+
+            if query.lower() == 'volver':
+                break
+            elif len(query) < 2:
+                print("Consulta muy corta.")
+                input("Presione Enter para continuar...")
+                continue
+
+            # Procesamiento y búsqueda
+            query_clean, query_tokens = preprocess_both(query)
+
+            def search():
+                # Con listas de campeones se consulta primero el primer nivel (el resultado sigue siendo exacto)
+                if model == 'bm25' and index.bm25_tier is not None:
+                    (indices, scores, _), _ = compute_bm25_scores_tiered(
+                        bm25_model, index.bm25_tier, query_tokens, TOP_K, return_frame=False)
+                elif model == 'bm25':
+                    (indices, scores, _), _ = compute_bm25_scores_pruned(
+                        bm25_model, query_tokens, TOP_K, return_frame=False)
+                elif model == 'hybrid':
+                    query_vec = query_vectorizer(query_clean, tfidf_vectorizer)
+                    (indices, scores, _), _ = compute_hybrid_scores(
+                        bm25_model, tfidf_engine.postings, query_vec, query_tokens, TOP_K,
+                        return_frame=False, **hybrid_params)
+                elif index.tfidf_tier is not None:
+                    query_vec = query_vectorizer(query_clean, tfidf_vectorizer)
+                    (indices, scores, _), _ = compute_cosine_similarity_tiered(
+                        tfidf_engine.postings, tfidf_engine.max_scores, index.tfidf_tier, query_vec, TOP_K,
+                        return_frame=False)
+                else:
+                    query_vec = query_vectorizer(query_clean, tfidf_vectorizer)
+                    (indices, scores, _), _ = compute_cosine_similarity_pruned(
+                        tfidf_engine.postings, tfidf_engine.max_scores, query_vec, TOP_K, return_frame=False)
+                return indices, scores
+
+            start = time.perf_counter()
+            cache_params = {'bm25': bm25_params, 'hybrid': {**bm25_params, **hybrid_params}}.get(model)
+            cache_key = QueryResultCache.make_key(model, cache_params, query_tokens, TOP_K)
+            indices, scores = result_cache.get_or_compute(cache_key, search)
+            measured_time = time.perf_counter() - start
+
+            print(f"\nResultados para: \"{query}\"\n")
+            print(f"Su consulta se resolvió en {measured_time:.6f} segundos.")
+            print(f"Tasa de aciertos de la caché: {result_cache.stats()['hit_rate']:.0%}\n")
+            # Solo se lee del corpus el fragmento de los documentos recuperados
+            for i, (row, score) in enumerate(zip(indices, scores)):
+                print(f"{i+1}. Score: {score:.4f}")
+                print(f"   {corpus.snippet(row)}...\n")
+
+            input("Presione Enter para hacer otra consulta...")
 
-        print(f"\nResultados para: \"{query}\"\n")
-        print(f"Su consulta se resolvió en {measured_time:.2f} segundos.\n")
-        for i, row in results.head(TOP_K).iterrows():
-            print(f"{i+1}. Score: {row['Similarity']:.4f}")
-            print(f"   {row['Document'][:200]}...\n")
 
-        input("Presione Enter para hacer otra consulta...")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+"""
+Suite de benchmarks reproducible del sistema de recuperación.
+
+Uso:
+    python -m src.benchmark --sizes 5000,20000,all --workers 4 --output benchmark_results.json
+
+Para cada tamaño de corpus construye el índice, mide su memoria y ejecuta el conjunto de
+consultas BEIR contra cada motor, reportando latencias p50/p95/p99, QPS con un hilo y con
+varios procesos, y MAP/MRR/P@k/recall/nDCG. Los resultados se guardan en JSON para comparar
+commits.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import scipy
+from src.dataset_loader import iter_beir_documents, load_beir_queries_and_qrels
+from src import instrumentation
+from src.index_store import build_index_from_stream, load_index, save_index
+from src.instrumentation import peak_rss_bytes
+from src.evaluation import RunEvaluator, tier_recall
+from src.preprocessing import iter_preprocessed, preprocess_both
+from src.query_processor import (
+    compute_bm25_scores_pruned,
+    compute_bm25_scores_tiered,
+    compute_cosine_similarity_pruned,
+    compute_cosine_similarity_tiered,
+    compute_hybrid_scores,
+)
+from src.search_engine import (
+    batch_search_bm25,
+    ChampionTier,
+    batch_search_tfidf,
+    compute_bm25_scores,
+    compute_cosine_similarity,
+    query_vectorizer,
+)
+
+BENCHMARK_OUTPUT = "benchmark_results.json"
+BENCHMARK_SIZES = "5000,all"
+BENCHMARK_K = 5
+BENCHMARK_WORKERS = os.cpu_count() or 1
+# Consultas ejecutadas antes de medir, para calentar cachés y la caché de lemas
+WARMUP_QUERIES = 20
+
+# Estado del índice en cada proceso del pool (se abre una vez por proceso)
+_WORKER_STATE = None
+
+def _prepare_state(index):
+    """
+    Prepara las estructuras que usan los motores a partir de un índice.
+
+    Parámetros:
+        index (SearchIndex): Índice construido o cargado de disco.
+
+    Retorna:
+        dict: Índice y motor TF-IDF sobre sus postings (el del propio índice, sin copias).
+    """
+    return {"index": index, "tfidf": index.tfidf_engine}
+
+def _search_tfidf(state, query_clean, query_tokens, k):
+    query_vec = query_vectorizer(query_clean, state["index"].tfidf_vectorizer)
+    (indices, _), _ = compute_cosine_similarity(state["tfidf"], query_vec, k=k, return_frame=False)
+    return indices
+
+def _search_tfidf_maxscore(state, query_clean, query_tokens, k):
+    query_vec = query_vectorizer(query_clean, state["index"].tfidf_vectorizer)
+    (indices, _, _), _ = compute_cosine_similarity_pruned(
+        state["tfidf"].postings, state["tfidf"].max_scores, query_vec, k, return_frame=False)
+    return indices
+
+def _search_bm25(state, query_clean, query_tokens, k):
+    (indices, _), _ = compute_bm25_scores(state["index"].bm25_model, query_tokens, k=k, return_frame=False)
+    return indices
+
+def _search_bm25_maxscore(state, query_clean, query_tokens, k):
+    (indices, _, _), _ = compute_bm25_scores_pruned(state["index"].bm25_model, query_tokens, k, return_frame=False)
+    return indices
+
+def _search_hybrid(state, query_clean, query_tokens, k, fusion="weighted"):
+    query_vec = query_vectorizer(query_clean, state["index"].tfidf_vectorizer)
+    (indices, _, _), _ = compute_hybrid_scores(
+        state["index"].bm25_model, state["tfidf"].postings, query_vec, query_tokens, k,
+        fusion=fusion, return_frame=False)
+    return indices
+
+def _search_hybrid_rrf(state, query_clean, query_tokens, k):
+    return _search_hybrid(state, query_clean, query_tokens, k, fusion="rrf")
+
+# Motores de consulta individual: nombre -> función (estado, texto limpio, lemas, k) -> índices
+ENGINES = {
+    "tfidf": _search_tfidf,
+    "tfidf_maxscore": _search_tfidf_maxscore,
+    "bm25": _search_bm25,
+    "bm25_maxscore": _search_bm25_maxscore,
+    "hybrid": _search_hybrid,
+    "hybrid_rrf": _search_hybrid_rrf,
+}
+
+def _init_worker(index_path):
+    """
+    Inicializador del pool: mapea en memoria el índice guardado una sola vez por proceso.
+    """
+    global _WORKER_STATE
+    _WORKER_STATE = _prepare_state(load_index(index_path, mmap=True))
+
+def _run_queries(engine, queries, k):
+    """
+    Ejecuta un bloque de consultas en un proceso del pool.
+    """
+    search = ENGINES[engine]
+    for query_clean, query_tokens in queries:
+        search(_WORKER_STATE, query_clean, query_tokens, k)
+    return len(queries)
+
+def index_nbytes(state):
+    """
+    Calcula la memoria ocupada por los arreglos del índice.
+
+    Parámetros:
+        state (dict): Estado de _prepare_state.
+
+    Retorna:
+        dict: Bytes de las postings TF-IDF (con sus cotas e idf), del modelo BM25 y el total.
+    """
+    def sparse_nbytes(matrix):
+        return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+    index = state["index"]
+    bm25 = index.bm25_model
+    sizes = {
+        "tfidf": sparse_nbytes(state["tfidf"].postings)
+                 + int(state["tfidf"].max_scores.nbytes + np.asarray(index.tfidf_vectorizer.idf_).nbytes),
+        "bm25": sparse_nbytes(bm25.weights) + int(bm25.max_scores.nbytes + bm25.idf.nbytes + bm25.doc_len.nbytes),
+    }
+    sizes["total"] = sum(sizes.values())
+    return sizes
+
+def latency_summary(latencies_ns):
+    """
+    Resume una lista de latencias.
+
+    Parámetros:
+        latencies_ns (list[int]): Latencias en nanosegundos (perf_counter_ns).
+
+    Retorna:
+        dict: Media y percentiles 50/95/99 en milisegundos, y QPS con un hilo.
+    """
+    latencies_ms = np.asarray(latencies_ns, dtype=np.float64) / 1e6
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    total_s = latencies_ms.sum() / 1e3
+    return {
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "qps_single": float(len(latencies_ms) / total_s) if total_s > 0 else None,
+    }
+
+def _run_rows(retrieved, k):
+    """
+    Apila los índices recuperados por consulta en una matriz consultas x k (-1 donde faltan
+    documentos, por ejemplo cuando la búsqueda con poda retorna menos de k).
+    """
+    rows = np.full((len(retrieved), k), -1, dtype=np.int64)
+    for row, indices in enumerate(retrieved):
+        rows[row, :len(indices)] = indices[:k]
+    return rows
+
+def _multi_worker_qps(index_path, engine, queries, k, workers):
+    """
+    Mide el QPS repartiendo las consultas entre varios procesos que comparten el índice mapeado.
+
+    La primera pasada calienta el pool (apertura del índice en cada proceso); solo se mide la segunda.
+    """
+    chunk_size = max(1, -(-len(queries) // (workers * 4)))
+    chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index_path,)) as executor:
+        list(executor.map(_run_queries, [engine] * len(chunks), chunks, [k] * len(chunks)))
+        start = time.perf_counter_ns()
+        done = sum(executor.map(_run_queries, [engine] * len(chunks), chunks, [k] * len(chunks)))
+        elapsed_s = (time.perf_counter_ns() - start) / 1e9
+    return done / elapsed_s if elapsed_s > 0 else None
+
+def benchmark_tiers(state, query_list, evaluator, champion_sizes, k):
+    """
+    Mide el compromiso tamaño/recall de las listas de campeones para varios tamaños r.
+
+    Para cada tamaño y modelo construye el primer nivel y ejecuta las consultas con respaldo a
+    las postings completas (resultado exacto), comparando el top-k del primer nivel por sí solo
+    con el top-k exacto de MaxScore.
+
+    Parámetros:
+        state (dict): Estado de _prepare_state.
+        query_list (list[tuple[str, list[str]]]): Consultas preprocesadas (texto limpio, lemas).
+        evaluator (RunEvaluator): Evaluador de las consultas.
+        champion_sizes (list[int]): Tamaños r a medir.
+        k (int): Número de resultados por consulta.
+
+    Retorna:
+        dict: Por tamaño r y modelo: tiempo de construcción, bytes del primer nivel, latencias,
+              recall del primer nivel, tasa de respaldo, fracción de postings recorridas y las
+              métricas de calidad del primer nivel por sí solo.
+    """
+    index = state["index"]
+    tfidf = state["tfidf"]
+    query_vectors = [query_vectorizer(query_clean, index.tfidf_vectorizer) for query_clean, _ in query_list]
+    # Cada modelo: (postings completas, búsqueda exacta, búsqueda por niveles)
+    models = {
+        "tfidf": (
+            tfidf.postings,
+            lambda i: compute_cosine_similarity_pruned(
+                tfidf.postings, tfidf.max_scores, query_vectors[i], k, return_frame=False)[0][0],
+            lambda tier, i: compute_cosine_similarity_tiered(
+                tfidf.postings, tfidf.max_scores, tier, query_vectors[i], k, return_frame=False)[0],
+        ),
+        "bm25": (
+            index.bm25_model.weights,
+            lambda i: compute_bm25_scores_pruned(index.bm25_model, query_list[i][1], k, return_frame=False)[0][0],
+            lambda tier, i: compute_bm25_scores_tiered(
+                index.bm25_model, tier, query_list[i][1], k, return_frame=False)[0],
+        ),
+    }
+    exact_rows = {name: _run_rows([search(i) for i in range(len(query_list))], k)
+                  for name, (_, search, _) in models.items()}
+
+    results = {}
+    for size in champion_sizes:
+        results[str(size)] = {}
+        for name, (postings, _, tiered_search) in models.items():
+            start = time.perf_counter_ns()
+            tier = ChampionTier(postings, size)
+            build_seconds = (time.perf_counter_ns() - start) / 1e9
+
+            latencies, tier_docs = [], []
+            fallbacks = postings_scored = postings_total = 0
+            for i in range(len(query_list)):
+                t0 = time.perf_counter_ns()
+                _, _, stats = tiered_search(tier, i)
+                latencies.append(time.perf_counter_ns() - t0)
+                tier_docs.append(stats["tier_docs"])
+                fallbacks += stats["fallback"]
+                postings_scored += stats["postings_scored"]
+                postings_total += stats["postings_total"]
+
+            tier_rows = _run_rows(tier_docs, k)
+            tier_postings = tier.postings
+            results[str(size)][name] = {
+                "build_seconds": build_seconds,
+                "tier_bytes": int(tier_postings.data.nbytes + tier_postings.indices.nbytes
+                                  + tier_postings.indptr.nbytes + tier.remainder.nbytes),
+                **latency_summary(latencies),
+                "tier_recall": float(tier_recall(exact_rows[name], tier_rows).mean()),
+                "fallback_rate": fallbacks / len(query_list) if query_list else 0.0,
+                "postings_fraction": postings_scored / postings_total if postings_total else 0.0,
+                "tier_only": evaluator.summary(tier_rows, cutoffs=(k,)),
+            }
+    return results
+
+def benchmark_size(size, queries, qrels, engines, k, workers, repeat, jobs, champion_sizes=()):
+    """
+    Construye el índice para un tamaño de corpus y mide todos los motores sobre él.
+
+    Parámetros:
+        size (int | None): Número de documentos del corpus (None = corpus completo).
+        queries (dict[str, tuple[str, list[str]]]): Consultas preprocesadas por ID.
+        qrels (dict[str, list[str]]): Documentos relevantes por consulta.
+        engines (list[str]): Motores a medir (claves de ENGINES).
+        k (int): Número de resultados por consulta.
+        workers (int): Procesos para el QPS con varios procesos (0 o 1 lo omite).
+        repeat (int): Veces que se repite el conjunto de consultas al medir latencias.
+        jobs (int | None): Procesos para el preprocesamiento del corpus.
+        champion_sizes (list[int]): Tamaños r de las listas de campeones a medir (ver benchmark_tiers).
+
+    Retorna:
+        dict: Resultados del tamaño de corpus. Con la instrumentación activa, incluye además
+              el desglose por etapas ('stages').
+    """
+    instrumentation.reset()
+    start = time.perf_counter_ns()
+    index = build_index_from_stream(iter_preprocessed(iter_beir_documents(limit=size), n_jobs=jobs))
+    state = _prepare_state(index)
+    build_seconds = (time.perf_counter_ns() - start) / 1e9
+
+    query_ids = list(queries)
+    query_list = [queries[qid] for qid in query_ids]
+    evaluator = RunEvaluator(qrels, query_ids, index.document_ids)
+    result = {
+        "num_docs": len(index.document_ids),
+        "num_queries": len(query_ids),
+        "build_seconds": build_seconds,
+        "index_bytes": index_nbytes(state),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "engines": {},
+        "batch": {},
+    }
+
+    with tempfile.TemporaryDirectory() as index_path:
+        save_index(index, index_path)
+        result["index_disk_bytes"] = sum(
+            os.path.getsize(os.path.join(index_path, name)) for name in os.listdir(index_path))
+
+        for engine in engines:
+            search = ENGINES[engine]
+            for query_clean, query_tokens in query_list[:WARMUP_QUERIES]:
+                search(state, query_clean, query_tokens, k)
+
+            latencies, retrieved = [], []
+            for _ in range(repeat):
+                retrieved = []
+                for query_clean, query_tokens in query_list:
+                    t0 = time.perf_counter_ns()
+                    indices = search(state, query_clean, query_tokens, k)
+                    latencies.append(time.perf_counter_ns() - t0)
+                    retrieved.append(indices)
+
+            engine_result = latency_summary(latencies)
+            if workers > 1:
+                engine_result["qps_workers"] = _multi_worker_qps(index_path, engine, query_list, k, workers)
+            engine_result.update(evaluator.summary(_run_rows(retrieved, k), cutoffs=(k,)))
+            result["engines"][engine] = engine_result
+
+    # Búsqueda por lotes: todas las consultas en una sola multiplicación dispersa
+    _, tfidf_seconds = batch_search_tfidf(
+        state["tfidf"], index.tfidf_vectorizer, [q[0] for q in query_list], k=k)
+    _, bm25_seconds = batch_search_bm25(index.bm25_model, [q[1] for q in query_list], k=k)
+    for name, seconds in (("tfidf", tfidf_seconds), ("bm25", bm25_seconds)):
+        result["batch"][name] = {"seconds": seconds, "qps": len(query_list) / seconds if seconds > 0 else None}
+    if champion_sizes:
+        result["tiers"] = benchmark_tiers(state, query_list, evaluator, champion_sizes, k)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    if instrumentation.is_enabled():
+        result["stages"] = instrumentation.report()
+    return result
+
+def _git_commit():
+    """
+    Retorna el commit actual del repositorio, o None si no se puede obtener.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _parse_sizes(text):
+    """
+    Convierte '5000,20000,all' en [5000, 20000, None].
+    """
+    return [None if size.strip().lower() in ("all", "0") else int(size) for size in text.split(",")]
+
+def run_benchmark(sizes, engines=None, k=BENCHMARK_K, workers=BENCHMARK_WORKERS, repeat=1, query_limit=None,
+                  jobs=None, output=BENCHMARK_OUTPUT, champion_sizes=()):
+    """
+    Ejecuta la suite completa y guarda los resultados en JSON.
+
+    Parámetros:
+        sizes (list[int | None]): Tamaños de corpus a medir (None = corpus completo).
+        engines (list[str] | None): Motores a medir. None mide todos.
+        k (int): Número de resultados por consulta.
+        workers (int): Procesos para el QPS con varios procesos.
+        repeat (int): Repeticiones del conjunto de consultas.
+        query_limit (int | None): Número máximo de consultas (None = todas).
+        jobs (int | None): Procesos para el preprocesamiento del corpus.
+        output (str | None): Archivo JSON de salida. None no escribe nada.
+        champion_sizes (list[int]): Tamaños r de las listas de campeones a medir.
+
+    Retorna:
+        dict: Resultados con metadatos del entorno y una entrada por tamaño de corpus.
+    """
+    engines = list(ENGINES) if engines is None else engines
+    raw_queries, qrels = load_beir_queries_and_qrels(limit=query_limit)
+    queries = {qid: preprocess_both(text) for qid, text in raw_queries.items()}
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {"sizes": sizes, "engines": engines, "k": k, "workers": workers, "repeat": repeat,
+                   "query_limit": query_limit, "champion_sizes": list(champion_sizes)},
+        "results": [],
+    }
+    for size in sizes:
+        print(f"Midiendo corpus de {size or 'todos los'} documentos...")
+        report["results"].append(benchmark_size(
+            size, queries, qrels, engines, k, workers, repeat, jobs, champion_sizes))
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def summary_frame(report):
+    """
+    Resume un reporte en un DataFrame con una fila por tamaño de corpus y motor.
+    """
+    rows = []
+    for result in report["results"]:
+        for engine, metrics in result["engines"].items():
+            rows.append({"docs": result["num_docs"], "engine": engine, "build_s": result["build_seconds"],
+                         "index_MB": result["index_bytes"]["total"] / 2 ** 20, **metrics})
+    return pd.DataFrame(rows)
+
+def tiers_frame(report):
+    """
+    Resume las mediciones de las listas de campeones con una fila por tamaño de corpus, r y modelo.
+    """
+    rows = []
+    for result in report["results"]:
+        for size, models in result.get("tiers", {}).items():
+            for model, metrics in models.items():
+                metrics = {name: value for name, value in metrics.items() if name != "tier_only"}
+                rows.append({"docs": result["num_docs"], "r": int(size), "model": model, **metrics})
+    return pd.DataFrame(rows)
+
+def main(argv=None):
+    """
+    Punto de entrada de línea de comandos.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark de los motores de recuperación.")
+    parser.add_argument("--sizes", default=BENCHMARK_SIZES,
+                        help="Tamaños de corpus separados por comas ('all' = corpus completo).")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Motores separados por comas.")
+    parser.add_argument("--k", type=int, default=BENCHMARK_K, help="Resultados por consulta.")
+    parser.add_argument("--workers", type=int, default=BENCHMARK_WORKERS, help="Procesos para el QPS paralelo.")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeticiones del conjunto de consultas.")
+    parser.add_argument("--queries", type=int, default=None, help="Número máximo de consultas.")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos para el preprocesamiento.")
+    parser.add_argument("--output", default=BENCHMARK_OUTPUT, help="Archivo JSON de salida.")
+    parser.add_argument("--champions", default="",
+                        help="Tamaños r de las listas de campeones a medir, separados por comas.")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Registra tiempos y contadores por etapa (agrega costo a las latencias).")
+    parser.add_argument("--profile", default=None, metavar="ARCHIVO",
+                        help="Perfila la ejecución con cProfile y guarda el .prof en ARCHIVO.")
+    args = parser.parse_args(argv)
+
+    engines = [engine.strip() for engine in args.engines.split(",")]
+    unknown = [engine for engine in engines if engine not in ENGINES]
+    if unknown:
+        parser.error(f"Motores desconocidos: {', '.join(unknown)}")
+
+    if args.instrument:
+        instrumentation.enable()
+    with instrumentation.profile(args.profile) if args.profile else nullcontext():
+        report = run_benchmark(_parse_sizes(args.sizes), engines, k=args.k, workers=args.workers,
+                               repeat=args.repeat, query_limit=args.queries, jobs=args.jobs, output=args.output,
+                               champion_sizes=[int(size) for size in args.champions.split(",") if size.strip()])
+    print(summary_frame(report).to_string(index=False, float_format="{:.4f}".format))
+    tiers = tiers_frame(report)
+    if len(tiers):
+        print()
+        print(tiers.to_string(index=False, float_format="{:.4f}".format))
+    print(f"\nResultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    main()
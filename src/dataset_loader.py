@@ -1,47 +1,259 @@
-import ir_datasets
 import os
 import pickle
+import numpy as np
+from src.instrumentation import count, stage, timed
 
 DATASET_NAME = "beir/cqadupstack/gaming"
 CACHE_FILE = "src/beir_gaming_cached.pkl"
 CACHE_FILE_QUERIES_QRELS = "src/beir_queries_qrels_cached.pkl"
+# Corpus en formato Arrow IPC, escrito en lotes (record batches) para leerlo por partes
+CORPUS_FILE = "src/beir_gaming_corpus.arrow"
+# Número de documentos por lote, tanto al escribir el corpus como al leerlo
+STORE_BATCH_SIZE = 4096
 
-def load_beir_documents(limit=None):
+# ir_datasets y pyarrow se importan al usarse: abrir un índice ya construido no debe pagar
+# su importación, y ir_datasets solo hace falta si no existen los cachés locales
+
+def _corpus_schema():
     """
-    Carga documentos del dataset 'beir/cqadupstack/gaming' usando caché local.
+    Retorna:
+        pa.Schema: Esquema del corpus Arrow (doc_id, text).
+    """
+    import pyarrow as pa
+    return pa.schema([("doc_id", pa.string()), ("text", pa.string())])
 
-    Parámetros:
-        limit (int | None): Número máximo de documentos a retornar. Si es None, retorna todos.
+def _iter_source_documents():
+    """
+    Recorre los documentos de origen: el caché pickle heredado si existe, o ir_datasets.
 
     Retorna:
-        tuple:
-            - list[str]: Lista de textos de documentos.
-            - list[str]: Lista de IDs de documentos.
+        Iterator[tuple[str, str]]: Pares (ID del documento, texto).
     """
-    doc_texts = None
-    doc_ids = None
-
-    # Verificar si existe la versión cacheada
     if os.path.exists(CACHE_FILE):
-        print("Loading dataset from cache...")
+        print("Converting pickled cache to the columnar corpus store...")
         with open(CACHE_FILE, "rb") as f:
             doc_texts, doc_ids = pickle.load(f)
-    
-    # Si no hay caché, cargar desde ir_datasets y guardar en caché
-    if doc_texts is None or doc_ids is None:
+        yield from zip(doc_ids, doc_texts)
+    else:
+        import ir_datasets
         print("Loading dataset from ir_datasets and caching...")
         dataset = ir_datasets.load(DATASET_NAME)
-        doc_texts = []
-        doc_ids = []
         for doc in dataset.docs_iter():
-            doc_ids.append(doc.doc_id)
-            doc_texts.append(doc.text)
-        with open(CACHE_FILE, "wb") as f:
-            pickle.dump((doc_texts, doc_ids), f)
+            yield doc.doc_id, doc.text
 
-    # Aplicar límite si es necesario
-    if limit is not None:
-        return doc_texts[:limit], doc_ids[:limit]
+def build_corpus_store(path=CORPUS_FILE, batch_size=STORE_BATCH_SIZE):
+    """
+    Escribe el corpus en un archivo Arrow IPC por lotes, sin mantenerlo completo en memoria.
+
+    El archivo se escribe con un nombre temporal y se renombra al terminar, de modo que
+    una escritura interrumpida nunca deja un corpus incompleto.
+
+    Parámetros:
+        path (str): Ruta del archivo de destino.
+        batch_size (int): Número de documentos por lote.
+
+    Retorna:
+        int: Número de documentos escritos.
+    """
+    import pyarrow as pa
+    schema = _corpus_schema()
+    tmp_path = path + ".tmp"
+    total = 0
+    doc_ids, doc_texts = [], []
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for doc_id, text in _iter_source_documents():
+            doc_ids.append(doc_id)
+            doc_texts.append(text)
+            if len(doc_ids) == batch_size:
+                writer.write_batch(pa.record_batch([doc_ids, doc_texts], schema=schema))
+                total += len(doc_ids)
+                doc_ids, doc_texts = [], []
+        if doc_ids:
+            writer.write_batch(pa.record_batch([doc_ids, doc_texts], schema=schema))
+            total += len(doc_ids)
+    os.replace(tmp_path, path)
+    return total
+
+def iter_beir_documents(batch_size=STORE_BATCH_SIZE, limit=None, offset=0):
+    """
+    Genera los documentos del dataset por lotes desde el corpus Arrow mapeado en memoria.
+
+    Solo se decodifican los lotes que caen dentro de [offset, offset + limit); los lotes
+    anteriores se saltan usando únicamente su número de filas, por lo que la memoria usada
+    no depende del tamaño del corpus.
+
+    Parámetros:
+        batch_size (int): Número máximo de documentos por lote generado.
+        limit (int | None): Número máximo de documentos a generar. Si es None, genera todos.
+        offset (int): Número de documentos a saltar desde el inicio.
+
+    Retorna:
+        Iterator[tuple[list[str], list[str]]]: Lotes (textos, IDs de documentos).
+    """
+    import pyarrow as pa
+    if not os.path.exists(CORPUS_FILE):
+        build_corpus_store(CORPUS_FILE)
+
+    remaining = limit
+    with pa.memory_map(CORPUS_FILE, "r") as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            if remaining is not None and remaining <= 0:
+                break
+            batch = reader.get_batch(i)
+            if offset >= batch.num_rows:
+                offset -= batch.num_rows
+                continue
+
+            # Recortar el lote al rango pedido antes de convertirlo a objetos Python
+            length = batch.num_rows - offset
+            if remaining is not None:
+                length = min(length, remaining)
+            batch = batch.slice(offset, length)
+            offset = 0
+            if remaining is not None:
+                remaining -= length
+
+            for start in range(0, batch.num_rows, batch_size):
+                chunk = batch.slice(start, batch_size)
+                with stage("corpus.decode"):
+                    texts, doc_ids = chunk.column("text").to_pylist(), chunk.column("doc_id").to_pylist()
+                count("corpus.documents_read", len(texts))
+                yield texts, doc_ids
+
+class CorpusStore:
+    """
+    Almacén columnar de solo lectura del corpus sobre el archivo Arrow mapeado en memoria.
+
+    Los textos y los IDs se guardan una sola vez (buffers Arrow con offsets) y se leen bajo
+    demanda por número de fila, sin copiar el corpus a listas de Python; varios procesos que
+    abren el mismo archivo comparten la caché de páginas del sistema operativo.
+    """
+
+    def __init__(self, path=CORPUS_FILE):
+        import pyarrow as pa
+        self.path = path
+        self._source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(self._source).read_all()
+        self._texts = table.column("text")
+        self._ids = table.column("doc_id")
+        self._chunk_starts = np.cumsum([0] + [len(chunk) for chunk in self._texts.chunks])
+
+    def __len__(self):
+        return int(self._chunk_starts[-1])
+
+    def _locate(self, row):
+        """
+        Retorna el lote (chunk) y la posición dentro de él de una fila del corpus.
+        """
+        if not 0 <= row < len(self):
+            raise IndexError(f"Fila fuera de rango: {row}")
+        chunk = int(np.searchsorted(self._chunk_starts, row, side="right")) - 1
+        return chunk, row - int(self._chunk_starts[chunk])
+
+    def __getitem__(self, row):
+        return self.text(row)
+
+    @timed("corpus.fetch")
+    def text(self, row):
+        """
+        Parámetros:
+            row (int): Fila del documento.
+
+        Retorna:
+            str: Texto del documento.
+        """
+        chunk, offset = self._locate(int(row))
+        return self._texts.chunks[chunk][offset].as_py()
+
+    def doc_id(self, row):
+        """
+        Parámetros:
+            row (int): Fila del documento.
+
+        Retorna:
+            str: ID del documento.
+        """
+        chunk, offset = self._locate(int(row))
+        return self._ids.chunks[chunk][offset].as_py()
+
+    def snippet(self, row, length=200):
+        """
+        Retorna los primeros caracteres del texto de un documento.
+
+        Parámetros:
+            row (int): Fila del documento.
+            length (int): Número máximo de caracteres.
+
+        Retorna:
+            str: Fragmento del texto.
+        """
+        return self.text(row)[:length]
+
+    @timed("corpus.fetch_many")
+    def texts(self, rows):
+        """
+        Parámetros:
+            rows (Iterable[int]): Filas de los documentos.
+
+        Retorna:
+            list[str]: Textos de los documentos, en el mismo orden.
+        """
+        return self._texts.take(np.asarray(rows, dtype=np.int64)).to_pylist()
+
+    def doc_ids(self, rows=None):
+        """
+        Parámetros:
+            rows (Iterable[int] | None): Filas de los documentos. Si es None, todas.
+
+        Retorna:
+            list[str]: IDs de los documentos, en el mismo orden.
+        """
+        if rows is None:
+            return self._ids.to_pylist()
+        return self._ids.take(np.asarray(rows, dtype=np.int64)).to_pylist()
+
+    def close(self):
+        """
+        Libera el mapeo en memoria del archivo.
+        """
+        self._texts = self._ids = None
+        self._source.close()
+
+def open_corpus_store(path=CORPUS_FILE):
+    """
+    Abre el almacén columnar del corpus, creándolo desde el dataset si todavía no existe.
+
+    Parámetros:
+        path (str): Ruta del archivo Arrow del corpus.
+
+    Retorna:
+        CorpusStore: Almacén listo para leer.
+    """
+    if not os.path.exists(path):
+        build_corpus_store(path)
+    return CorpusStore(path)
+
+def load_beir_documents(limit=None):
+    """
+    Carga documentos del dataset 'beir/cqadupstack/gaming' desde el corpus Arrow local.
+
+    Parámetros:
+        limit (int | None): Número máximo de documentos a retornar. Si es None, retorna todos.
+
+    Retorna:
+        tuple:
+            - list[str]: Lista de textos de documentos.
+            - list[str]: Lista de IDs de documentos.
+    """
+    doc_texts = []
+    doc_ids = []
+
+    # Leer el corpus por lotes; el límite se aplica antes de materializar los textos
+    print("Loading dataset from corpus store...")
+    for batch_texts, batch_ids in iter_beir_documents(limit=limit):
+        doc_texts.extend(batch_texts)
+        doc_ids.extend(batch_ids)
     return doc_texts, doc_ids
 
 def load_beir_queries_and_qrels(limit=None):
@@ -62,6 +274,7 @@ def load_beir_queries_and_qrels(limit=None):
         with open(CACHE_FILE_QUERIES_QRELS, "rb") as f:
             queries, qrels = pickle.load(f)
     else:
+        import ir_datasets
         print("Loading queries and qrels from ir_datasets and caching...")
         dataset = ir_datasets.load(DATASET_NAME)
 
@@ -0,0 +1,207 @@
+from collections.abc import Mapping
+import numpy as np
+
+# Cortes evaluados por defecto
+EVAL_CUTOFFS = (5, 10)
+
+class RunEvaluator:
+    """
+    Evaluación vectorizada de corridas completas (todas las consultas a la vez).
+
+    Los qrels se convierten una sola vez a claves enteras (posición de la consulta, fila del
+    documento); cada corrida se evalúa luego como una matriz consultas x posiciones con
+    operaciones NumPy, por lo que evaluar muchas configuraciones sobre las mismas consultas
+    cuesta solo una búsqueda ordenada y algunas sumas acumuladas.
+
+    Parámetros:
+        qrels (dict[str, list[str] | dict[str, int]]): Documentos relevantes por consulta; como
+            lista (relevancia binaria) o como {doc_id: relevancia} (relevancia graduada para nDCG).
+            Los documentos con relevancia <= 0 se ignoran.
+        query_ids (list[str]): Consultas a evaluar, en el orden de las filas de las corridas.
+        document_ids (list[str]): IDs de los documentos, en el orden de las filas del índice.
+
+    Atributos:
+        num_relevant (np.ndarray): Número de documentos relevantes de cada consulta.
+    """
+
+    def __init__(self, qrels, query_ids, document_ids):
+        self.query_ids = list(query_ids)
+        self.num_docs = len(document_ids)
+        self._doc_index = {doc_id: row for row, doc_id in enumerate(document_ids)}
+
+        num_queries = len(self.query_ids)
+        keys, key_gains = [], []
+        ideal_gains = []
+        self.num_relevant = np.zeros(num_queries, dtype=np.int64)
+        for position, query_id in enumerate(self.query_ids):
+            judged = qrels.get(query_id, ())
+            items = judged.items() if isinstance(judged, Mapping) else ((doc_id, 1) for doc_id in set(judged))
+            gains = []
+            for doc_id, gain in items:
+                if gain <= 0:
+                    continue
+                gains.append(gain)
+                # Los relevantes que no están en el índice cuentan para el recall, pero nunca se recuperan
+                row = self._doc_index.get(doc_id)
+                if row is not None:
+                    keys.append(position * self.num_docs + row)
+                    key_gains.append(gain)
+            self.num_relevant[position] = len(gains)
+            ideal_gains.append(sorted(gains, reverse=True))
+
+        order = np.argsort(np.asarray(keys, dtype=np.int64), kind="stable")
+        self._keys = np.asarray(keys, dtype=np.int64)[order]
+        self._key_gains = np.asarray(key_gains, dtype=np.float64)[order]
+
+        # DCG ideal acumulado por posición (consultas x máximo de relevantes)
+        max_relevant = int(self.num_relevant.max()) if num_queries else 0
+        ideal = np.zeros((num_queries, max_relevant), dtype=np.float64)
+        for position, gains in enumerate(ideal_gains):
+            ideal[position, :len(gains)] = gains
+        self._ideal_dcg = np.cumsum(ideal / np.log2(np.arange(2, max_relevant + 2)), axis=1)
+
+    def encode_run(self, run):
+        """
+        Convierte una corrida {query_id: [doc_id, ...]} en la matriz de filas que usa evaluate.
+
+        Parámetros:
+            run (dict[str, list[str]]): Documentos recuperados por consulta, en orden de ranking.
+
+        Retorna:
+            np.ndarray: Filas de los documentos (consultas x profundidad), -1 donde no hay documento.
+        """
+        depth = max((len(docs) for docs in run.values()), default=0)
+        rows = np.full((len(self.query_ids), depth), -1, dtype=np.int64)
+        for position, query_id in enumerate(self.query_ids):
+            docs = [self._doc_index.get(doc_id, -1) for doc_id in run.get(query_id, ())]
+            rows[position, :len(docs)] = docs
+        return rows
+
+    def gains(self, rows):
+        """
+        Relevancia de cada documento recuperado.
+
+        Parámetros:
+            rows (np.ndarray): Filas recuperadas (consultas x profundidad), -1 donde no hay documento.
+
+        Retorna:
+            np.ndarray: Ganancia de cada posición (0 si el documento no es relevante).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        keys = np.arange(rows.shape[0], dtype=np.int64)[:, None] * self.num_docs + rows
+        positions = np.searchsorted(self._keys, keys)
+        positions[positions == len(self._keys)] = 0
+        found = (rows >= 0) & (self._keys[positions] == keys) if len(self._keys) else np.zeros(rows.shape, bool)
+        return np.where(found, self._key_gains[positions] if len(self._keys) else 0.0, 0.0)
+
+    def evaluate(self, rows, cutoffs=EVAL_CUTOFFS):
+        """
+        Calcula las métricas de cada consulta para todos los cortes en una sola pasada.
+
+        Las definiciones coinciden con perf_metrics: P@k divide por k, R@k por el número de
+        relevantes, y AP (y RR) se calculan sobre toda la profundidad de la corrida.
+
+        Parámetros:
+            rows (np.ndarray): Filas recuperadas (consultas x profundidad), por ejemplo los
+                               índices de batch_search_tfidf / batch_search_bm25.
+            cutoffs (Iterable[int]): Cortes k para P@k, R@k y nDCG@k.
+
+        Retorna:
+            pd.DataFrame: Una fila por consulta (indexada por query_id) con las columnas 'ap',
+                          'rr' y 'precision@k', 'recall@k', 'ndcg@k' por cada corte.
+        """
+        gains = self.gains(rows)
+        num_queries, depth = gains.shape
+        relevant = gains > 0
+        hits = np.cumsum(relevant, axis=1)
+        ranks = np.arange(1, depth + 1)
+        num_relevant = self.num_relevant.astype(np.float64)
+        has_relevant = num_relevant > 0
+
+        metrics = {}
+        ap_sum = np.where(relevant, hits / ranks, 0.0).sum(axis=1)
+        metrics["ap"] = np.divide(ap_sum, num_relevant, out=np.zeros(num_queries), where=has_relevant)
+        first = relevant.argmax(axis=1) if depth else np.zeros(num_queries, dtype=np.int64)
+        metrics["rr"] = np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0)
+
+        dcg = np.cumsum(gains / np.log2(ranks + 1), axis=1)
+        for k in cutoffs:
+            depth_k = min(k, depth)
+            hits_k = hits[:, depth_k - 1] if depth_k else np.zeros(num_queries)
+            metrics[f"precision@{k}"] = hits_k / k
+            metrics[f"recall@{k}"] = np.divide(hits_k, num_relevant, out=np.zeros(num_queries), where=has_relevant)
+            dcg_k = dcg[:, depth_k - 1] if depth_k else np.zeros(num_queries)
+            ideal_k = min(k, self._ideal_dcg.shape[1])
+            idcg_k = self._ideal_dcg[:, ideal_k - 1] if ideal_k else np.zeros(num_queries)
+            metrics[f"ndcg@{k}"] = np.divide(dcg_k, idcg_k, out=np.zeros(num_queries), where=idcg_k > 0)
+        # pandas se importa solo al construir la tabla (la evaluación no lo necesita)
+        import pandas as pd
+        return pd.DataFrame(metrics, index=pd.Index(self.query_ids, name="query_id"))
+
+    def summary(self, rows, cutoffs=EVAL_CUTOFFS):
+        """
+        Promedia las métricas de todas las consultas.
+
+        Parámetros:
+            rows (np.ndarray): Filas recuperadas (consultas x profundidad).
+            cutoffs (Iterable[int]): Cortes k.
+
+        Retorna:
+            dict: 'map', 'mrr' y 'precision@k', 'recall@k', 'ndcg@k' promedio por cada corte.
+        """
+        return summarize(self.evaluate(rows, cutoffs))
+
+def summarize(per_query):
+    """
+    Promedia una tabla de métricas por consulta (MAP y MRR son los promedios de AP y RR).
+
+    Parámetros:
+        per_query (pd.DataFrame): Resultado de RunEvaluator.evaluate.
+
+    Retorna:
+        dict: Promedio de cada métrica sobre las consultas.
+    """
+    means = per_query.mean() if len(per_query) else per_query.sum()
+    return {{"ap": "map", "rr": "mrr"}.get(name, name): float(value) for name, value in means.items()}
+
+def evaluate_run(run, qrels, cutoffs=EVAL_CUTOFFS, per_query=False):
+    """
+    Evalúa una corrida {query_id: [doc_id, ...]} contra los qrels.
+
+    Para evaluar varias corridas sobre las mismas consultas conviene crear un RunEvaluator una
+    sola vez y pasarle directamente las filas de la búsqueda por lotes.
+
+    Parámetros:
+        run (dict[str, list[str]]): Documentos recuperados por consulta, en orden de ranking.
+        qrels (dict[str, list[str] | dict[str, int]]): Documentos relevantes por consulta.
+        cutoffs (Iterable[int]): Cortes k.
+        per_query (bool): Si es True, retorna la tabla por consulta en lugar del promedio.
+
+    Retorna:
+        dict | pd.DataFrame: Métricas promedio, o la tabla de métricas por consulta.
+    """
+    document_ids = list(dict.fromkeys(doc_id for docs in run.values() for doc_id in docs))
+    evaluator = RunEvaluator(qrels, list(run), document_ids)
+    results = evaluator.evaluate(evaluator.encode_run(run), cutoffs)
+    return results if per_query else summarize(results)
+
+def tier_recall(reference_rows, rows):
+    """
+    Fracción del top-k de referencia (búsqueda exacta) que recupera otra corrida, por consulta.
+
+    Sirve para medir la pérdida de un primer nivel aproximado (listas de campeones) frente a la
+    búsqueda sobre las postings completas, sin depender de los qrels.
+
+    Parámetros:
+        reference_rows (np.ndarray): Filas del top-k exacto (consultas x k), -1 donde no hay documento.
+        rows (np.ndarray): Filas de la corrida a comparar (consultas x profundidad).
+
+    Retorna:
+        np.ndarray: Recall de cada consulta (1 si la referencia está vacía).
+    """
+    reference_rows = np.asarray(reference_rows, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    valid = reference_rows >= 0
+    found = ((reference_rows[:, :, None] == rows[:, None, :]).any(axis=2) & valid).sum(axis=1)
+    total = valid.sum(axis=1)
+    return np.divide(found, total, out=np.ones(len(total)), where=total > 0)
@@ -0,0 +1,453 @@
+import threading
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from src.search_engine import build_count_matrix, top_k_indices
+
+# Número de segmentos delta que dispara una fusión con el segmento principal
+MAX_DELTA_SEGMENTS = 4
+
+class _Segment:
+    """
+    Segmento inmutable del índice: conteos de un grupo de documentos agregados juntos.
+
+    Solo la máscara de documentos vivos cambia, y siempre se reemplaza por una copia
+    (copy-on-write), de modo que las instantáneas que ya la referencian no se alteran.
+
+    Atributos:
+        counts (csr_matrix): Conteos (documentos del segmento x términos conocidos al crearlo).
+        postings (csc_matrix): Los mismos conteos en formato CSC para recorrer postings.
+        doc_ids (list[str]): IDs de los documentos del segmento.
+        doc_len (np.ndarray): Longitud en tokens de cada documento.
+        live (np.ndarray): Máscara booleana de documentos no eliminados.
+    """
+
+    def __init__(self, counts, doc_ids):
+        self.counts = counts
+        self.postings = counts.tocsc()
+        self.postings.sort_indices()
+        self.doc_ids = list(doc_ids)
+        self.doc_len = np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+        self.live = np.ones(counts.shape[0], dtype=bool)
+
+    def column(self, term_id):
+        """
+        Retorna la lista de postings (filas y frecuencias) de un término dentro del segmento.
+        """
+        if term_id >= self.postings.shape[1]:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=self.postings.dtype)
+        start, end = self.postings.indptr[term_id], self.postings.indptr[term_id + 1]
+        return self.postings.indices[start:end], self.postings.data[start:end]
+
+class IndexSnapshot:
+    """
+    Vista consistente e inmutable del índice incremental en un instante dado.
+
+    Las estadísticas globales (idf, longitud promedio) se derivan de forma perezosa y se
+    memorizan, por lo que todas las consultas sobre la misma instantánea las comparten.
+
+    Atributos:
+        version (int): Versión del índice en la que se tomó la instantánea.
+        num_docs (int): Número de documentos vivos.
+        num_terms (int): Tamaño del vocabulario en la instantánea.
+        avgdl (float): Longitud promedio de los documentos vivos.
+    """
+
+    def __init__(self, version, segments, doc_freq, num_docs, total_len, vocabulary):
+        self.version = version
+        self._segments = segments
+        self._doc_freq = doc_freq
+        self._vocabulary = vocabulary
+        self.num_docs = num_docs
+        self.num_terms = len(doc_freq)
+        self.avgdl = total_len / num_docs if num_docs else 0.0
+        self._bm25_idf = {}
+        self._tfidf_state = None
+
+    def _query_terms(self, query_tokens):
+        """
+        Traduce los tokens de la consulta a columnas y frecuencias, ignorando términos sin documentos vivos.
+        """
+        term_counts = {}
+        for token in query_tokens:
+            idx = self._vocabulary.get(token)
+            if idx is not None and idx < self.num_terms and self._doc_freq[idx] > 0:
+                term_counts[idx] = term_counts.get(idx, 0) + 1
+        return term_counts
+
+    def bm25_idf(self, epsilon=0.25):
+        """
+        idf de BM25Okapi sobre los documentos vivos (con el piso epsilon * idf promedio).
+
+        Parámetros:
+            epsilon (float): Piso para los idf negativos, como fracción del idf promedio.
+
+        Retorna:
+            np.ndarray: idf por término (0 para términos sin documentos vivos).
+        """
+        if epsilon not in self._bm25_idf:
+            present = self._doc_freq > 0
+            df = self._doc_freq[present]
+            idf = np.log(self.num_docs - df + 0.5) - np.log(df + 0.5)
+            average_idf = idf.mean() if len(idf) else 0.0
+            idf[idf < 0] = epsilon * average_idf
+            full_idf = np.zeros(self.num_terms)
+            full_idf[present] = idf
+            self._bm25_idf[epsilon] = full_idf
+        return self._bm25_idf[epsilon]
+
+    def _tfidf(self):
+        """
+        idf suavizado de TfidfVectorizer y norma L2 de cada documento, calculados una vez por instantánea.
+        """
+        if self._tfidf_state is None:
+            idf = np.log((1 + self.num_docs) / (1 + self._doc_freq)) + 1
+            idf[self._doc_freq == 0] = 0.0
+            norms = []
+            for segment, _ in self._segments:
+                seg_idf = idf[:segment.counts.shape[1]]
+                sq = segment.counts.multiply(segment.counts) @ (seg_idf ** 2)
+                norm = np.sqrt(np.asarray(sq, dtype=np.float64).ravel())
+                norm[norm == 0] = 1.0
+                norms.append(norm)
+            self._tfidf_state = (idf, norms)
+        return self._tfidf_state
+
+    def _search(self, term_weights, posting_weight, k):
+        """
+        Recorre los postings de los términos en cada segmento y mezcla los top-k de todos ellos.
+
+        Parámetros:
+            term_weights (dict[int, float]): Peso de cada término de la consulta.
+            posting_weight (Callable): Función (segmento, nro. de segmento, filas, tf, término) -> pesos.
+            k (int): Número de documentos a retornar.
+
+        Retorna:
+            tuple:
+                - list[str]: IDs de los documentos ordenados por puntaje.
+                - np.ndarray: Puntajes correspondientes.
+        """
+        candidates = []
+        for seg_no, (segment, live) in enumerate(self._segments):
+            scores = np.zeros(segment.counts.shape[0])
+            touched = False
+            for term_id, q_weight in term_weights.items():
+                rows, tf = segment.column(term_id)
+                if len(rows):
+                    scores[rows] += q_weight * posting_weight(segment, seg_no, rows, tf, term_id)
+                    touched = True
+            if not touched:
+                continue
+            scores[~live] = -np.inf
+            indices, seg_scores = top_k_indices(scores, k)
+            for row, score in zip(indices.tolist(), seg_scores.tolist()):
+                if score > -np.inf:
+                    candidates.append((-score, seg_no, row))
+
+        candidates.sort()
+        top = candidates[:k]
+        doc_ids = [self._segments[seg_no][0].doc_ids[row] for _, seg_no, row in top]
+        return doc_ids, np.array([-neg for neg, _, _ in top], dtype=np.float64)
+
+    def search_bm25(self, query_tokens, k=5, k1=1.5, b=0.75, epsilon=0.25):
+        """
+        Recupera los k documentos vivos con mayor puntaje BM25 (mismos valores que reconstruir
+        build_bm25_model sobre los documentos vivos).
+
+        Parámetros:
+            query_tokens (list[str]): Consulta tokenizada.
+            k (int): Número de documentos a retornar.
+            k1, b, epsilon (float): Parámetros de BM25.
+
+        Retorna:
+            tuple:
+                - list[str]: IDs de los documentos ordenados por puntaje.
+                - np.ndarray: Puntajes correspondientes.
+        """
+        idf = self.bm25_idf(epsilon)
+        avgdl = self.avgdl
+
+        def posting_weight(segment, seg_no, rows, tf, term_id):
+            tf = tf.astype(np.float64)
+            length_norm = k1 * (1 - b + b * segment.doc_len[rows] / avgdl)
+            return idf[term_id] * (tf * (k1 + 1) / (tf + length_norm))
+
+        return self._search(self._query_terms(query_tokens), posting_weight, k)
+
+    def search_tfidf(self, query_tokens, k=5):
+        """
+        Recupera los k documentos vivos más similares (coseno sobre TF-IDF con idf suavizado y
+        normalización L2, como TfidfVectorizer) usando los lemas de la consulta.
+
+        Parámetros:
+            query_tokens (list[str]): Consulta tokenizada.
+            k (int): Número de documentos a retornar.
+
+        Retorna:
+            tuple:
+                - list[str]: IDs de los documentos ordenados por similitud.
+                - np.ndarray: Similitudes correspondientes.
+        """
+        idf, norms = self._tfidf()
+        term_counts = self._query_terms(query_tokens)
+        query_weights = {t: c * idf[t] for t, c in term_counts.items()}
+        query_norm = np.sqrt(sum(w * w for w in query_weights.values())) or 1.0
+        query_weights = {t: w / query_norm for t, w in query_weights.items()}
+
+        def posting_weight(segment, seg_no, rows, tf, term_id):
+            return tf * idf[term_id] / norms[seg_no][rows]
+
+        return self._search(query_weights, posting_weight, k)
+
+class IncrementalIndex:
+    """
+    Índice invertido incremental basado en segmentos.
+
+    Cada llamada a add_documents crea un segmento delta pequeño; las eliminaciones marcan
+    lápidas (tombstones) en el segmento que contiene al documento. Las frecuencias de documento,
+    el número de documentos vivos y la longitud total se actualizan en cada cambio en tiempo
+    proporcional al cambio, y los segmentos delta se fusionan con el principal en segundo plano.
+    Las consultas trabajan sobre una IndexSnapshot consistente.
+
+    Parámetros:
+        max_delta_segments (int): Número de segmentos delta que dispara una fusión.
+        background_merge (bool): Si es True, las fusiones se ejecutan en un hilo de fondo.
+    """
+
+    def __init__(self, max_delta_segments=MAX_DELTA_SEGMENTS, background_merge=True):
+        self.max_delta_segments = max_delta_segments
+        self.vocabulary = {}
+        self._segments = []
+        self._locations = {}
+        self._doc_freq = np.zeros(0, dtype=np.int64)
+        self._num_docs = 0
+        self._total_len = 0.0
+        self._version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merge_needed = threading.Condition(self._lock)
+        self._closed = False
+        self._merger = None
+        if background_merge:
+            self._merger = threading.Thread(target=self._merge_loop, name="index-merger", daemon=True)
+            self._merger.start()
+
+    def __len__(self):
+        return self._num_docs
+
+    def __contains__(self, doc_id):
+        return doc_id in self._locations
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def num_segments(self):
+        return len(self._segments)
+
+    def _bump(self):
+        """
+        Invalida la instantánea actual (se llama con el candado tomado).
+        """
+        self._version += 1
+        self._snapshot = None
+
+    def _grow_doc_freq(self):
+        if len(self._doc_freq) < len(self.vocabulary):
+            doc_freq = np.zeros(len(self.vocabulary), dtype=np.int64)
+            doc_freq[:len(self._doc_freq)] = self._doc_freq
+            self._doc_freq = doc_freq
+
+    def _delete_locked(self, doc_ids):
+        """
+        Marca lápidas y descuenta las estadísticas de los documentos dados (con el candado tomado).
+        """
+        by_segment = {}
+        for doc_id in doc_ids:
+            location = self._locations.pop(doc_id, None)
+            if location is not None:
+                by_segment.setdefault(id(location[0]), (location[0], []))[1].append(location[1])
+        if not by_segment:
+            return 0
+
+        doc_freq = self._doc_freq.copy()
+        deleted = 0
+        for segment, rows in by_segment.values():
+            rows = np.asarray(rows, dtype=np.int64)
+            removed = segment.counts[rows]
+            doc_freq[:removed.shape[1]] -= np.bincount(removed.indices, minlength=removed.shape[1])
+            self._total_len -= segment.doc_len[rows].sum()
+            live = segment.live.copy()
+            live[rows] = False
+            segment.live = live
+            deleted += len(rows)
+        self._doc_freq = doc_freq
+        self._num_docs -= deleted
+        return deleted
+
+    def add_documents(self, token_docs, doc_ids):
+        """
+        Agrega documentos tokenizados como un nuevo segmento delta. Si un ID ya existe,
+        la versión anterior se elimina (actualización).
+
+        Parámetros:
+            token_docs (list[list[str]]): Documentos tokenizados.
+            doc_ids (list[str]): IDs de los documentos.
+        """
+        # Validar antes de modificar cualquier estado: un lote inválido no deja rastros
+        token_docs = list(token_docs)
+        doc_ids = list(doc_ids)
+        if len(token_docs) != len(doc_ids):
+            raise ValueError("token_docs y doc_ids deben tener la misma longitud.")
+        if len(set(doc_ids)) != len(doc_ids):
+            raise ValueError("Los IDs de documentos agregados en un mismo lote deben ser únicos.")
+        if not doc_ids:
+            return
+
+        with self._lock:
+            # Primero se construye el segmento nuevo; si falla, se quitan los términos que alcanzó
+            # a agregar al vocabulario (quedan al final, en orden de inserción)
+            num_terms = len(self.vocabulary)
+            try:
+                counts, _ = build_count_matrix(token_docs, vocabulary=self.vocabulary, extend=True)
+                segment = _Segment(csr_matrix(counts, shape=(len(doc_ids), len(self.vocabulary))), doc_ids)
+            except BaseException:
+                while len(self.vocabulary) > num_terms:
+                    self.vocabulary.popitem()
+                raise
+
+            # Solo entonces se eliminan las versiones anteriores de los IDs actualizados
+            self._delete_locked(doc_ids)
+            self._grow_doc_freq()
+            doc_freq = self._doc_freq.copy()
+            doc_freq[:segment.counts.shape[1]] += np.bincount(segment.counts.indices, minlength=segment.counts.shape[1])
+            self._doc_freq = doc_freq
+            self._num_docs += len(doc_ids)
+            self._total_len += segment.doc_len.sum()
+
+            self._segments.append(segment)
+            for row, doc_id in enumerate(doc_ids):
+                self._locations[doc_id] = (segment, row)
+            self._bump()
+            if len(self._segments) - 1 > self.max_delta_segments:
+                self._merge_needed.notify()
+
+    def delete_documents(self, doc_ids):
+        """
+        Elimina documentos por ID mediante lápidas; los IDs desconocidos se ignoran.
+
+        Parámetros:
+            doc_ids (list[str]): IDs de los documentos a eliminar.
+
+        Retorna:
+            int: Número de documentos eliminados.
+        """
+        with self._lock:
+            deleted = self._delete_locked(doc_ids)
+            if deleted:
+                self._bump()
+            return deleted
+
+    def update_document(self, doc_id, tokens):
+        """
+        Reemplaza el contenido de un documento (eliminación más inserción).
+
+        Parámetros:
+            doc_id (str): ID del documento.
+            tokens (list[str]): Nuevo contenido tokenizado.
+        """
+        self.add_documents([tokens], [doc_id])
+
+    def snapshot(self):
+        """
+        Retorna una instantánea consistente del índice; se reutiliza mientras no haya cambios.
+
+        Retorna:
+            IndexSnapshot: Vista inmutable del índice.
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._grow_doc_freq()
+                self._snapshot = IndexSnapshot(
+                    self._version,
+                    tuple((segment, segment.live) for segment in self._segments),
+                    self._doc_freq,
+                    self._num_docs,
+                    self._total_len,
+                    self.vocabulary,
+                )
+            return self._snapshot
+
+    def search_bm25(self, query_tokens, k=5, **params):
+        """
+        Atajo de snapshot().search_bm25.
+        """
+        return self.snapshot().search_bm25(query_tokens, k=k, **params)
+
+    def search_tfidf(self, query_tokens, k=5):
+        """
+        Atajo de snapshot().search_tfidf.
+        """
+        return self.snapshot().search_tfidf(query_tokens, k=k)
+
+    def merge(self):
+        """
+        Fusiona todos los segmentos actuales en uno solo, descartando los documentos eliminados.
+
+        La fusión se construye sin bloquear consultas ni escrituras; al terminar, el nuevo
+        segmento reemplaza a los fusionados y conserva las eliminaciones ocurridas mientras tanto.
+
+        Retorna:
+            bool: True si se realizó una fusión.
+        """
+        with self._merge_lock:
+            with self._lock:
+                captured = [(segment, segment.live) for segment in self._segments]
+                num_terms = len(self.vocabulary)
+            if len(captured) <= 1 and all(live.all() for _, live in captured):
+                return False
+
+            # Construir el segmento fusionado fuera del candado
+            blocks, doc_ids, sources = [], [], []
+            for segment, live in captured:
+                rows = np.flatnonzero(live)
+                block = segment.counts[rows]
+                blocks.append(csr_matrix((block.data, block.indices, block.indptr), shape=(len(rows), num_terms)))
+                doc_ids.extend(segment.doc_ids[row] for row in rows.tolist())
+                sources.append((segment, rows))
+            merged = _Segment(csr_matrix(vstack(blocks, format="csr")), doc_ids)
+
+            with self._lock:
+                # Reaplicar las eliminaciones ocurridas durante la fusión
+                merged.live = np.concatenate([segment.live[rows] for segment, rows in sources])
+                merged_ids = set(map(id, (segment for segment, _ in captured)))
+                for row, doc_id in enumerate(doc_ids):
+                    location = self._locations.get(doc_id)
+                    if location is not None and id(location[0]) in merged_ids:
+                        self._locations[doc_id] = (merged, row)
+                self._segments = [merged] + self._segments[len(captured):]
+                self._bump()
+            return True
+
+    def _merge_loop(self):
+        """
+        Hilo de fondo: espera a que se acumulen segmentos delta y los fusiona.
+        """
+        while True:
+            with self._lock:
+                while not self._closed and len(self._segments) - 1 <= self.max_delta_segments:
+                    self._merge_needed.wait()
+                if self._closed:
+                    return
+            self.merge()
+
+    def close(self):
+        """
+        Detiene el hilo de fusión en segundo plano.
+        """
+        with self._lock:
+            self._closed = True
+            self._merge_needed.notify_all()
+        if self._merger is not None:
+            self._merger.join()
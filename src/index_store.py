@@ -0,0 +1,316 @@
+import json
+import os
+import uuid
+import numpy as np
+from scipy.sparse import csc_matrix
+from src.search_engine import (
+    ChampionTier,
+    CountMatrixBuilder,
+    SparseBM25,
+    SparseTfidf,
+    TfidfQueryVectorizer,
+    build_tf_idf_from_counts,
+)
+
+INDEX_DIR = "src/index_cache"
+INDEX_FORMAT = "proyecto-ri-index"
+INDEX_VERSION = 3
+MANIFEST_FILE = "manifest.json"
+# Campeones por término del primer nivel (listas de campeones) al construir el índice
+CHAMPION_SIZE = 256
+
+class SearchIndex:
+    """
+    Índice de búsqueda completo: matriz TF-IDF con su vectorizador, modelo BM25 e IDs de documentos.
+
+    Atributos:
+        tfidf_matrix (sparse matrix): Matriz TF-IDF (documentos x términos); al cargarla de disco
+                                      son las mismas postings CSC de tfidf_engine.
+        tfidf_engine (SparseTfidf): Motor TF-IDF sobre las postings del índice (ver la propiedad).
+        tfidf_vectorizer (TfidfVectorizer | TfidfQueryVectorizer): Vectorizador de consultas.
+        bm25_model (SparseBM25): Modelo BM25.
+        document_ids (list[str]): IDs de los documentos, en el orden de las filas.
+        manifest (dict | None): Manifiesto con el que se cargó el índice desde disco.
+        version (str): Identificador de la construcción del índice (se guarda en el manifiesto).
+        tfidf_tier (ChampionTier | None): Listas de campeones de las postings TF-IDF.
+        bm25_tier (ChampionTier | None): Listas de campeones de los pesos BM25.
+    """
+
+    def __init__(self, tfidf_matrix, tfidf_vectorizer, bm25_model, document_ids, manifest=None,
+                 tfidf_engine=None):
+        self.tfidf_matrix = tfidf_matrix
+        self._tfidf_engine = tfidf_engine
+        self.tfidf_vectorizer = tfidf_vectorizer
+        self.bm25_model = bm25_model
+        self.document_ids = document_ids
+        self.manifest = manifest
+        # Identificador de la construcción; cambia cada vez que el índice se reconstruye
+        self.version = manifest["build_id"] if manifest and "build_id" in manifest else uuid.uuid4().hex
+        self.tfidf_tier = None
+        self.bm25_tier = None
+
+    @property
+    def tfidf_engine(self):
+        """
+        Motor TF-IDF (postings CSC y cotas MaxScore) compartido por todos los consumidores del índice.
+
+        Un índice cargado de disco lo trae armado sobre los arreglos guardados, sin copias; en uno
+        recién construido se arma la primera vez que se pide (las filas ya están normalizadas).
+        """
+        if self._tfidf_engine is None:
+            self._tfidf_engine = SparseTfidf(self.tfidf_matrix, normalize=False)
+        return self._tfidf_engine
+
+def add_champion_tiers(index, size=CHAMPION_SIZE):
+    """
+    Construye el primer nivel (listas de campeones) de TF-IDF y BM25 de un índice.
+
+    Parámetros:
+        index (SearchIndex): Índice construido o cargado de disco.
+        size (int): Número de campeones por término; a mayor tamaño, más consultas se resuelven
+                    sin recurrir a las postings completas, a costa de un primer nivel más grande.
+
+    Retorna:
+        SearchIndex: El mismo índice, con tfidf_tier y bm25_tier asignados.
+    """
+    index.tfidf_tier = ChampionTier(index.tfidf_engine.postings, size)
+    index.bm25_tier = ChampionTier(index.bm25_model.weights, size)
+    return index
+
+def build_index_from_stream(preprocessed_batches, k1=1.5, b=0.75, epsilon=0.25, champion_size=None):
+    """
+    Construye el índice completo a partir de un flujo de lotes ya preprocesados.
+
+    Cada lote se incorpora a las matrices de conteos y se descarta, por lo que ni los textos
+    ni los tokens del corpus completo se mantienen en memoria. Para TF-IDF se tokeniza el texto
+    limpio con el mismo patrón que TfidfVectorizer, de modo que el resultado es idéntico.
+
+    Parámetros:
+        preprocessed_batches (Iterable[tuple[list[str], list[list[str]], list[str]]]):
+            Lotes (textos limpios, lemas, IDs de documentos), por ejemplo de iter_preprocessed.
+        k1, b, epsilon (float): Parámetros de BM25.
+        champion_size (int | None): Si se indica, construye además las listas de campeones con
+                                    ese número de postings por término (ver add_champion_tiers).
+
+    Retorna:
+        SearchIndex: Índice construido.
+    """
+    tfidf_counts = CountMatrixBuilder()
+    bm25_counts = CountMatrixBuilder()
+    token_pattern = TfidfQueryVectorizer.token_pattern
+    document_ids = []
+    for prep_docs, token_docs, doc_ids in preprocessed_batches:
+        tfidf_counts.add(token_pattern.findall(text.lower()) for text in prep_docs)
+        bm25_counts.add(token_docs)
+        document_ids.extend(doc_ids)
+
+    tfidf_matrix, tfidf_vectorizer = build_tf_idf_from_counts(*tfidf_counts.build())
+    counts, vocabulary = bm25_counts.build()
+    bm25_model = SparseBM25(counts, vocabulary, k1=k1, b=b, epsilon=epsilon)
+    index = SearchIndex(tfidf_matrix, tfidf_vectorizer, bm25_model, document_ids)
+    if champion_size is not None:
+        add_champion_tiers(index, champion_size)
+    return index
+
+def _encode_strings(strings):
+    """
+    Serializa una lista de cadenas como un único bloque UTF-8 separado por saltos de línea.
+
+    Parámetros:
+        strings (list[str]): Cadenas sin saltos de línea (términos o IDs de documentos).
+
+    Retorna:
+        np.ndarray: Arreglo uint8 con el bloque codificado.
+    """
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+def _decode_strings(blob, count):
+    """
+    Reconstruye la lista de cadenas guardada con _encode_strings.
+
+    Parámetros:
+        blob (np.ndarray): Arreglo uint8 con el bloque codificado.
+        count (int): Número de cadenas esperado.
+
+    Retorna:
+        list[str]: Lista de cadenas.
+    """
+    if count == 0:
+        return []
+    strings = blob.tobytes().decode("utf-8").split("\n")
+    if len(strings) != count:
+        raise ValueError(f"Se esperaban {count} cadenas y se encontraron {len(strings)}.")
+    return strings
+
+def index_exists(path=INDEX_DIR):
+    """
+    Indica si existe un índice guardado (con manifiesto) en el directorio dado.
+
+    Parámetros:
+        path (str): Directorio del índice.
+
+    Retorna:
+        bool: True si el manifiesto existe.
+    """
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+def save_index(index, path=INDEX_DIR):
+    """
+    Guarda el índice como archivos .npy planos más un manifiesto JSON versionado.
+
+    El manifiesto se escribe al final y de forma atómica, de modo que un índice escrito a medias
+    nunca se considera válido. Cada arreglo se escribe en un archivo temporal que luego reemplaza
+    al anterior, así que se puede volver a guardar un índice abierto con mmap desde el mismo
+    directorio (por ejemplo, tras agregarle las listas de campeones).
+
+    Parámetros:
+        index (SearchIndex): Índice a guardar.
+        path (str): Directorio de destino.
+
+    Retorna:
+        dict: Manifiesto escrito.
+    """
+    os.makedirs(path, exist_ok=True)
+    # Las postings TF-IDF se guardan en CSC junto a sus cotas, tal como las usa SparseTfidf
+    tfidf_engine = index.tfidf_engine
+    tfidf = tfidf_engine.postings
+    bm25 = index.bm25_model
+    tfidf_terms = [str(term) for term in index.tfidf_vectorizer.get_feature_names_out()]
+    bm25_terms = sorted(bm25.vocabulary, key=bm25.vocabulary.get)
+
+    arrays = {
+        "tfidf_vocabulary": _encode_strings(tfidf_terms),
+        "tfidf_idf": np.asarray(index.tfidf_vectorizer.idf_, dtype=np.float64),
+        "tfidf_data": tfidf.data,
+        "tfidf_indices": tfidf.indices,
+        "tfidf_indptr": tfidf.indptr,
+        "tfidf_max_scores": np.asarray(tfidf_engine.max_scores, dtype=np.float64),
+        "bm25_vocabulary": _encode_strings(bm25_terms),
+        "bm25_idf": np.asarray(bm25.idf, dtype=np.float64),
+        "bm25_data": bm25.weights.data,
+        "bm25_indices": bm25.weights.indices,
+        "bm25_indptr": bm25.weights.indptr,
+        # Cotas MaxScore: guardarlas evita recorrer todas las postings BM25 al abrir el índice
+        "bm25_max_scores": np.asarray(bm25.max_scores, dtype=np.float64),
+        "doc_len": np.asarray(bm25.doc_len, dtype=np.float64),
+        "doc_ids": _encode_strings([str(doc_id) for doc_id in index.document_ids]),
+    }
+    # Listas de campeones (opcionales): se guardan junto a las postings completas
+    champion_size = None
+    for name, tier in (("tfidf", index.tfidf_tier), ("bm25", index.bm25_tier)):
+        if tier is not None:
+            champion_size = tier.size
+            arrays[f"{name}_champion_data"] = tier.postings.data
+            arrays[f"{name}_champion_indices"] = tier.postings.indices
+            arrays[f"{name}_champion_indptr"] = tier.postings.indptr
+            arrays[f"{name}_champion_remainder"] = np.asarray(tier.remainder, dtype=np.float64)
+    files = {}
+    for name, array in arrays.items():
+        array_path = os.path.join(path, name + ".npy")
+        with open(array_path + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(array_path + ".tmp", array_path)
+        files[name] = {"dtype": str(array.dtype), "shape": list(array.shape)}
+
+    manifest = {
+        "format": INDEX_FORMAT,
+        "version": INDEX_VERSION,
+        "build_id": index.version,
+        "num_docs": int(tfidf.shape[0]),
+        "tfidf": {"num_terms": int(tfidf.shape[1]), "nnz": int(tfidf.nnz)},
+        "bm25": {
+            "num_terms": int(bm25.weights.shape[1]),
+            "nnz": int(bm25.weights.nnz),
+            "k1": bm25.k1,
+            "b": bm25.b,
+            "epsilon": bm25.epsilon,
+            "average_idf": None if bm25.average_idf is None else float(bm25.average_idf),
+            "avgdl": float(bm25.avgdl),
+        },
+        "champions": None if champion_size is None else {"size": champion_size},
+        "files": files,
+    }
+    tmp_path = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+    return manifest
+
+def load_index(path=INDEX_DIR, mmap=True):
+    """
+    Abre un índice guardado con save_index. Con mmap=True los arreglos se mapean en memoria
+    (np.load(mmap_mode='r')), por lo que varios procesos comparten la misma caché de páginas.
+
+    Parámetros:
+        path (str): Directorio del índice.
+        mmap (bool): Si es True, mapea los arreglos en memoria en lugar de leerlos.
+
+    Retorna:
+        SearchIndex: Índice listo para consultar.
+
+    Lanza:
+        FileNotFoundError: Si no existe el manifiesto.
+        ValueError: Si el formato o la versión no son compatibles, o los archivos no coinciden.
+    """
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != INDEX_FORMAT or manifest.get("version") != INDEX_VERSION:
+        raise ValueError(
+            f"Índice incompatible en '{path}': formato {manifest.get('format')} "
+            f"versión {manifest.get('version')} (se esperaba {INDEX_FORMAT} versión {INDEX_VERSION})."
+        )
+
+    arrays = {}
+    for name, meta in manifest["files"].items():
+        array = np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None)
+        if list(array.shape) != meta["shape"] or str(array.dtype) != meta["dtype"]:
+            raise ValueError(f"El archivo '{name}.npy' no coincide con el manifiesto.")
+        arrays[name] = array
+
+    num_docs = manifest["num_docs"]
+    tfidf_meta, bm25_meta = manifest["tfidf"], manifest["bm25"]
+    # Las cotas MaxScore guardadas deben tener una entrada por término
+    for name, meta in (("tfidf_max_scores", tfidf_meta), ("bm25_max_scores", bm25_meta)):
+        if name in arrays and arrays[name].shape != (meta["num_terms"],):
+            raise ValueError(f"El archivo '{name}.npy' no tiene una cota por término.")
+
+    tfidf_terms = _decode_strings(arrays["tfidf_vocabulary"], tfidf_meta["num_terms"])
+    tfidf_postings = csc_matrix(
+        (arrays["tfidf_data"], arrays["tfidf_indices"], arrays["tfidf_indptr"]),
+        shape=(num_docs, tfidf_meta["num_terms"]),
+    )
+    tfidf_engine = SparseTfidf.from_arrays(tfidf_postings, arrays["tfidf_max_scores"])
+    tfidf_vectorizer = TfidfQueryVectorizer(tfidf_terms, arrays["tfidf_idf"])
+
+    bm25_terms = _decode_strings(arrays["bm25_vocabulary"], bm25_meta["num_terms"])
+    bm25_weights = csc_matrix(
+        (arrays["bm25_data"], arrays["bm25_indices"], arrays["bm25_indptr"]),
+        shape=(num_docs, bm25_meta["num_terms"]),
+    )
+    bm25_model = SparseBM25.from_arrays(
+        bm25_weights,
+        {term: i for i, term in enumerate(bm25_terms)},
+        arrays["bm25_idf"],
+        arrays["doc_len"],
+        k1=bm25_meta["k1"],
+        b=bm25_meta["b"],
+        epsilon=bm25_meta["epsilon"],
+        average_idf=bm25_meta["average_idf"],
+        avgdl=bm25_meta.get("avgdl"),
+        max_scores=arrays.get("bm25_max_scores"),
+    )
+
+    document_ids = _decode_strings(arrays["doc_ids"], num_docs)
+    index = SearchIndex(tfidf_postings, tfidf_vectorizer, bm25_model, document_ids, manifest, tfidf_engine)
+
+    champions = manifest.get("champions")
+    for name, num_terms in (("tfidf", tfidf_meta["num_terms"]), ("bm25", bm25_meta["num_terms"])):
+        if champions and f"{name}_champion_data" in arrays:
+            postings = csc_matrix(
+                (arrays[f"{name}_champion_data"], arrays[f"{name}_champion_indices"],
+                 arrays[f"{name}_champion_indptr"]),
+                shape=(num_docs, num_terms),
+            )
+            tier = ChampionTier.from_arrays(postings, arrays[f"{name}_champion_remainder"], champions["size"])
+            setattr(index, f"{name}_tier", tier)
+    return index
@@ -0,0 +1,344 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Variable de entorno que activa la instrumentación al importar el módulo
+INSTRUMENTATION_ENV = "RI_INSTRUMENTATION"
+# Archivo por defecto del reporte JSON
+INSTRUMENTATION_FILE = "instrumentation.json"
+# Número de cubetas del histograma de latencias (cubeta i: duraciones en [2^(i-1), 2^i) ns)
+HISTOGRAM_BUCKETS = 64
+
+class _State:
+    """
+    Estado global de la instrumentación. Mientras enabled es False, los puntos de medición
+    se reducen a leer este atributo.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.memory_peaks = {}
+        self.local = threading.local()
+
+_state = _State()
+
+class _Timer:
+    """
+    Acumulador de duraciones de una etapa con histograma logarítmico en base 2.
+    """
+
+    __slots__ = ("count", "total_ns", "min_ns", "max_ns", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        self.min_ns = duration_ns if self.min_ns is None else min(self.min_ns, duration_ns)
+        self.max_ns = max(self.max_ns, duration_ns)
+        self.buckets[min(duration_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, q):
+        """
+        Percentil aproximado: límite superior de la cubeta que contiene el q-ésimo percentil.
+        """
+        target = q / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                return min(2 ** i, self.max_ns)
+        return self.max_ns
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_ms": self.total_ns / self.count / 1e6 if self.count else 0.0,
+            "min_ms": (self.min_ns or 0) / 1e6,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p95_ms": self.percentile(95) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "max_ms": self.max_ns / 1e6,
+            # Histograma: límite superior de cada cubeta no vacía (ms) -> número de mediciones
+            "histogram": {f"{2 ** i / 1e6:.6g}": n for i, n in enumerate(self.buckets) if n},
+        }
+
+def enable(memory=False):
+    """
+    Activa la instrumentación.
+
+    Parámetros:
+        memory (bool): Si es True, registra además el pico de memoria de cada etapa con
+                       tracemalloc (con un costo notable; usar solo al diagnosticar).
+    """
+    _state.memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _state.enabled = True
+
+def disable():
+    """
+    Desactiva la instrumentación (los datos ya registrados se conservan hasta reset).
+    """
+    _state.enabled = False
+    if _state.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state.memory = False
+
+def is_enabled():
+    """
+    Retorna:
+        bool: True si la instrumentación está activa.
+    """
+    return _state.enabled
+
+def reset():
+    """
+    Descarta todos los temporizadores, contadores y picos de memoria registrados.
+    """
+    with _state.lock:
+        _state.timers.clear()
+        _state.counters.clear()
+        _state.memory_peaks.clear()
+
+def count(name, value=1):
+    """
+    Incrementa un contador (por ejemplo, postings recorridas o documentos puntuados).
+
+    Parámetros:
+        name (str): Nombre del contador.
+        value (int): Incremento.
+    """
+    if not _state.enabled:
+        return
+    with _state.lock:
+        _state.counters[name] = _state.counters.get(name, 0) + int(value)
+
+def _record(name, duration_ns):
+    with _state.lock:
+        timer = _state.timers.get(name)
+        if timer is None:
+            timer = _state.timers[name] = _Timer()
+        timer.add(duration_ns)
+
+class _MemoryFrame:
+    __slots__ = ("start", "peak")
+
+    def __init__(self, start):
+        self.start = start
+        self.peak = start
+
+def _memory_enter():
+    """
+    Inicia la medición de memoria de una etapa, preservando el pico de la etapa contenedora.
+    """
+    stack = getattr(_state.local, "memory_stack", None)
+    if stack is None:
+        stack = _state.local.memory_stack = []
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        stack[-1].peak = max(stack[-1].peak, peak)
+    tracemalloc.reset_peak()
+    stack.append(_MemoryFrame(current))
+
+def _memory_exit(name):
+    """
+    Registra el pico de memoria de la etapa (por encima de la memoria al entrar).
+    """
+    stack = _state.local.memory_stack
+    frame = stack.pop()
+    peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+    if stack:
+        stack[-1].peak = max(stack[-1].peak, peak)
+    with _state.lock:
+        _state.memory_peaks[name] = max(_state.memory_peaks.get(name, 0), peak - frame.start)
+
+class _NullStage:
+    """
+    Etapa vacía que se usa mientras la instrumentación está desactivada.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    """
+    Mide la duración (y, si se pidió, el pico de memoria) de un bloque de código.
+    """
+
+    __slots__ = ("name", "start", "memory")
+
+    def __init__(self, name):
+        self.name = name
+        self.memory = _state.memory and tracemalloc.is_tracing()
+
+    def __enter__(self):
+        if self.memory:
+            _memory_enter()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self.name, time.perf_counter_ns() - self.start)
+        if self.memory:
+            _memory_exit(self.name)
+        return False
+
+def stage(name):
+    """
+    Context manager que mide una etapa del procesamiento.
+
+    Parámetros:
+        name (str): Nombre de la etapa (por ejemplo, 'search.top_k').
+
+    Retorna:
+        ContextManager: Medidor de la etapa, o uno vacío si la instrumentación está desactivada.
+    """
+    if not _state.enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+def timed(name=None):
+    """
+    Decorador que mide cada llamada a la función como una etapa, sin modificar su valor de retorno
+    (a diferencia de execute_time).
+
+    El envoltorio se mantiene aunque la instrumentación esté desactivada, para que enable() también
+    cubra las funciones decoradas al importar los módulos; desactivado, solo agrega un marco y la
+    lectura de _state.enabled por llamada.
+
+    Parámetros:
+        name (str | None): Nombre de la etapa. Si es None, se usa 'módulo.función'.
+
+    Retorna:
+        Callable: Decorador.
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with _Stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def peak_rss_bytes():
+    """
+    Retorna:
+        int | None: Máximo de memoria residente del proceso hasta ahora, o None si no se puede medir.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB; macOS, bytes
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+def report():
+    """
+    Retorna:
+        dict: Temporizadores por etapa (con percentiles e histograma), contadores, picos de
+              memoria por etapa (en bytes) y el pico de memoria residente del proceso.
+    """
+    with _state.lock:
+        return {
+            "timers": {name: timer.to_dict() for name, timer in sorted(_state.timers.items())},
+            "counters": dict(sorted(_state.counters.items())),
+            "memory_peaks": dict(sorted(_state.memory_peaks.items())),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+def export_json(path=INSTRUMENTATION_FILE):
+    """
+    Escribe el reporte de la instrumentación en un archivo JSON.
+
+    Parámetros:
+        path (str): Archivo de destino.
+
+    Retorna:
+        dict: Reporte escrito.
+    """
+    data = report()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    return data
+
+def format_report(data=None):
+    """
+    Formatea el reporte como tabla de texto, ordenada por tiempo total.
+
+    Parámetros:
+        data (dict | None): Reporte de report(). Si es None, se genera uno nuevo.
+
+    Retorna:
+        str: Tabla de etapas seguida de los contadores.
+    """
+    data = report() if data is None else data
+    lines = [f"{'etapa':<32}{'llamadas':>10}{'total ms':>12}{'p50 ms':>10}{'p99 ms':>10}"]
+    timers = sorted(data["timers"].items(), key=lambda item: -item[1]["total_ms"])
+    for name, timer in timers:
+        lines.append(f"{name:<32}{timer['count']:>10}{timer['total_ms']:>12.3f}"
+                     f"{timer['p50_ms']:>10.3f}{timer['p99_ms']:>10.3f}")
+    for name, value in data["counters"].items():
+        lines.append(f"{name:<32}{value:>10}")
+    for name, value in data["memory_peaks"].items():
+        lines.append(f"{name:<32}{value / 2 ** 20:>10.2f} MiB")
+    return "\n".join(lines)
+
+@contextmanager
+def profile(path=None, sort="cumulative", limit=30):
+    """
+    Perfila un bloque de código con cProfile.
+
+    El archivo .prof generado se puede abrir con pstats, snakeviz o gprof2dot. Para muestreo
+    externo (py-spy) no hace falta nada: con la instrumentación desactivada, stage() y count()
+    no agregan marcos a la pila, y cada función decorada con timed agrega solo el marco de su
+    envoltorio (wrapper en instrumentation.py), que se limita a llamar a la función original.
+
+    Parámetros:
+        path (str | None): Archivo .prof de destino. Si es None, se imprime un resumen.
+        sort (str): Criterio de orden del resumen impreso.
+        limit (int): Número de funciones del resumen impreso.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
+
+if os.environ.get(INSTRUMENTATION_ENV):
+    enable(memory=os.environ[INSTRUMENTATION_ENV].lower() == "memory")
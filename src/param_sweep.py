@@ -0,0 +1,256 @@
+"""
+Barrido de parámetros de BM25 y TF-IDF sobre estadísticas del índice calculadas una sola vez.
+
+Uso:
+    python -m src.param_sweep --k1 0.9,1.2,1.5,2.0 --b 0.5,0.75,0.9 --sublinear false,true --min-df 1,2,5
+
+El corpus se preprocesa y se cuenta una sola vez; cada configuración solo vuelve a ponderar
+la matriz de conteos (pesos BM25 o TF-IDF), ejecuta todas las consultas por lotes y se evalúa
+con RunEvaluator. Las configuraciones se reparten entre un pool de procesos.
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from src.dataset_loader import iter_beir_documents, load_beir_queries_and_qrels
+from src.evaluation import RunEvaluator
+from src.preprocessing import iter_preprocessed, preprocess_both
+from src.search_engine import (
+    CountMatrixBuilder,
+    SparseBM25,
+    TfidfQueryVectorizer,
+    batch_search_bm25,
+    batch_search_tfidf,
+    build_tf_idf_from_counts,
+)
+
+SWEEP_K = 10
+SWEEP_CUTOFFS = (5, 10)
+SWEEP_OUTPUT = "param_sweep_results.csv"
+
+# Estado compartido por las configuraciones evaluadas en cada proceso del pool
+_SWEEP_STATE = None
+
+class CorpusStatistics:
+    """
+    Conteos del corpus y estadísticas de la colección que no dependen de los parámetros.
+
+    Atributos:
+        tfidf_counts, bm25_counts (csr_matrix): Matrices de conteos (documentos x términos).
+        tfidf_vocabulary, bm25_vocabulary (dict[str, int]): Vocabularios ordenados alfabéticamente.
+        tfidf_doc_freq, bm25_doc_freq (np.ndarray): Frecuencia documental de cada término.
+        num_docs (int): Número de documentos.
+        avgdl (float): Longitud promedio (en lemas) de los documentos.
+        document_ids (list[str]): IDs de los documentos, en el orden de las filas.
+    """
+
+    def __init__(self, tfidf_counts, tfidf_vocabulary, bm25_counts, bm25_vocabulary, document_ids):
+        self.tfidf_counts = tfidf_counts
+        self.tfidf_vocabulary = tfidf_vocabulary
+        self.bm25_counts = bm25_counts
+        self.bm25_vocabulary = bm25_vocabulary
+        self.document_ids = document_ids
+        self.num_docs = bm25_counts.shape[0]
+        self.tfidf_doc_freq = np.bincount(tfidf_counts.indices, minlength=tfidf_counts.shape[1])
+        self.bm25_doc_freq = np.bincount(bm25_counts.indices, minlength=bm25_counts.shape[1])
+        self.avgdl = float(bm25_counts.sum()) / self.num_docs if self.num_docs else 0.0
+
+    @classmethod
+    def from_stream(cls, preprocessed_batches):
+        """
+        Cuenta un flujo de lotes preprocesados (ver build_index_from_stream).
+
+        Parámetros:
+            preprocessed_batches (Iterable[tuple[list[str], list[list[str]], list[str]]]):
+                Lotes (textos limpios, lemas, IDs de documentos).
+
+        Retorna:
+            CorpusStatistics: Conteos y estadísticas del corpus.
+        """
+        tfidf_counts = CountMatrixBuilder()
+        bm25_counts = CountMatrixBuilder()
+        token_pattern = TfidfQueryVectorizer.token_pattern
+        document_ids = []
+        for prep_docs, token_docs, doc_ids in preprocessed_batches:
+            tfidf_counts.add(token_pattern.findall(text.lower()) for text in prep_docs)
+            bm25_counts.add(token_docs)
+            document_ids.extend(doc_ids)
+        return cls(*tfidf_counts.build(), *bm25_counts.build(), document_ids)
+
+def bm25_grid(k1_values, b_values, epsilon=0.25):
+    """
+    Retorna:
+        list[dict]: Configuraciones BM25 (producto cartesiano de k1 y b).
+    """
+    return [{"model": "bm25", "k1": k1, "b": b, "epsilon": epsilon}
+            for k1, b in itertools.product(k1_values, b_values)]
+
+def tfidf_grid(sublinear_values, norm_values, min_df_values):
+    """
+    Retorna:
+        list[dict]: Configuraciones TF-IDF (producto cartesiano de sublinear_tf, norm y min_df).
+    """
+    return [{"model": "tfidf", "sublinear_tf": sublinear, "norm": norm, "min_df": min_df}
+            for sublinear, norm, min_df in itertools.product(sublinear_values, norm_values, min_df_values)]
+
+def _init_sweep(stats, queries, qrels, k, cutoffs):
+    """
+    Inicializador del pool: recibe una sola vez los conteos y las consultas.
+    """
+    global _SWEEP_STATE
+    query_ids = list(queries)
+    _SWEEP_STATE = {
+        "stats": stats,
+        "query_ids": query_ids,
+        "queries_clean": [queries[qid][0] for qid in query_ids],
+        "queries_tokens": [queries[qid][1] for qid in query_ids],
+        "evaluator": RunEvaluator(qrels, query_ids, stats.document_ids),
+        "k": k,
+        "cutoffs": cutoffs,
+    }
+
+def evaluate_config(config):
+    """
+    Pondera los conteos con una configuración, ejecuta todas las consultas y las evalúa.
+
+    Con norm=None la búsqueda TF-IDF es un producto punto sin normalizar (no coseno).
+
+    Parámetros:
+        config (dict): Configuración de bm25_grid o tfidf_grid.
+
+    Retorna:
+        dict: La configuración junto con sus métricas, el tiempo de ponderación y la latencia
+              promedio por consulta de la búsqueda por lotes.
+    """
+    state = _SWEEP_STATE
+    stats = state["stats"]
+    start = time.perf_counter()
+    if config["model"] == "bm25":
+        model = SparseBM25(
+            stats.bm25_counts, stats.bm25_vocabulary, k1=config["k1"], b=config["b"], epsilon=config["epsilon"],
+            doc_freq=stats.bm25_doc_freq, num_docs=stats.num_docs, avgdl=stats.avgdl,
+        )
+        weight_seconds = time.perf_counter() - start
+        (rows, _), search_seconds = batch_search_bm25(model, state["queries_tokens"], k=state["k"])
+    else:
+        matrix, vectorizer = build_tf_idf_from_counts(
+            stats.tfidf_counts, stats.tfidf_vocabulary, doc_freq=stats.tfidf_doc_freq, num_docs=stats.num_docs,
+            sublinear_tf=config["sublinear_tf"], norm=config["norm"], min_df=config["min_df"],
+        )
+        weight_seconds = time.perf_counter() - start
+        (rows, _), search_seconds = batch_search_tfidf(matrix, vectorizer, state["queries_clean"], k=state["k"])
+
+    result = dict(config)
+    result.update(state["evaluator"].summary(rows, cutoffs=state["cutoffs"]))
+    result["weight_s"] = weight_seconds
+    result["ms_per_query"] = search_seconds / max(1, len(state["query_ids"])) * 1e3
+    return result
+
+def run_sweep(stats, queries, qrels, configs, k=SWEEP_K, cutoffs=SWEEP_CUTOFFS, n_jobs=None):
+    """
+    Evalúa todas las configuraciones en paralelo y las ordena por calidad.
+
+    Parámetros:
+        stats (CorpusStatistics): Conteos del corpus.
+        queries (dict[str, tuple[str, list[str]]]): Consultas preprocesadas (texto limpio, lemas) por ID.
+        qrels (dict[str, list[str]]): Documentos relevantes por consulta.
+        configs (list[dict]): Configuraciones a evaluar.
+        k (int): Documentos recuperados por consulta.
+        cutoffs (tuple[int]): Cortes de la evaluación.
+        n_jobs (int | None): Número de procesos. 1 evalúa en el proceso actual; None usa todos los núcleos.
+
+    Retorna:
+        pd.DataFrame: Una fila por configuración, ordenada por MAP y nDCG en el mayor corte.
+    """
+    if n_jobs is None:
+        n_jobs = min(len(configs), os.cpu_count() or 1)
+    init_args = (stats, queries, qrels, k, cutoffs)
+    if n_jobs <= 1:
+        _init_sweep(*init_args)
+        results = [evaluate_config(config) for config in configs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_sweep, initargs=init_args) as executor:
+            results = list(executor.map(evaluate_config, configs))
+
+    frame = pd.DataFrame(results)
+    # Resumen legible de los parámetros de cada fila (las columnas individuales se conservan)
+    frame.insert(1, "params", [
+        " ".join(f"{name}={'none' if value is None else value}"
+                 for name, value in config.items() if name != "model")
+        for config in configs
+    ])
+    ranking = ["map", f"ndcg@{max(cutoffs)}"]
+    return frame.sort_values(ranking, ascending=False, kind="stable").reset_index(drop=True)
+
+def _parse_list(text, cast):
+    """
+    Convierte 'a,b,c' en una lista con cada elemento convertido por cast.
+    """
+    return [cast(item.strip()) for item in text.split(",") if item.strip()]
+
+def _parse_bool(text):
+    """
+    Interpreta 'true'/'1'/'sí' como True y cualquier otro valor como False.
+    """
+    return text.lower() in ("1", "true", "si", "sí", "yes")
+
+def _parse_norm(text):
+    """
+    Interpreta 'none' como sin normalización.
+    """
+    return None if text.lower() in ("none", "") else text.lower()
+
+def main(argv=None):
+    """
+    Punto de entrada de línea de comandos.
+    """
+    parser = argparse.ArgumentParser(description="Barrido de parámetros de BM25 y TF-IDF.")
+    parser.add_argument("--k1", default="0.9,1.2,1.5,2.0", help="Valores de k1 (BM25).")
+    parser.add_argument("--b", default="0.4,0.6,0.75,0.9", help="Valores de b (BM25).")
+    parser.add_argument("--epsilon", type=float, default=0.25, help="Piso de idf de BM25.")
+    parser.add_argument("--sublinear", default="false,true", help="Valores de sublinear_tf (TF-IDF).")
+    parser.add_argument("--norm", default="l2", help="Normas de TF-IDF: l2, l1, none.")
+    parser.add_argument("--min-df", default="1,2,5", help="Valores de min_df (TF-IDF).")
+    parser.add_argument("--models", default="bm25,tfidf", help="Modelos a barrer.")
+    parser.add_argument("--k", type=int, default=SWEEP_K, help="Documentos recuperados por consulta.")
+    parser.add_argument("--docs", type=int, default=None, help="Número máximo de documentos del corpus.")
+    parser.add_argument("--queries", type=int, default=None, help="Número máximo de consultas.")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para evaluar configuraciones.")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos para el preprocesamiento.")
+    parser.add_argument("--output", default=SWEEP_OUTPUT, help="Archivo CSV con la tabla de resultados.")
+    args = parser.parse_args(argv)
+
+    models = _parse_list(args.models, str)
+    configs = []
+    if "bm25" in models:
+        configs += bm25_grid(_parse_list(args.k1, float), _parse_list(args.b, float), args.epsilon)
+    if "tfidf" in models:
+        configs += tfidf_grid(_parse_list(args.sublinear, _parse_bool), _parse_list(args.norm, _parse_norm),
+                              _parse_list(args.min_df, int))
+    if not configs:
+        parser.error("No hay configuraciones que evaluar.")
+
+    raw_queries, qrels = load_beir_queries_and_qrels(limit=args.queries)
+    queries = {qid: preprocess_both(text) for qid, text in raw_queries.items()}
+
+    start = time.perf_counter()
+    stats = CorpusStatistics.from_stream(iter_preprocessed(iter_beir_documents(limit=args.docs), n_jobs=args.jobs))
+    print(f"Conteos de {stats.num_docs} documentos en {time.perf_counter() - start:.1f} s; "
+          f"evaluando {len(configs)} configuraciones...")
+
+    start = time.perf_counter()
+    cutoffs = tuple(sorted({cutoff for cutoff in SWEEP_CUTOFFS if cutoff < args.k} | {args.k}))
+    results = run_sweep(stats, queries, qrels, configs, k=args.k, cutoffs=cutoffs, n_jobs=args.workers)
+    metric_columns = [column for column in results.columns if column in ("map", "mrr") or "@" in column]
+    table = results[["model", "params", *metric_columns, "weight_s", "ms_per_query"]]
+    print(table.to_string(index=False, float_format="{:.4f}".format))
+    print(f"\nBarrido completo en {time.perf_counter() - start:.1f} s")
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Resultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -14,9 +14,9 @@ def execute_time(func):
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = func(*args, **kwargs)
-        end_time = time.time()
+        end_time = time.perf_counter()
         return result, end_time - start_time
     return wrapper
 
@@ -1,13 +1,190 @@
-import nltk
-import pandas as pd
-from nltk.tokenize import regexp_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+import argparse
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from src.instrumentation import count, stage, timed
 
-# Descarga de recursos necesarios de NLTK
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-nltk.download('wordnet', quiet=True)
+# Recursos de NLTK necesarios: paquete -> ruta dentro de nltk.data. La tokenización usa
+# TOKEN_PATTERN, por lo que no hace falta punkt. Los recursos se instalan una sola vez con
+# `python -m src.preprocessing --download`; al importar el módulo no se accede a la red.
+NLTK_RESOURCES = {
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+}
+# Patrón de tokenización aplicado sobre el texto en minúsculas
+TOKEN_PATTERN = r'\w[a-z]+'
+# Número de documentos que procesa cada tarea del pool de procesos
+CHUNK_SIZE = 2000
+# Número máximo de pares token -> lema que se memorizan
+LEMMA_CACHE_SIZE = 2 ** 18
+
+def missing_nltk_resources():
+    """
+    Verifica localmente (sin acceder a la red) qué recursos de NLTK no están instalados.
+
+    Retorna:
+        list[str]: Paquetes de NLTK_RESOURCES que no se encuentran en nltk.data.path.
+    """
+    import nltk
+
+    missing = []
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(package)
+    return missing
+
+def download_nltk_resources(download_dir=None):
+    """
+    Descarga los recursos de NLTK que falten (aprovisionamiento explícito, una sola vez).
+
+    Parámetros:
+        download_dir (str | None): Directorio de destino. Si es None, se usa el de NLTK por
+                                   defecto; otro directorio debe agregarse a NLTK_DATA.
+
+    Retorna:
+        list[str]: Paquetes descargados.
+
+    Lanza:
+        LookupError: Si algún recurso sigue sin estar disponible después de la descarga.
+    """
+    import nltk
+
+    missing = missing_nltk_resources()
+    if download_dir and download_dir not in nltk.data.path:
+        nltk.data.path.append(download_dir)
+    failed = [package for package in missing
+              if not nltk.download(package, download_dir=download_dir, quiet=True)]
+    if failed:
+        raise LookupError(f"No se pudieron descargar los recursos de NLTK: {', '.join(failed)}")
+    return missing
+
+def check_nltk_resources():
+    """
+    Verifica que los recursos de NLTK estén instalados.
+
+    Lanza:
+        LookupError: Si falta alguno, indicando cómo instalarlo.
+    """
+    missing = missing_nltk_resources()
+    if missing:
+        raise LookupError(
+            f"Faltan recursos de NLTK: {', '.join(missing)}. "
+            "Instálelos una vez con `python -m src.preprocessing --download` "
+            "(o copie nltk_data a un directorio de NLTK_DATA en equipos sin red).")
+
+class TextAnalyzer:
+    """
+    Estado compartido del preprocesamiento: stopwords, lematizador y caché de lemas.
+
+    Las stopwords y el WordNetLemmatizer se cargan una sola vez, y cada token se lematiza
+    a través de una caché LRU acotada: como el vocabulario sigue una distribución de Zipf,
+    la mayoría de los tokens repetidos no vuelven a consultar WordNet.
+
+    Atributos:
+        stop_words (frozenset[str]): Palabras vacías a eliminar.
+        lemmatizer (WordNetLemmatizer): Lematizador de NLTK.
+    """
+
+    def __init__(self, cache_size=LEMMA_CACHE_SIZE, language='english'):
+        # NLTK se importa al crear el analizador, no al importar el módulo
+        check_nltk_resources()
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+
+        self.stop_words = frozenset(stopwords.words(language))
+        self.lemmatizer = WordNetLemmatizer()
+        self._token_re = re.compile(TOKEN_PATTERN, re.UNICODE | re.MULTILINE | re.DOTALL)
+        self._lemmatize = lru_cache(maxsize=cache_size)(self.lemmatizer.lemmatize)
+
+    def tokenize(self, text):
+        """
+        Convierte el texto a minúsculas y lo tokeniza con TOKEN_PATTERN (equivale a regexp_tokenize).
+
+        Parámetros:
+            text (str): Texto crudo.
+
+        Retorna:
+            list[str]: Lista de tokens.
+        """
+        return self._token_re.findall(text.lower())
+
+    def remove_stopwords(self, tokens):
+        """
+        Parámetros:
+            tokens (list[str]): Lista de tokens.
+
+        Retorna:
+            list[str]: Lista de tokens sin stopwords.
+        """
+        stop_words = self.stop_words
+        return [token for token in tokens if token not in stop_words]
+
+    def lemmatize_tokens(self, tokens):
+        """
+        Parámetros:
+            tokens (list[str]): Lista de tokens.
+
+        Retorna:
+            list[str]: Lista de lemas, resueltos a través de la caché.
+        """
+        lemmatize = self._lemmatize
+        return [lemmatize(token) for token in tokens]
+
+    def analyze(self, text):
+        """
+        Aplica tokenización, eliminación de stopwords y lematización a un texto.
+
+        Parámetros:
+            text (str): Texto crudo.
+
+        Retorna:
+            list[str]: Lemas del texto.
+        """
+        stop_words = self.stop_words
+        lemmatize = self._lemmatize
+        return [lemmatize(token) for token in self.tokenize(text) if token not in stop_words]
+
+    def cache_info(self):
+        """
+        Estadísticas de la caché de lemas.
+
+        Retorna:
+            dict: Aciertos, fallos, tamaño actual, tamaño máximo y tasa de aciertos.
+        """
+        info = self._lemmatize.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0,
+        }
+
+    def clear_cache(self):
+        """
+        Vacía la caché de lemas y reinicia sus estadísticas.
+        """
+        self._lemmatize.cache_clear()
+
+# Instancia compartida por el proceso (cada proceso del pool crea la suya al primer uso)
+_analyzer = None
+
+def get_analyzer():
+    """
+    Retorna el TextAnalyzer compartido del proceso, creándolo la primera vez.
+
+    Retorna:
+        TextAnalyzer: Analizador compartido.
+    """
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = TextAnalyzer()
+    return _analyzer
 
 def remove_stopwords(tokens):
     """
@@ -19,12 +196,11 @@ def remove_stopwords(tokens):
     Retorna:
         list[str]: Lista de tokens sin stopwords.
     """
-    stop_words = set(stopwords.words('english'))
-    return [token for token in tokens if token not in stop_words]
+    return get_analyzer().remove_stopwords(tokens)
 
 def lemmatize_tokens(tokens):
     """
-    Lematiza una lista de tokens utilizando WordNetLemmatizer.
+    Lematiza una lista de tokens utilizando WordNetLemmatizer (con caché de lemas).
 
     Parámetros:
         tokens (list[str]): Lista de tokens.
@@ -32,44 +208,143 @@ def lemmatize_tokens(tokens):
     Retorna:
         list[str]: Lista de lemas correspondientes.
     """
-    lemmatizer = WordNetLemmatizer()
-    return [lemmatizer.lemmatize(token) for token in tokens]
+    return get_analyzer().lemmatize_tokens(tokens)
+
+def _preprocess_chunk(texts):
+    """
+    Preprocesa un bloque de textos en una sola pasada (función ejecutada por cada proceso).
+
+    Parámetros:
+        texts (list[str]): Textos crudos.
+
+    Retorna:
+        tuple:
+            - list[str]: Documentos preprocesados como texto limpio.
+            - list[list[str]]: Lemas de cada documento.
+    """
+    analyzer = get_analyzer()
+
+    prep_docs = []
+    token_docs = []
+    with stage("preprocessing.analyze"):
+        for text in texts:
+            lemmas = analyzer.analyze(text)
+            prep_docs.append(' '.join(lemmas))
+            token_docs.append(lemmas)
+    count("preprocessing.documents", len(texts))
+    return prep_docs, token_docs
+
+def preprocess_corpus(documents, n_jobs=1, chunk_size=CHUNK_SIZE):
+    """
+    Preprocesa el corpus completo en una sola pasada, opcionalmente en paralelo con un pool de procesos.
+
+    El corpus se divide en bloques que se reparten entre los procesos; los resultados se
+    reensamblan en el orden original, por lo que la salida es determinista.
+
+    Parámetros:
+        documents (list[str]): Lista de textos crudos.
+        n_jobs (int | None): Número de procesos. 1 procesa en el proceso actual; None usa todos los núcleos.
+        chunk_size (int): Número de documentos por bloque.
+
+    Retorna:
+        tuple:
+            - list[str]: Documentos preprocesados como texto limpio.
+            - list[list[str]]: Lemas de cada documento.
+    """
+    documents = list(documents)
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    chunks = [documents[i:i + chunk_size] for i in range(0, len(documents), chunk_size)]
+
+    if n_jobs == 1 or len(chunks) <= 1:
+        results = map(_preprocess_chunk, chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks))) as executor:
+            # executor.map conserva el orden de los bloques
+            results = list(executor.map(_preprocess_chunk, chunks))
+
+    prep_docs = []
+    token_docs = []
+    for chunk_prep, chunk_tokens in results:
+        prep_docs.extend(chunk_prep)
+        token_docs.extend(chunk_tokens)
+    return prep_docs, token_docs
+
+def iter_preprocessed(batches, n_jobs=1):
+    """
+    Preprocesa un flujo de lotes de documentos y genera los resultados lote a lote.
+
+    Con varios procesos, solo se mantienen en vuelo hasta 2 * n_jobs lotes, de modo que la
+    memoria usada no crece con el tamaño del corpus. El orden de salida es el de entrada.
+
+    Parámetros:
+        batches (Iterable[tuple[list[str], list[str]]]): Lotes (textos, IDs de documentos).
+        n_jobs (int | None): Número de procesos. 1 procesa en el proceso actual; None usa todos los núcleos.
+
+    Retorna:
+        Iterator[tuple[list[str], list[list[str]], list[str]]]: Lotes (textos limpios, lemas, IDs).
+    """
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
 
-def preprocess_documents(documents, return_type='df'):
+    if n_jobs == 1:
+        for texts, doc_ids in batches:
+            prep_docs, token_docs = _preprocess_chunk(texts)
+            yield prep_docs, token_docs, doc_ids
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        for texts, doc_ids in batches:
+            pending.append((executor.submit(_preprocess_chunk, texts), doc_ids))
+            if len(pending) >= 2 * n_jobs:
+                future, ids = pending.popleft()
+                yield (*future.result(), ids)
+        while pending:
+            future, ids = pending.popleft()
+            yield (*future.result(), ids)
+
+def preprocess_documents(documents, return_type='df', n_jobs=1):
     """
     Preprocesa una lista de documentos aplicando minúsculas, tokenización, eliminación de stopwords y lematización.
 
     Parámetros:
         documents (list[str]): Lista de textos crudos.
         return_type (str): 'df' para retornar un DataFrame, 'tokens' para retornar solo las listas de lemas.
+        n_jobs (int | None): Número de procesos a utilizar (ver preprocess_corpus).
 
     Retorna:
         pd.DataFrame | list[list[str]]: DataFrame con los documentos originales y preprocesados, 
                                         o lista de listas de tokens si se especifica 'tokens'.
     """
-    # Crear DataFrame con los documentos originales
-    df = pd.DataFrame(documents, columns=['document'])
-    
-    # Tokenización con expresión regular y conversión a minúsculas
-    df['regex_tokens'] = df['document'].str.lower().apply(
-        lambda text: regexp_tokenize(text, pattern=r'\w[a-z]+')
-    )
-
-    # Eliminación de stopwords
-    df['no_stopwords'] = df['regex_tokens'].apply(remove_stopwords)
-
-    # Lematización
-    df['lemmas'] = df['no_stopwords'].apply(lemmatize_tokens)
-
-    # Unir los lemas en una cadena de texto
-    df['prep_doc'] = df['lemmas'].str.join(' ')
+    documents = list(documents)
+    prep_docs, token_docs = preprocess_corpus(documents, n_jobs=n_jobs)
 
     # Retornar según el tipo solicitado
     if return_type == 'tokens':
-        return df['lemmas'].tolist()
+        return token_docs
     else:
-        return df[['document', 'prep_doc']]
+        import pandas as pd
+        return pd.DataFrame({'document': documents, 'prep_doc': prep_docs})
+
+
+@timed("preprocessing.query")
+def analyze_query(text):
+    """
+    Preprocesa una consulta con Python puro y el estado compartido del analizador, sin pandas.
+
+    Produce exactamente la misma salida que preprocess_documents para un solo texto.
 
+    Parámetros:
+        text (str): Texto crudo de la consulta.
+
+    Retorna:
+        tuple:
+            - str: Consulta preprocesada como texto limpio.
+            - list[str]: Lemas de la consulta.
+    """
+    tokens = get_analyzer().analyze(text)
+    return ' '.join(tokens), tokens
 
 def preprocess_both(text: str) -> tuple[str, list[str]]:
     """
@@ -83,7 +358,29 @@ def preprocess_both(text: str) -> tuple[str, list[str]]:
             - str: Documento preprocesado como texto limpio.
             - list[str]: Tokens lematizados del documento.
     """
-    df = preprocess_documents([text])
-    clean = df['prep_doc'].iloc[0]
-    tokens = preprocess_documents([text], return_type='tokens')[0]
-    return clean, tokens
\ No newline at end of file
+    return analyze_query(text)
+
+def main():
+    """
+    Punto de entrada de consola: verifica o instala los recursos de NLTK.
+
+    Retorna:
+        int: 0 si todos los recursos están disponibles, 1 si falta alguno.
+    """
+    parser = argparse.ArgumentParser(description="Recursos de NLTK del preprocesamiento.")
+    parser.add_argument("--download", action="store_true", help="descarga los recursos que falten")
+    parser.add_argument("--dir", default=None, help="directorio de destino de la descarga")
+    args = parser.parse_args()
+
+    if args.download:
+        downloaded = download_nltk_resources(args.dir)
+        print(f"Descargados: {', '.join(downloaded)}" if downloaded else "Los recursos ya estaban instalados.")
+    missing = missing_nltk_resources()
+    if missing:
+        print(f"Faltan recursos de NLTK: {', '.join(missing)} (use --download)")
+        return 1
+    print("Recursos de NLTK disponibles.")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+import sys
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from src.instrumentation import count
+
+# Límites por defecto de la caché de resultados
+CACHE_MAX_ENTRIES = 4096
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def _entry_nbytes(value):
+    """
+    Estima la memoria ocupada por un resultado cacheado (arreglos NumPy o tuplas de ellos).
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_entry_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+def _freeze(value):
+    """
+    Marca como de solo lectura los arreglos de un resultado, para que nadie modifique la copia cacheada.
+    """
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.flags.writeable = False
+        return value
+    if isinstance(value, tuple):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class QueryResultCache:
+    """
+    Caché LRU de resultados de búsqueda, acotada por número de entradas y por memoria.
+
+    La clave combina el modelo, sus parámetros, el multiconjunto de lemas de la consulta
+    (el orden de los términos no cambia el puntaje) y k. Toda la caché se invalida cuando
+    cambia la versión del índice.
+
+    Parámetros:
+        max_entries (int): Número máximo de resultados guardados.
+        max_bytes (int): Memoria máxima estimada de los resultados guardados.
+        index_version (Hashable): Versión del índice con la que se calcularon los resultados.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, index_version=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_version = index_version
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model, params, query_tokens, k):
+        """
+        Construye la clave normalizada de una consulta.
+
+        Parámetros:
+            model (str): Nombre del modelo ('tfidf', 'bm25', ...).
+            params (dict | None): Parámetros del modelo que afectan el puntaje.
+            query_tokens (list[str]): Lemas de la consulta.
+            k (int): Número de resultados.
+
+        Retorna:
+            tuple: Clave hashable.
+        """
+        params = tuple(sorted((params or {}).items()))
+        terms = tuple(sorted(Counter(query_tokens).items()))
+        return model, params, terms, k
+
+    def set_index_version(self, version):
+        """
+        Registra la versión actual del índice; si cambió, vacía la caché.
+
+        Parámetros:
+            version (Hashable): Versión del índice.
+        """
+        with self._lock:
+            if version != self.index_version:
+                self.index_version = version
+                self._entries.clear()
+                self._nbytes = 0
+
+    def get(self, key):
+        """
+        Busca un resultado y, si existe, lo marca como el más recientemente usado.
+
+        Parámetros:
+            key (tuple): Clave de make_key.
+
+        Retorna:
+            Any | None: Resultado cacheado, o None si no está.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                count("cache.misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            count("cache.hits")
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Guarda un resultado, desalojando los menos recientemente usados si se exceden los límites.
+
+        Parámetros:
+            key (tuple): Clave de make_key.
+            value (Any): Resultado a guardar (por ejemplo, la tupla (índices, puntajes)).
+        """
+        value = _freeze(value)
+        nbytes = _entry_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous[1]
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while len(self._entries) > self.max_entries or self._nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_bytes
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Retorna el resultado cacheado o lo calcula y lo guarda.
+
+        Parámetros:
+            key (tuple): Clave de make_key.
+            compute (Callable[[], Any]): Función que calcula el resultado si no está en caché.
+
+        Retorna:
+            Any: Resultado de la consulta.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """
+        Vacía la caché y reinicia los contadores.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Retorna:
+            dict: Aciertos, fallos, desalojos, tasa de aciertos, entradas y memoria estimada.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+            }
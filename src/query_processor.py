@@ -0,0 +1,444 @@
+import numpy as np
+from src.instrumentation import count, timed
+from src.perf_metrics import execute_time
+from src.search_engine import build_results_frame, top_k_indices
+
+# Modos de fusión de la búsqueda híbrida
+FUSION_MODES = ("weighted", "rrf")
+# Peso de BM25 en la fusión ponderada (TF-IDF recibe 1 - HYBRID_ALPHA)
+HYBRID_ALPHA = 0.5
+# Constante de suavizado de la fusión por rango recíproco (valor usual en la literatura)
+RRF_K = 60
+# Profundidad de las listas de cada modelo que entran a la fusión por rango recíproco
+RRF_DEPTH = 100
+
+@timed("search.maxscore")
+def max_score_search(postings, max_scores, term_ids, query_weights, k):
+    """
+    Top-k exacto con poda dinámica MaxScore, recorriendo el índice término a término.
+
+    Los términos se procesan de mayor a menor cota superior (peso de la consulta por peso
+    máximo del término). Mientras la suma de las cotas de los términos restantes pueda superar
+    el umbral (k-ésimo mejor puntaje parcial), los documentos nuevos se agregan como candidatos;
+    cuando ya no puede, los términos restantes solo actualizan a los candidatos existentes
+    buscándolos en las postings (sin recorrerlas completas), y se descartan los candidatos
+    que ya no pueden entrar al top-k.
+
+    La poda asume que ningún término resta puntaje: los pesos de cada término tienen un mismo
+    signo y son no negativos. Es el caso de TF-IDF, pero no el de BM25 con epsilon <= 0, donde un
+    término con idf negativo tiene todos sus pesos negativos. Si algún término de la consulta
+    tiene cota negativa, se puntúan de forma exhaustiva sus postings, sin poda.
+
+    Parámetros:
+        postings (csc_matrix): Matriz de pesos (documentos x términos) con índices ordenados.
+        max_scores (np.ndarray): Peso máximo de cada término (ver build_max_scores).
+        term_ids (np.ndarray): Columnas de los términos de la consulta.
+        query_weights (np.ndarray): Peso de cada término en la consulta.
+        k (int): Número de documentos a retornar.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de los documentos ordenados de mayor a menor puntaje.
+            - np.ndarray: Puntajes correspondientes (solo documentos con puntaje positivo).
+            - dict: Estadísticas: postings totales de la consulta, postings evaluadas y candidatos.
+    """
+    indptr, indices, data = postings.indptr, postings.indices, postings.data
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    query_weights = np.asarray(query_weights, dtype=np.float64)
+    upper_bounds = query_weights * max_scores[term_ids]
+    if np.any(upper_bounds < 0):
+        return _exhaustive_search(postings, term_ids, query_weights, k)
+
+    # Procesar primero los términos con mayor cota superior
+    order = np.argsort(-upper_bounds, kind="stable")
+    term_ids, query_weights, upper_bounds = term_ids[order], query_weights[order], upper_bounds[order]
+    keep = upper_bounds > 0
+    term_ids, query_weights, upper_bounds = term_ids[keep], query_weights[keep], upper_bounds[keep]
+    # remaining[i] = suma de cotas de los términos i, i+1, ...
+    remaining = np.concatenate([np.cumsum(upper_bounds[::-1])[::-1], [0.0]])
+
+    cand_docs = np.empty(0, dtype=np.int64)
+    cand_scores = np.empty(0, dtype=np.float64)
+    threshold = -np.inf
+    stats = {"postings_total": int(sum(indptr[t + 1] - indptr[t] for t in term_ids)), "postings_scored": 0}
+
+    for i, (term_id, q_weight) in enumerate(zip(term_ids, query_weights)):
+        start, end = indptr[term_id], indptr[term_id + 1]
+        docs = indices[start:end]
+
+        if len(cand_docs) == 0:
+            # Primer término: sus postings son los candidatos iniciales
+            cand_docs = docs.astype(np.int64)
+            cand_scores = q_weight * data[start:end]
+            stats["postings_scored"] += int(end - start)
+        elif remaining[i] >= threshold:
+            # Fase esencial: los documentos nuevos todavía pueden entrar al top-k
+            # (mezcla de dos listas ordenadas: se suman los existentes y se insertan los nuevos)
+            weights = q_weight * data[start:end]
+            positions = np.searchsorted(cand_docs, docs)
+            found = positions < len(cand_docs)
+            found[found] = cand_docs[positions[found]] == docs[found]
+            cand_scores[positions[found]] += weights[found]
+            new = ~found
+            cand_docs = np.insert(cand_docs, positions[new], docs[new])
+            cand_scores = np.insert(cand_scores, positions[new], weights[new])
+            stats["postings_scored"] += int(end - start)
+        else:
+            # Fase no esencial: solo se completan los candidatos saltando dentro de las postings
+            positions = np.searchsorted(docs, cand_docs)
+            positions[positions == len(docs)] = 0
+            found = docs[positions] == cand_docs if len(docs) else np.zeros(len(cand_docs), dtype=bool)
+            cand_scores[found] += q_weight * data[start:end][positions[found]]
+            stats["postings_scored"] += int(min(len(cand_docs), end - start))
+
+        # Actualizar el umbral y descartar candidatos que ya no pueden alcanzar el top-k
+        if len(cand_scores) >= k:
+            threshold = max(threshold, np.partition(cand_scores, len(cand_scores) - k)[len(cand_scores) - k])
+            alive = cand_scores + remaining[i + 1] >= threshold
+            cand_docs, cand_scores = cand_docs[alive], cand_scores[alive]
+
+    stats["candidates"] = int(len(cand_docs))
+    count("search.postings_touched", stats["postings_scored"])
+    count("search.postings_skipped", stats["postings_total"] - stats["postings_scored"])
+    top, top_scores = top_k_indices(cand_scores, k)
+    return cand_docs[top], top_scores, stats
+
+@execute_time
+def compute_bm25_scores_pruned(bm25_model, query_tokens, k=5, documents=None, document_ids=None, return_frame=True):
+    """
+    Top-k BM25 exacto con poda MaxScore sobre las postings del modelo.
+
+    Parámetros:
+        bm25_model (SparseBM25): Modelo BM25 previamente entrenado.
+        query_tokens (list[str]): Consulta tokenizada.
+        k (int): Número de resultados a retornar.
+        documents (list[str] | None): Lista de documentos originales.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+        return_frame (bool): Si es False, retorna (índices, puntajes, estadísticas).
+
+    Retorna:
+        pd.DataFrame | tuple: Resultados ordenados por puntaje, o la tupla (índices, puntajes, estadísticas).
+    """
+    term_ids, query_tf = bm25_model.query_terms(query_tokens)
+    indices, scores, stats = max_score_search(bm25_model.weights, bm25_model.max_scores, term_ids, query_tf, k)
+    if not return_frame:
+        return indices, scores, stats
+    return build_results_frame(indices, scores, documents, document_ids)
+
+@execute_time
+def compute_cosine_similarity_pruned(postings, max_scores, query_vector, k=5, documents=None, document_ids=None,
+                                     return_frame=True):
+    """
+    Top-k por similitud coseno exacto con poda MaxScore. Asume filas TF-IDF normalizadas en L2.
+
+    Parámetros:
+        postings (csc_matrix): Matriz TF-IDF en formato CSC con índices ordenados.
+        max_scores (np.ndarray): Peso máximo de cada término (ver build_max_scores).
+        query_vector (sparse matrix): Vector TF-IDF de la consulta.
+        k (int): Número de resultados a retornar.
+        documents (list[str] | None): Lista de documentos originales.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+        return_frame (bool): Si es False, retorna (índices, puntajes, estadísticas).
+
+    Retorna:
+        pd.DataFrame | tuple: Resultados ordenados por similitud, o la tupla (índices, puntajes, estadísticas).
+    """
+    query_vector = query_vector.tocsr()
+    indices, scores, stats = max_score_search(postings, max_scores, query_vector.indices, query_vector.data, k)
+    if not return_frame:
+        return indices, scores, stats
+    return build_results_frame(indices, scores, documents, document_ids)
+
+def _exhaustive_search(postings, term_ids, query_weights, k):
+    """
+    Top-k sin poda: acumula todas las postings de la consulta. Es el respaldo de max_score_search
+    cuando algún término aporta puntajes negativos y las cotas dejan de ser válidas.
+
+    Retorna:
+        tuple: Igual que max_score_search (solo documentos con puntaje positivo).
+    """
+    docs, weights = _gather_postings(postings, term_ids, query_weights)
+    candidates, inverse = np.unique(docs, return_inverse=True)
+    scores = np.bincount(inverse, weights=weights, minlength=len(candidates)).astype(np.float64, copy=False)
+    positive = scores > 0
+    candidates, scores = candidates[positive], scores[positive]
+    stats = {"postings_total": int(len(docs)), "postings_scored": int(len(docs)), "candidates": int(len(candidates))}
+    count("search.maxscore.exhaustive")
+    count("search.postings_touched", stats["postings_scored"])
+    top, top_scores = top_k_indices(scores, k)
+    return candidates[top], top_scores, stats
+
+def _gather_postings(postings, term_ids, query_weights):
+    """
+    Concatena las postings de los términos de una consulta, ponderadas por el peso de cada término.
+
+    Parámetros:
+        postings (csc_matrix): Matriz de pesos (documentos x términos).
+        term_ids (np.ndarray): Columnas de los términos de la consulta.
+        query_weights (np.ndarray): Peso de cada término en la consulta.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Documento de cada posting (con repeticiones entre términos).
+            - np.ndarray: Peso de cada posting multiplicado por el peso del término en la consulta.
+    """
+    indptr, indices, data = postings.indptr, postings.indices, postings.data
+    docs = [indices[indptr[t]:indptr[t + 1]] for t in term_ids]
+    weights = [w * data[indptr[t]:indptr[t + 1]] for t, w in zip(term_ids, query_weights)]
+    if not docs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(docs).astype(np.int64, copy=False), np.concatenate(weights)
+
+def fuse_scores(bm25_scores, tfidf_scores, fusion="weighted", alpha=HYBRID_ALPHA, rrf_k=RRF_K,
+                rrf_depth=RRF_DEPTH):
+    """
+    Combina los puntajes BM25 y TF-IDF de un mismo conjunto de documentos.
+
+    'weighted' normaliza cada modelo dividiendo por su puntaje máximo (los documentos que el modelo
+    no recupera valen 0) y suma alpha * BM25 + (1 - alpha) * TF-IDF. 'rrf' suma 1 / (rrf_k + rango)
+    de cada documento en el top-rrf_depth de cada modelo.
+
+    Parámetros:
+        bm25_scores (np.ndarray): Puntajes BM25.
+        tfidf_scores (np.ndarray): Similitudes TF-IDF de los mismos documentos.
+        fusion (str): Modo de fusión ('weighted' o 'rrf').
+        alpha (float): Peso de BM25 en la fusión ponderada.
+        rrf_k (int): Constante de suavizado de la fusión por rango recíproco.
+        rrf_depth (int): Profundidad de las listas que entran a la fusión por rango recíproco.
+
+    Retorna:
+        np.ndarray: Puntaje fusionado de cada documento.
+
+    Lanza:
+        ValueError: Si el modo de fusión no existe.
+    """
+    if fusion == "weighted":
+        fused = np.zeros(len(bm25_scores))
+        for weight, scores in ((alpha, bm25_scores), (1.0 - alpha, tfidf_scores)):
+            max_score = scores.max() if len(scores) else 0.0
+            if max_score > 0:
+                fused += weight / max_score * scores
+        return fused
+    if fusion == "rrf":
+        fused = np.zeros(len(bm25_scores))
+        for scores in (bm25_scores, tfidf_scores):
+            ranked, ranked_scores = top_k_indices(scores, rrf_depth)
+            # Solo cuentan los documentos que el modelo realmente recupera
+            ranked = ranked[ranked_scores > 0]
+            fused[ranked] += 1.0 / (rrf_k + np.arange(1, len(ranked) + 1))
+        return fused
+    raise ValueError(f"Modo de fusión desconocido: {fusion} (use uno de {FUSION_MODES})")
+
+@timed("search.hybrid")
+def hybrid_search(bm25_model, tfidf_postings, query_vector, query_tokens, k, fusion="weighted",
+                  alpha=HYBRID_ALPHA, rrf_k=RRF_K, rrf_depth=RRF_DEPTH):
+    """
+    Top-k híbrido BM25 + TF-IDF con una sola pasada sobre las postings de la consulta.
+
+    Las postings de ambos modelos se concatenan y se agrupan por documento una sola vez; los dos
+    puntajes se acumulan sobre ese mismo conjunto de candidatos (los documentos que contienen
+    algún término de la consulta), sin recorrer el corpus completo. Los vocabularios de ambos
+    modelos son independientes: cada uno aporta las postings de sus propios términos.
+
+    Parámetros:
+        bm25_model (SparseBM25): Modelo BM25 previamente entrenado.
+        tfidf_postings (csc_matrix): Matriz TF-IDF en CSC con filas normalizadas en L2.
+        query_vector (sparse matrix): Vector TF-IDF de la consulta (normalizado en L2).
+        query_tokens (list[str]): Consulta tokenizada (lemas), para BM25.
+        k (int): Número de documentos a retornar.
+        fusion, alpha, rrf_k, rrf_depth: Configuración de la fusión (ver fuse_scores).
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de los documentos ordenados de mayor a menor puntaje fusionado.
+            - np.ndarray: Puntajes fusionados correspondientes.
+            - dict: Estadísticas: postings recorridas y candidatos.
+    """
+    query_vector = query_vector.tocsr()
+    bm25_docs, bm25_weights = _gather_postings(bm25_model.weights, *bm25_model.query_terms(query_tokens))
+    tfidf_docs, tfidf_weights = _gather_postings(tfidf_postings, query_vector.indices, query_vector.data)
+
+    # Candidatos: unión de las postings de ambos modelos, agrupada por documento en una sola pasada
+    candidates, inverse = np.unique(np.concatenate([bm25_docs, tfidf_docs]), return_inverse=True)
+    split = len(bm25_docs)
+    bm25_scores = np.bincount(inverse[:split], weights=bm25_weights, minlength=len(candidates))
+    tfidf_scores = np.bincount(inverse[split:], weights=tfidf_weights, minlength=len(candidates))
+
+    fused = fuse_scores(bm25_scores, tfidf_scores, fusion, alpha, rrf_k, rrf_depth)
+    stats = {"postings_total": int(len(inverse)), "candidates": int(len(candidates))}
+    count("search.postings_touched", stats["postings_total"])
+    count("search.documents_scored", stats["candidates"])
+    top, top_scores = top_k_indices(fused, k)
+    return candidates[top], top_scores, stats
+
+@execute_time
+def compute_hybrid_scores(bm25_model, tfidf_postings, query_vector, query_tokens, k=5, fusion="weighted",
+                          alpha=HYBRID_ALPHA, rrf_k=RRF_K, rrf_depth=RRF_DEPTH, documents=None,
+                          document_ids=None, return_frame=True):
+    """
+    Recuperación híbrida BM25 + TF-IDF con fusión configurable (ver hybrid_search).
+
+    Parámetros:
+        bm25_model (SparseBM25): Modelo BM25 previamente entrenado.
+        tfidf_postings (csc_matrix): Matriz TF-IDF en CSC (por ejemplo, SparseTfidf.postings).
+        query_vector (sparse matrix): Vector TF-IDF de la consulta.
+        query_tokens (list[str]): Consulta tokenizada.
+        k (int): Número de resultados a retornar.
+        fusion (str): 'weighted' (puntajes normalizados ponderados) o 'rrf' (rango recíproco).
+        alpha (float): Peso de BM25 en la fusión ponderada.
+        rrf_k (int): Constante de suavizado de la fusión por rango recíproco.
+        rrf_depth (int): Profundidad de las listas que entran a la fusión por rango recíproco.
+        documents (list[str] | None): Lista de documentos originales.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+        return_frame (bool): Si es False, retorna (índices, puntajes, estadísticas).
+
+    Retorna:
+        pd.DataFrame | tuple: Resultados ordenados por puntaje fusionado, o la tupla (índices, puntajes, estadísticas).
+    """
+    indices, scores, stats = hybrid_search(
+        bm25_model, tfidf_postings, query_vector, query_tokens, k, fusion, alpha, rrf_k, rrf_depth)
+    if not return_frame:
+        return indices, scores, stats
+    return build_results_frame(indices, scores, documents, document_ids)
+
+@timed("search.tiered")
+def tiered_search(tier, postings, max_scores, term_ids, query_weights, k, exact=True):
+    """
+    Top-k que consulta primero el nivel de campeones y recurre a las postings completas solo si hace falta.
+
+    Los candidatos son los documentos que aparecen en las listas de campeones de algún término de
+    la consulta; sus puntajes se calculan de forma exacta buscándolos en las postings completas.
+    Un documento fuera de los candidatos no es campeón de ningún término, por lo que su puntaje no
+    supera la suma de las cotas del resto. Si el k-ésimo puntaje de los candidatos supera
+    estrictamente esa cota, el top-k es exacto; si no (o si los candidatos no llenan el top-k), se
+    ejecuta MaxScore sobre las postings completas. Con un empate exacto se recurre también a las
+    postings completas, porque un documento de fuera con menor índice ganaría el desempate.
+    Como max_score_search, asume pesos no negativos; si algún término de la consulta resta
+    puntaje, las cotas del primer nivel no valen y siempre se recurre a las postings completas.
+
+    Parámetros:
+        tier (ChampionTier): Primer nivel construido sobre las mismas postings.
+        postings (csc_matrix): Matriz de pesos completa (documentos x términos) con índices ordenados.
+        max_scores (np.ndarray): Peso máximo de cada término (ver build_max_scores).
+        term_ids (np.ndarray): Columnas de los términos de la consulta.
+        query_weights (np.ndarray): Peso de cada término en la consulta.
+        k (int): Número de documentos a retornar.
+        exact (bool): Si es False, el resultado del primer nivel se acepta aunque no esté
+                      garantizado, y solo se recurre a las postings completas si no llena el top-k.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de los documentos ordenados de mayor a menor puntaje.
+            - np.ndarray: Puntajes correspondientes.
+            - dict: Estadísticas: postings totales y evaluadas, candidatos, si el primer nivel
+                    garantizó el resultado, si hubo respaldo y el top-k del primer nivel ('tier_docs').
+    """
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    query_weights = np.asarray(query_weights, dtype=np.float64)
+    indptr, indices, data = postings.indptr, postings.indices, postings.data
+
+    # Los términos sin resto tienen todas sus postings en el primer nivel: su aporte ya es exacto
+    complete = tier.remainder[term_ids] <= 0
+    complete_docs, complete_weights = _gather_postings(tier.postings, term_ids[complete], query_weights[complete])
+    partial_docs, _ = _gather_postings(tier.postings, term_ids[~complete], query_weights[~complete])
+    candidates, inverse = np.unique(np.concatenate([complete_docs, partial_docs]), return_inverse=True)
+    scores = np.bincount(inverse[:len(complete_docs)], weights=complete_weights,
+                         minlength=len(candidates)).astype(np.float64, copy=False)
+    postings_scored = len(inverse)
+    # Puntaje exacto de los candidatos para el resto de los términos: cada candidato se busca en
+    # las postings completas del término
+    for term_id, q_weight in zip(term_ids[~complete], query_weights[~complete]):
+        start, end = indptr[term_id], indptr[term_id + 1]
+        docs = indices[start:end]
+        if not len(docs) or not len(candidates):
+            continue
+        positions = np.searchsorted(docs, candidates)
+        positions[positions == len(docs)] = 0
+        found = docs[positions] == candidates
+        scores[found] += q_weight * data[start:end][positions[found]]
+        postings_scored += int(min(len(candidates), end - start))
+
+    top, top_scores = top_k_indices(scores, k)
+    # Igual que en max_score_search, solo cuentan los documentos con puntaje positivo (un término
+    # con idf nulo aporta campeones con peso cero)
+    positive = top_scores > 0
+    top, top_scores = top[positive], top_scores[positive]
+    result_docs = candidates[top]
+    # Cota de los documentos que no son campeones de ningún término de la consulta
+    outside_bound = float(np.dot(query_weights, tier.remainder[term_ids])) if len(term_ids) else 0.0
+    filled = len(top) >= k
+    # Con aportes negativos las cotas no acotan nada: el resultado del primer nivel no sirve
+    negative = bool(np.any(query_weights * max_scores[term_ids] < 0))
+    guaranteed = not negative and (outside_bound <= 0 or (filled and top_scores[-1] > outside_bound))
+
+    stats = {
+        "postings_total": int(sum(indptr[t + 1] - indptr[t] for t in term_ids)),
+        "candidates": int(len(candidates)),
+        "guaranteed": bool(guaranteed),
+        "fallback": False,
+        "tier_docs": result_docs,
+    }
+    count("search.tier.queries")
+    count("search.postings_touched", postings_scored)
+    if not guaranteed and (exact or not filled or negative):
+        # Respaldo: MaxScore sobre las postings completas (registra sus propias postings recorridas)
+        stats["fallback"] = True
+        count("search.tier.fallbacks")
+        result_docs, top_scores, full_stats = max_score_search(postings, max_scores, term_ids, query_weights, k)
+        postings_scored += full_stats["postings_scored"]
+    stats["postings_scored"] = int(postings_scored)
+    return result_docs, top_scores, stats
+
+@execute_time
+def compute_bm25_scores_tiered(bm25_model, tier, query_tokens, k=5, exact=True, documents=None, document_ids=None,
+                               return_frame=True):
+    """
+    Top-k BM25 consultando primero el nivel de campeones (ver tiered_search).
+
+    Parámetros:
+        bm25_model (SparseBM25): Modelo BM25 previamente entrenado.
+        tier (ChampionTier): Primer nivel construido sobre bm25_model.weights.
+        query_tokens (list[str]): Consulta tokenizada.
+        k (int): Número de resultados a retornar.
+        exact (bool): Si es False, acepta el resultado del primer nivel aunque no esté garantizado.
+        documents (list[str] | None): Lista de documentos originales.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+        return_frame (bool): Si es False, retorna (índices, puntajes, estadísticas).
+
+    Retorna:
+        pd.DataFrame | tuple: Resultados ordenados por puntaje, o la tupla (índices, puntajes, estadísticas).
+    """
+    term_ids, query_tf = bm25_model.query_terms(query_tokens)
+    indices, scores, stats = tiered_search(
+        tier, bm25_model.weights, bm25_model.max_scores, term_ids, query_tf, k, exact)
+    if not return_frame:
+        return indices, scores, stats
+    return build_results_frame(indices, scores, documents, document_ids)
+
+@execute_time
+def compute_cosine_similarity_tiered(postings, max_scores, tier, query_vector, k=5, exact=True, documents=None,
+                                     document_ids=None, return_frame=True):
+    """
+    Top-k por similitud coseno consultando primero el nivel de campeones. Asume filas TF-IDF
+    normalizadas en L2.
+
+    Parámetros:
+        postings (csc_matrix): Matriz TF-IDF en formato CSC con índices ordenados.
+        max_scores (np.ndarray): Peso máximo de cada término (ver build_max_scores).
+        tier (ChampionTier): Primer nivel construido sobre las mismas postings.
+        query_vector (sparse matrix): Vector TF-IDF de la consulta.
+        k (int): Número de resultados a retornar.
+        exact (bool): Si es False, acepta el resultado del primer nivel aunque no esté garantizado.
+        documents (list[str] | None): Lista de documentos originales.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+        return_frame (bool): Si es False, retorna (índices, puntajes, estadísticas).
+
+    Retorna:
+        pd.DataFrame | tuple: Resultados ordenados por similitud, o la tupla (índices, puntajes, estadísticas).
+    """
+    query_vector = query_vector.tocsr()
+    indices, scores, stats = tiered_search(
+        tier, postings, max_scores, query_vector.indices, query_vector.data, k, exact)
+    if not return_frame:
+        return indices, scores, stats
+    return build_results_frame(indices, scores, documents, document_ids)
@@ -1,9 +1,9 @@
-from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from src.instrumentation import count, stage, timed
 from src.perf_metrics import execute_time
-import pandas as pd
 import numpy as np
-from rank_bm25 import BM25Okapi
+import re
+from collections.abc import Mapping
+from scipy.sparse import csc_matrix, csr_matrix
 
 
 def build_tf_matrix(data):
@@ -15,9 +15,14 @@ def build_tf_matrix(data):
 
     Retorna:
         tuple:
-            - pd.DataFrame: Matriz TF con frecuencia de cada término por documento.
+            - pd.DataFrame: Matriz TF dispersa (columnas SparseDtype) con la frecuencia de cada
+                            término por documento.
             - CountVectorizer: Vectorizador utilizado para construir la matriz.
     """
+    # scikit-learn y pandas solo se importan al construir desde texto (no al consultar un índice)
+    import pandas as pd
+    from sklearn.feature_extraction.text import CountVectorizer
+
     # Verificar si data es un DataFrame y convertirlo a lista si es necesario
     if isinstance(data, pd.DataFrame):
         data = data.iloc[:, 0].tolist()
@@ -26,9 +31,9 @@ def build_tf_matrix(data):
     vectorizer = CountVectorizer()
     X_counts = vectorizer.fit_transform(data)
 
-    # Se obtienen los términos y se crea el DataFrame de salida
+    # Se obtienen los términos y se crea el DataFrame de salida sin densificar la matriz
     terms = vectorizer.get_feature_names_out()
-    tf_df = pd.DataFrame(X_counts.toarray(), columns=terms)
+    tf_df = pd.DataFrame.sparse.from_spmatrix(X_counts, columns=terms)
 
     return tf_df, vectorizer
 
@@ -44,6 +49,9 @@ def build_tf_idf_matrix(data):
             - sparse matrix: Matriz TF-IDF en formato disperso.
             - TfidfVectorizer: Vectorizador utilizado.
     """
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
     # Si se recibe un DataFrame, se convierte en lista de texto
     if isinstance(data, pd.DataFrame):
         data = data.iloc[:, 0].tolist()
@@ -55,26 +63,145 @@ def build_tf_idf_matrix(data):
     # No convertir a DataFrame denso
     return X_tfidf, tfidf_vectorizer
 
+class InvertedIndexView(Mapping):
+    """
+    Índice invertido de solo lectura sobre las postings CSC de la matriz TF-IDF.
+
+    No guarda una copia de las postings: cada término se resuelve como la porción
+    indptr[t]:indptr[t + 1] de la matriz (las mismas postings que usan los motores de búsqueda),
+    por lo que no ocupa memoria adicional fuera del vocabulario. Se comporta como un diccionario
+    {término: [índices de documentos]}.
+
+    Atributos:
+        terms (np.ndarray): Términos del vocabulario ordenados por columna.
+        matrix (csc_matrix): Postings (documentos x términos) con índices ordenados.
+    """
+
+    def __init__(self, terms, matrix):
+        self.terms = np.asarray(terms, dtype=object)
+        self.term_ids = {term: i for i, term in enumerate(self.terms.tolist())}
+        self.matrix = matrix
+
+    def postings(self, term_id):
+        """
+        Retorna las postings de un término.
+
+        Parámetros:
+            term_id (int): Columna del término.
+
+        Retorna:
+            tuple:
+                - np.ndarray: Índices de documentos en orden creciente.
+                - np.ndarray: Peso de cada posting.
+        """
+        start, end = self.matrix.indptr[term_id], self.matrix.indptr[term_id + 1]
+        return self.matrix.indices[start:end], self.matrix.data[start:end]
+
+    def __getitem__(self, term):
+        return self.postings(self.term_ids[term])[0].tolist()
+
+    def __iter__(self):
+        return iter(self.terms.tolist())
+
+    def __len__(self):
+        return len(self.terms)
+
 def build_inverted_index(tfidf_matrix, tfidf_vectorizer):
     """
     Construye un índice invertido a partir de la matriz TF-IDF y el vectorizador.
 
     Parámetros:
-        tfidf_matrix (sparse matrix): Matriz TF-IDF.
+        tfidf_matrix (sparse matrix): Matriz TF-IDF. Si ya está en CSC con índices ordenados
+                                      (por ejemplo, SparseTfidf.postings) no se copia.
         tfidf_vectorizer (TfidfVectorizer): Vectorizador entrenado.
 
     Retorna:
-        dict: Índice invertido {término: [índices de documentos]}
+        InvertedIndexView: Índice invertido {término: [índices de documentos]}
     """
     terms = tfidf_vectorizer.get_feature_names_out()
-    inverted_index = {}
-    matrix = tfidf_matrix.tocsc()  # Para acceso eficiente por columna
+    matrix = csc_matrix(tfidf_matrix)  # Para acceso eficiente por columna
+    if not matrix.has_sorted_indices:
+        matrix = matrix.sorted_indices()
+    return InvertedIndexView(terms, matrix)
 
-    for term_idx, term in enumerate(terms):
-        doc_indices = matrix[:, term_idx].nonzero()[0]
-        inverted_index[term] = doc_indices.tolist()
-    return inverted_index
+def build_max_scores(matrix):
+    """
+    Calcula la cota superior (peso máximo) de cada término sobre todas sus postings.
 
+    Parámetros:
+        matrix (sparse matrix): Matriz de pesos (documentos x términos).
+
+    Retorna:
+        np.ndarray: Peso máximo de cada columna (0 para términos sin postings).
+    """
+    matrix = csc_matrix(matrix)
+    lengths = np.diff(matrix.indptr)
+    nonempty = lengths > 0
+    max_scores = np.zeros(matrix.shape[1], dtype=np.float64)
+    if matrix.nnz:
+        max_scores[nonempty] = np.maximum.reduceat(matrix.data, matrix.indptr[:-1][nonempty])
+    return max_scores
+
+class ChampionTier:
+    """
+    Primer nivel del índice: listas de campeones con las r postings de mayor peso de cada término.
+
+    Como el top-k de una consulta suele salir de los documentos con mayor peso en sus términos,
+    las consultas recorren primero estas listas cortas. Para cada término se guarda además la
+    cota del resto (el mayor peso fuera de sus campeones), que permite verificar si el top-k
+    obtenido desde el primer nivel es exacto o si hay que recurrir a las postings completas.
+
+    Parámetros:
+        matrix (sparse matrix): Matriz de pesos (documentos x términos), por ejemplo las postings
+                                TF-IDF o SparseBM25.weights.
+        size (int): Número r de campeones por término.
+
+    Atributos:
+        postings (csc_matrix): Postings de los campeones (documentos x términos) con índices ordenados.
+        remainder (np.ndarray): Peso máximo de cada término fuera de sus campeones (0 si no hay resto).
+        size (int): Número de campeones por término.
+    """
+
+    def __init__(self, matrix, size):
+        matrix = csc_matrix(matrix)
+        lengths = np.diff(matrix.indptr)
+        columns = np.repeat(np.arange(matrix.shape[1]), lengths)
+        # Postings de cada término de mayor a menor peso (lexsort es estable: ante empate, menor documento)
+        order = np.lexsort((-matrix.data, columns))
+        ranks = np.arange(matrix.nnz) - np.repeat(matrix.indptr[:-1], lengths)
+        champions = order[ranks < size]
+
+        self.remainder = np.zeros(matrix.shape[1], dtype=np.float64)
+        # El primer peso fuera de los campeones es la cota del resto del término
+        overflow = lengths > size
+        self.remainder[overflow] = matrix.data[order[matrix.indptr[:-1][overflow] + size]]
+
+        postings = csc_matrix(
+            (matrix.data[champions], (matrix.indices[champions], columns[champions])), shape=matrix.shape)
+        postings.sort_indices()
+        self.postings = postings
+        self.size = int(size)
+
+    @classmethod
+    def from_arrays(cls, postings, remainder, size):
+        """
+        Reconstruye el primer nivel a partir de arreglos ya calculados (por ejemplo, cargados de disco).
+
+        Parámetros:
+            postings (csc_matrix): Postings de los campeones con índices ordenados.
+            remainder (np.ndarray): Cota del resto de cada término.
+            size (int): Número de campeones por término.
+
+        Retorna:
+            ChampionTier: Primer nivel listo para consultar.
+        """
+        tier = cls.__new__(cls)
+        tier.postings = postings
+        tier.remainder = remainder
+        tier.size = int(size)
+        return tier
+
+@timed("search.vectorize")
 def query_vectorizer(query, vectorizer):
     """
     Vectoriza una consulta usando un vectorizador previamente entrenado.
@@ -88,69 +215,700 @@ def query_vectorizer(query, vectorizer):
     """
     return vectorizer.transform([query])
 
+def _weight_tf_idf(counts, idf, sublinear_tf=False, norm="l2"):
+    """
+    Pondera una matriz de conteos por idf y normaliza sus filas, igual que TfidfTransformer.
+
+    Parámetros:
+        counts (csr_matrix): Matriz de frecuencias de término (filas x términos).
+        idf (np.ndarray): idf de cada término.
+        sublinear_tf (bool): Si es True, usa 1 + log(tf) en lugar del tf crudo.
+        norm (str | None): 'l2', 'l1' o None (sin normalizar).
+
+    Retorna:
+        csr_matrix: Matriz TF-IDF.
+    """
+    X = csr_matrix(counts, dtype=np.float64)
+    if sublinear_tf:
+        np.log(X.data, out=X.data)
+        X.data += 1
+    X.data *= idf[X.indices]
+
+    if norm == "l2":
+        row_norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    elif norm == "l1":
+        row_norms = np.asarray(abs(X).sum(axis=1)).ravel()
+    elif norm is None:
+        return X
+    else:
+        raise ValueError(f"Norma desconocida: {norm}")
+    row_norms[row_norms == 0] = 1.0
+    X.data /= np.repeat(row_norms, np.diff(X.indptr))
+    return X
+
+class TfidfQueryVectorizer:
+    """
+    Vectorizador TF-IDF de solo lectura reconstruido a partir de un vocabulario y un idf guardados.
+
+    Reproduce TfidfVectorizer.transform (minúsculas, mismo patrón de tokens, tf crudo o sublineal
+    multiplicado por idf y normalización de filas) sin necesidad de reentrenar ni de importar
+    scikit-learn.
+
+    Atributos:
+        vocabulary_ (dict[str, int]): Vocabulario {término: columna}.
+        idf_ (np.ndarray): idf de cada término.
+        sublinear_tf (bool): Si se usa 1 + log(tf).
+        norm (str | None): Normalización de las filas ('l2', 'l1' o None).
+    """
+
+    token_pattern = re.compile(r"(?u)\b\w\w+\b")
+
+    def __init__(self, terms, idf, sublinear_tf=False, norm="l2"):
+        self._terms = np.asarray(terms, dtype=object)
+        self.vocabulary_ = {term: i for i, term in enumerate(self._terms.tolist())}
+        self.idf_ = np.asarray(idf, dtype=np.float64)
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+
+    def get_feature_names_out(self):
+        """
+        Retorna:
+            np.ndarray: Términos del vocabulario ordenados por columna.
+        """
+        return self._terms
+
+    def transform(self, raw_documents):
+        """
+        Vectoriza una lista de textos con el vocabulario y el idf almacenados.
+
+        Parámetros:
+            raw_documents (list[str]): Textos a vectorizar.
+
+        Retorna:
+            csr_matrix: Matriz TF-IDF (textos x términos), normalizada según norm.
+        """
+        token_docs = (self.token_pattern.findall(text.lower()) for text in raw_documents)
+        counts, _ = build_count_matrix(token_docs, vocabulary=self.vocabulary_)
+        return _weight_tf_idf(counts, self.idf_, self.sublinear_tf, self.norm)
+
+@timed("search.top_k")
+def top_k_indices(scores, k=None):
+    """
+    Selecciona los k documentos con mayor puntaje usando selección parcial (argpartition).
+
+    Solo los k ganadores se ordenan; los empates se resuelven por índice de documento, también
+    en el límite del top-k (entre los empatados con el k-ésimo puntaje entran los de menor índice).
+
+    Parámetros:
+        scores (np.ndarray): Puntaje de cada documento.
+        k (int | None): Número de documentos a retornar. Si es None, se ordena todo el corpus.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de los documentos ordenados de mayor a menor puntaje.
+            - np.ndarray: Puntajes correspondientes.
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    if k is None or k >= n:
+        candidates = np.arange(n)
+    elif k <= 0:
+        candidates = np.arange(0)
+    else:
+        # Puntaje del k-ésimo: entran todos los mayores y, de los empatados con él, los de menor índice
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+
+    # Ordenar solo los candidatos: mayor puntaje primero y, ante empate, menor índice
+    order = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return order, scores[order]
+
+@timed("search.materialize")
+def build_results_frame(indices, scores, documents=None, document_ids=None):
+    """
+    Construye el DataFrame de resultados materializando texto e IDs solo para los documentos dados.
+
+    Parámetros:
+        indices (np.ndarray): Índices de los documentos recuperados, en orden de ranking.
+        scores (np.ndarray): Puntajes correspondientes.
+        documents (list[str] | CorpusStore | None): Documentos originales, indexables por fila.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+
+    Retorna:
+        pd.DataFrame: Resultados indexados por el índice del documento, con columnas 'Index',
+                      'Similarity' y, si se proporcionan, 'Document' y 'DocId'.
+    """
+    # pandas solo se importa cuando se pide el DataFrame de resultados
+    import pandas as pd
+    results_df = pd.DataFrame({"Index": indices, "Similarity": scores}, index=indices)
+    if documents is not None:
+        results_df["Document"] = [documents[i] for i in indices]
+    if document_ids is not None:
+        results_df["DocId"] = [document_ids[i] for i in indices]
+    return results_df
+
+def normalize_rows(matrix):
+    """
+    Normaliza en L2 las filas de una matriz dispersa (las filas vacías quedan en cero).
+
+    Parámetros:
+        matrix (sparse matrix): Matriz (documentos x términos).
+
+    Retorna:
+        csr_matrix: Copia de la matriz con filas de norma 1.
+    """
+    X = csr_matrix(matrix, dtype=np.float64, copy=True)
+    row_norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    row_norms[row_norms == 0] = 1.0
+    X.data /= np.repeat(row_norms, np.diff(X.indptr))
+    return X
+
+class SparseTfidf:
+    """
+    Motor de similitud coseno sobre postings TF-IDF dispersas con filas pre-normalizadas.
+
+    Las filas se normalizan en L2 una sola vez al construir el motor y se guardan en formato CSC,
+    de modo que la similitud coseno de una consulta es un producto punto que solo recorre las
+    postings de sus términos: el costo depende de las postings de la consulta y no del tamaño
+    del corpus por el vocabulario.
+
+    Parámetros:
+        matrix (sparse matrix): Matriz TF-IDF o TF (documentos x términos).
+        normalize (bool): Si es False, asume que las filas ya están normalizadas en L2
+                          (como las de TfidfVectorizer o las del índice guardado).
+
+    Atributos:
+        postings (csc_matrix): Pesos normalizados (documentos x términos) con índices ordenados.
+        max_scores (np.ndarray): Peso máximo de cada término, para la poda MaxScore.
+        num_docs (int): Número de documentos.
+    """
+
+    def __init__(self, matrix, normalize=True):
+        X = normalize_rows(matrix) if normalize else csr_matrix(matrix, dtype=np.float64)
+        postings = X.tocsc()
+        postings.sort_indices()
+        self.postings = postings
+        self.max_scores = build_max_scores(postings)
+        self.num_docs = postings.shape[0]
+
+    @classmethod
+    def from_arrays(cls, postings, max_scores):
+        """
+        Reconstruye el motor a partir de sus arreglos ya calculados (por ejemplo, cargados de disco),
+        sin normalizar ni copiar las postings.
+
+        Parámetros:
+            postings (csc_matrix): Pesos normalizados (documentos x términos) con índices ordenados.
+            max_scores (np.ndarray): Peso máximo de cada término.
+
+        Retorna:
+            SparseTfidf: Motor listo para consultar.
+        """
+        engine = cls.__new__(cls)
+        engine.postings = postings
+        engine.max_scores = max_scores
+        engine.num_docs = postings.shape[0]
+        return engine
+
+    def get_scores(self, query_vector):
+        """
+        Calcula la similitud coseno de todos los documentos con una consulta.
+
+        Parámetros:
+            query_vector (sparse matrix): Vector de la consulta (1 x términos).
+
+        Retorna:
+            np.ndarray: Similitud de cada documento (cero si no comparte términos con la consulta).
+        """
+        query_vector = csr_matrix(query_vector)
+        scores = np.zeros(self.num_docs)
+        query_norm = np.sqrt(np.dot(query_vector.data, query_vector.data))
+        if query_norm == 0:
+            return scores
+
+        indptr, indices, data = self.postings.indptr, self.postings.indices, self.postings.data
+        postings = 0
+        # Solo se recorren las postings de los términos presentes en la consulta
+        for term_id, weight in zip(query_vector.indices, query_vector.data / query_norm):
+            start, end = indptr[term_id], indptr[term_id + 1]
+            scores[indices[start:end]] += weight * data[start:end]
+            postings += end - start
+        count("search.postings_touched", postings)
+        return scores
+
 @execute_time
-def compute_cosine_similarity(matrix, query_vector, documents):
+def compute_cosine_similarity(matrix, query_vector, documents=None, k=None, document_ids=None, return_frame=True):
     """
     Calcula la similitud coseno entre una consulta vectorizada y una matriz de documentos.
 
     Parámetros:
-        matrix (sparse matrix): Matriz TF-IDF o TF.
+        matrix (SparseTfidf | sparse matrix): Motor TF-IDF ya construido, o matriz TF-IDF o TF.
+                                              Con una matriz, el motor se construye en cada
+                                              llamada; para consultas repetidas conviene pasar
+                                              un SparseTfidf.
         query_vector (sparse matrix): Vector de la consulta.
-        documents (list[str]): Lista de documentos originales.
+        documents (list[str] | None): Lista de documentos originales.
+        k (int | None): Número de resultados a retornar. Si es None, se ordena todo el corpus.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+        return_frame (bool): Si es False, retorna solo los arreglos de índices y puntajes.
 
     Retorna:
-        pd.DataFrame: Resultados ordenados por similitud, incluyendo los documentos y sus puntajes.
+        pd.DataFrame | tuple[np.ndarray, np.ndarray]: Resultados ordenados por similitud,
+                      incluyendo los documentos y sus puntajes, o la tupla (índices, puntajes).
     """
-    similarities = cosine_similarity(matrix, query_vector).flatten()
+    engine = matrix if isinstance(matrix, SparseTfidf) else SparseTfidf(matrix)
+    with stage("search.tfidf.score"):
+        similarities = engine.get_scores(query_vector)
+    count("search.documents_scored", len(similarities))
+
+    # Selección parcial de los k mejores; el texto solo se materializa para ellos
+    indices, scores = top_k_indices(similarities, k)
+    if not return_frame:
+        return indices, scores
+    return build_results_frame(indices, scores, documents, document_ids)
+
+def build_count_matrix(token_docs, vocabulary=None, extend=False):
+    """
+    Construye la matriz dispersa de conteos (documentos x términos) a partir de documentos tokenizados.
 
-    # Crear DataFrame con índices para mantener referencia al documento original
-    results_df = pd.DataFrame({
-        "Index": range(len(similarities)),
-        "Similarity": similarities
-    })
+    Parámetros:
+        token_docs (Iterable[list[str]]): Documentos tokenizados.
+        vocabulary (dict[str, int] | None): Vocabulario fijo {término: columna}. Si es None,
+                                            se construye uno nuevo ordenado alfabéticamente.
+        extend (bool): Si es True, los términos nuevos se agregan al final del vocabulario dado
+                       (que se modifica) en lugar de descartarse.
 
-    # Ordener los resultados por similitud
-    results_df = results_df.sort_values(by="Similarity", ascending=False)
+    Retorna:
+        tuple:
+            - csr_matrix: Matriz de frecuencias de término por documento.
+            - dict[str, int]: Vocabulario utilizado.
+    """
+    fixed = vocabulary is not None and not extend
+    vocab = {} if vocabulary is None else vocabulary
+    indices = []
+    indptr = [0]
+
+    # Se recorre el corpus una sola vez acumulando los índices de columna de cada token
+    for tokens in token_docs:
+        for token in tokens:
+            idx = vocab.get(token)
+            if idx is None:
+                if fixed:
+                    continue
+                idx = vocab[token] = len(vocab)
+            indices.append(idx)
+        indptr.append(len(indices))
+
+    indices = np.asarray(indices, dtype=np.int32)
+    indptr = np.asarray(indptr, dtype=np.int64)
+
+    # Reordenar el vocabulario alfabéticamente, igual que CountVectorizer
+    if vocabulary is None:
+        terms = sorted(vocab)
+        remap = np.empty(len(terms), dtype=np.int32)
+        for new_idx, term in enumerate(terms):
+            remap[vocab[term]] = new_idx
+        indices = remap[indices] if len(indices) else indices
+        vocab = {term: i for i, term in enumerate(terms)}
+
+    data = np.ones(len(indices), dtype=np.int32)
+    counts = csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(vocab)))
+    counts.sum_duplicates()
+    return counts, vocab
+
+class CountMatrixBuilder:
+    """
+    Acumula la matriz de conteos por lotes, para construir el índice a partir de un flujo de documentos.
 
-    # Agregamos la columna 'Document' accediendo a su índice en la lista original
-    results_df["Document"] = results_df["Index"].map(lambda i: documents[i])
+    Cada lote se convierte de inmediato en una matriz dispersa, de modo que los tokens de los
+    lotes anteriores no se conservan en memoria.
 
-    return results_df
+    Atributos:
+        vocabulary (dict[str, int]): Vocabulario acumulado {término: columna}, en orden de aparición.
+    """
 
-def build_bm25_model(documents):
+    def __init__(self):
+        self.vocabulary = {}
+        self._blocks = []
+
+    def add(self, token_docs):
+        """
+        Agrega un lote de documentos tokenizados.
+
+        Parámetros:
+            token_docs (Iterable[list[str]]): Documentos tokenizados.
+        """
+        counts, _ = build_count_matrix(token_docs, vocabulary=self.vocabulary, extend=True)
+        self._blocks.append(counts)
+
+    def build(self):
+        """
+        Une los lotes en una sola matriz con el vocabulario ordenado alfabéticamente.
+
+        Retorna:
+            tuple:
+                - csr_matrix: Matriz de frecuencias de término por documento.
+                - dict[str, int]: Vocabulario utilizado.
+        """
+        num_terms = len(self.vocabulary)
+        indptr = [np.zeros(1, dtype=np.int64)]
+        indices, data = [], []
+        offset = 0
+        for block in self._blocks:
+            indptr.append(block.indptr[1:].astype(np.int64) + offset)
+            indices.append(block.indices)
+            data.append(block.data)
+            offset += block.nnz
+
+        # Reordenar las columnas alfabéticamente, igual que build_count_matrix
+        terms = sorted(self.vocabulary)
+        remap = np.empty(num_terms, dtype=np.int32)
+        for new_idx, term in enumerate(terms):
+            remap[self.vocabulary[term]] = new_idx
+        indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int32)
+        data = np.concatenate(data) if data else np.empty(0, dtype=np.int32)
+        indptr = np.concatenate(indptr)
+
+        counts = csr_matrix((data, remap[indices], indptr), shape=(len(indptr) - 1, num_terms))
+        counts.sort_indices()
+        return counts, {term: i for i, term in enumerate(terms)}
+
+def build_tf_idf_from_counts(counts, vocabulary, doc_freq=None, num_docs=None, sublinear_tf=False, norm="l2",
+                             min_df=1):
+    """
+    Construye la matriz TF-IDF a partir de una matriz de conteos, con la misma ponderación que
+    TfidfVectorizer (idf suavizado; por defecto tf crudo y normalización L2).
+
+    Parámetros:
+        counts (csr_matrix): Matriz de frecuencias de término por documento.
+        vocabulary (dict[str, int]): Vocabulario {término: columna}.
+        doc_freq (np.ndarray | None): Frecuencia documental de cada término en la colección completa.
+                                      Si es None, se calcula a partir de counts.
+        num_docs (int | None): Número de documentos de la colección completa (junto con doc_freq).
+        sublinear_tf (bool): Si es True, usa 1 + log(tf), como TfidfVectorizer(sublinear_tf=True).
+        norm (str | None): Normalización de las filas: 'l2', 'l1' o None.
+        min_df (int): Los términos presentes en menos de min_df documentos se descartan del vocabulario.
+
+    Retorna:
+        tuple:
+            - csr_matrix: Matriz TF-IDF normalizada.
+            - TfidfQueryVectorizer: Vectorizador para las consultas.
+    """
+    # Con estadísticas globales (por ejemplo, en un fragmento del índice) el idf es el de la colección
+    if doc_freq is None:
+        num_docs = counts.shape[0]
+        doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+    terms = sorted(vocabulary, key=vocabulary.get)
+
+    if min_df > 1:
+        keep = np.flatnonzero(np.asarray(doc_freq) >= min_df)
+        counts = csr_matrix(counts)[:, keep]
+        doc_freq = np.asarray(doc_freq)[keep]
+        terms = [terms[i] for i in keep]
+    idf = np.log((1 + num_docs) / (1 + doc_freq)) + 1
+
+    X = _weight_tf_idf(counts, idf, sublinear_tf, norm)
+    return X, TfidfQueryVectorizer(terms, idf, sublinear_tf, norm)
+
+class SparseBM25:
+    """
+    Modelo BM25 (variante Okapi de rank_bm25) sobre una matriz dispersa precalculada.
+
+    Los pesos idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl)) se calculan una
+    sola vez al construir el modelo y se guardan en formato CSC, de modo que puntuar una consulta
+    solo recorre las listas de postings de sus términos.
+
+    Atributos:
+        vocabulary (dict[str, int]): Vocabulario {término: columna}.
+        weights (csc_matrix): Matriz de pesos BM25 (documentos x términos).
+        idf (np.ndarray): idf de cada término (con el piso epsilon * idf promedio).
+        doc_len (np.ndarray): Longitud en tokens de cada documento.
+        avgdl (float): Longitud promedio de los documentos.
+        k1, b, epsilon (float): Parámetros del modelo.
+        max_scores (np.ndarray): Peso máximo de cada término sobre sus postings.
+
+    Parámetros:
+        counts (csr_matrix): Matriz de frecuencias de término por documento.
+        vocabulary (dict[str, int]): Vocabulario {término: columna}.
+        k1, b, epsilon (float): Parámetros del modelo.
+        doc_freq (np.ndarray | None): Frecuencia documental de cada término en la colección completa.
+        num_docs (int | None): Número de documentos de la colección completa.
+        avgdl (float | None): Longitud promedio de los documentos de la colección completa.
+                              Las tres estadísticas globales se usan al construir un fragmento del
+                              índice; si son None, se calculan a partir de counts.
+    """
+
+    def __init__(self, counts, vocabulary, k1=1.5, b=0.75, epsilon=0.25, doc_freq=None, num_docs=None,
+                 avgdl=None):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocabulary = vocabulary
+        self.corpus_size = counts.shape[0]
+
+        counts = csr_matrix(counts)
+        self.doc_len = np.asarray(counts.sum(axis=1)).ravel().astype(np.float64)
+        self.avgdl = self.doc_len.sum() / self.corpus_size if avgdl is None else avgdl
+
+        # idf de BM25Okapi: los valores negativos se reemplazan por epsilon * idf promedio
+        if doc_freq is None:
+            num_docs = self.corpus_size
+            doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log(num_docs - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        self.average_idf = idf.mean() if len(idf) else 0.0
+        # (con epsilon <= 0 quedan idf no positivos; la poda MaxScore lo detecta y no poda)
+        idf[idf < 0] = self.epsilon * self.average_idf
+        self.idf = idf
+
+        # Peso saturado de cada posting: idf * tf * (k1 + 1) / (tf + k1 * norma_longitud)
+        rows = np.repeat(np.arange(self.corpus_size), np.diff(counts.indptr))
+        tf = counts.data.astype(np.float64)
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_len[rows] / self.avgdl)
+        data = self.idf[counts.indices] * (tf * (self.k1 + 1) / (tf + length_norm))
+
+        weights = csr_matrix((data, counts.indices, counts.indptr), shape=counts.shape).tocsc()
+        weights.sort_indices()
+        self.weights = weights
+        # Cota superior de cada término, usada por la poda dinámica (MaxScore)
+        self.max_scores = build_max_scores(weights)
+
+    @classmethod
+    def from_arrays(cls, weights, vocabulary, idf, doc_len, k1=1.5, b=0.75, epsilon=0.25, average_idf=None,
+                    avgdl=None, max_scores=None):
+        """
+        Reconstruye un modelo a partir de sus arreglos ya calculados (por ejemplo, cargados de disco).
+
+        Parámetros:
+            weights (csc_matrix): Matriz de pesos BM25 (documentos x términos).
+            vocabulary (dict[str, int]): Vocabulario {término: columna}.
+            idf (np.ndarray): idf de cada término.
+            doc_len (np.ndarray): Longitud en tokens de cada documento.
+            k1, b, epsilon (float): Parámetros con los que se calcularon los pesos.
+            average_idf (float | None): idf promedio previo al piso epsilon.
+            avgdl (float | None): Longitud promedio usada en los pesos. Si es None, se calcula a partir de doc_len.
+            max_scores (np.ndarray | None): Peso máximo de cada término. Si es None, se calcula
+                                            recorriendo todas las postings (ver build_max_scores).
+
+        Retorna:
+            SparseBM25: Modelo listo para puntuar, sin recalcular pesos.
+        """
+        model = cls.__new__(cls)
+        model.k1 = k1
+        model.b = b
+        model.epsilon = epsilon
+        model.vocabulary = vocabulary
+        model.weights = weights
+        model.max_scores = build_max_scores(weights) if max_scores is None else max_scores
+        model.idf = idf
+        model.doc_len = doc_len
+        model.corpus_size = weights.shape[0]
+        model.avgdl = float(np.sum(doc_len)) / model.corpus_size if avgdl is None else avgdl
+        model.average_idf = average_idf
+        return model
+
+    def query_terms(self, query_tokens):
+        """
+        Traduce una consulta tokenizada a columnas del vocabulario y su frecuencia en la consulta.
+
+        Parámetros:
+            query_tokens (list[str]): Consulta tokenizada.
+
+        Retorna:
+            tuple:
+                - np.ndarray: Índices de columna de los términos conocidos.
+                - np.ndarray: Frecuencia de cada término dentro de la consulta.
+        """
+        term_counts = {}
+        for token in query_tokens:
+            idx = self.vocabulary.get(token)
+            if idx is not None:
+                term_counts[idx] = term_counts.get(idx, 0) + 1
+        term_ids = np.fromiter(term_counts.keys(), dtype=np.int64, count=len(term_counts))
+        query_tf = np.fromiter(term_counts.values(), dtype=np.float64, count=len(term_counts))
+        return term_ids, query_tf
+
+    def get_scores(self, query_tokens):
+        """
+        Calcula el puntaje BM25 de todos los documentos para una consulta.
+
+        Parámetros:
+            query_tokens (list[str]): Consulta tokenizada.
+
+        Retorna:
+            np.ndarray: Puntaje BM25 por documento.
+        """
+        scores = np.zeros(self.corpus_size)
+        indptr, indices, data = self.weights.indptr, self.weights.indices, self.weights.data
+
+        # Solo se recorren los postings de los términos de la consulta
+        postings = 0
+        with stage("search.bm25.score"):
+            for term_id, qtf in zip(*self.query_terms(query_tokens)):
+                start, end = indptr[term_id], indptr[term_id + 1]
+                scores[indices[start:end]] += qtf * data[start:end]
+                postings += end - start
+        count("search.postings_touched", postings)
+        count("search.documents_scored", self.corpus_size)
+        return scores
+
+def build_bm25_model(documents, k1=1.5, b=0.75, epsilon=0.25):
     """
     Construye un modelo BM25 a partir de una lista de documentos tokenizados.
 
     Parámetros:
         documents (list[list[str]]): Lista de documentos tokenizados (cada documento es una lista de tokens).
+        k1 (float): Parámetro de saturación de la frecuencia de término.
+        b (float): Parámetro de normalización por longitud del documento.
+        epsilon (float): Piso para los idf negativos, como fracción del idf promedio.
 
     Retorna:
-        BM25Okapi: Modelo BM25 entrenado.
+        SparseBM25: Modelo BM25 entrenado.
     """
-    # Se crea el modelo BM25 utilizando el corpus preprocesado
-    bm25 = BM25Okapi(documents)
-    
+    # Se construye la matriz de conteos del corpus preprocesado y sobre ella los pesos BM25
+    counts, vocabulary = build_count_matrix(documents)
+
     #retorna una intancia del modelo BM25 para luego poder extraer el score en funcion de una query
-    return bm25
+    return SparseBM25(counts, vocabulary, k1=k1, b=b, epsilon=epsilon)
 
 @execute_time
-def compute_bm25_scores(bm25_model, query_tokens, documents):
+def compute_bm25_scores(bm25_model, query_tokens, documents=None, k=None, document_ids=None, return_frame=True):
     """
     Calcula los puntajes BM25 para una consulta y devuelve los resultados ordenados.
 
     Parámetros:
-        bm25_model (BM25Okapi): Modelo BM25 previamente entrenado.
+        bm25_model (SparseBM25): Modelo BM25 previamente entrenado.
         query_tokens (list[str]): Consulta tokenizada.
-        documents (list[str]): Lista de documentos originales.
+        documents (list[str] | None): Lista de documentos originales.
+        k (int | None): Número de resultados a retornar. Si es None, se ordena todo el corpus.
+        document_ids (list[str] | None): Lista de IDs de documentos.
+        return_frame (bool): Si es False, retorna solo los arreglos de índices y puntajes.
 
     Retorna:
-        pd.DataFrame: Resultados con columnas 'Document' y 'Similarity', ordenados de mayor a menor.
+        pd.DataFrame | tuple[np.ndarray, np.ndarray]: Resultados con columnas 'Document' y
+                      'Similarity', ordenados de mayor a menor, o la tupla (índices, puntajes).
     """
     scores = bm25_model.get_scores(query_tokens)
 
-    results_df = pd.DataFrame({
-        "Document": documents,
-        "Similarity": scores
-    }).sort_values(by="Similarity", ascending=False)
+    indices, scores = top_k_indices(scores, k)
+    if not return_frame:
+        return indices, scores
+    return build_results_frame(indices, scores, documents, document_ids)
+
+# Presupuesto de memoria (en bytes) para cada bloque denso de puntajes consultas x documentos
+BATCH_MEMORY_BYTES = 256 * 1024 * 1024
+
+def top_k_rows(score_matrix, k):
+    """
+    Selecciona por fila los k mayores puntajes de una matriz densa consultas x documentos.
+
+    Los empates se resuelven por índice de documento, igual que en top_k_indices.
 
-    return results_df
\ No newline at end of file
+    Parámetros:
+        score_matrix (np.ndarray): Matriz de puntajes (consultas x documentos).
+        k (int): Número de documentos a retornar por consulta.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de documentos (consultas x k) ordenados de mayor a menor puntaje.
+            - np.ndarray: Puntajes correspondientes.
+    """
+    n_docs = score_matrix.shape[1]
+    k = min(k, n_docs)
+    if 0 < k < n_docs:
+        # Por fila: todos los mayores que el k-ésimo puntaje y, de los empatados, los de menor índice
+        kth = -np.partition(-score_matrix, k - 1, axis=1)[:, k - 1:k]
+        above = score_matrix > kth
+        ties = score_matrix == kth
+        room = k - above.sum(axis=1, keepdims=True)
+        keep = above | (ties & (np.cumsum(ties, axis=1) <= room))
+        candidates = np.nonzero(keep)[1].reshape(score_matrix.shape[0], k)
+    elif k <= 0:
+        candidates = np.empty((score_matrix.shape[0], 0), dtype=np.int64)
+    else:
+        candidates = np.broadcast_to(np.arange(n_docs), score_matrix.shape)
+    candidate_scores = np.take_along_axis(score_matrix, candidates, axis=1)
+
+    # Ordenar los candidatos de cada fila: mayor puntaje primero y, ante empate, menor índice
+    order = np.lexsort((candidates, -candidate_scores), axis=-1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+def _batch_top_k(query_matrix, term_doc_matrix, k, memory_bytes):
+    """
+    Multiplica las consultas por la matriz términos x documentos en bloques de memoria acotada.
+
+    Parámetros:
+        query_matrix (csr_matrix): Pesos de las consultas (consultas x términos).
+        term_doc_matrix (csr_matrix): Pesos de los documentos (términos x documentos).
+        k (int): Número de documentos a retornar por consulta.
+        memory_bytes (int): Tamaño máximo de cada bloque denso de puntajes.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de documentos (consultas x k).
+            - np.ndarray: Puntajes correspondientes.
+    """
+    n_queries = query_matrix.shape[0]
+    n_docs = term_doc_matrix.shape[1]
+    k = min(k, n_docs)
+    chunk_size = max(1, memory_bytes // max(1, n_docs * 8))
+
+    top_indices = np.empty((n_queries, k), dtype=np.int64)
+    top_scores = np.empty((n_queries, k), dtype=np.float64)
+    for start in range(0, n_queries, chunk_size):
+        end = min(start + chunk_size, n_queries)
+        with stage("search.batch.score"):
+            scores = (query_matrix[start:end] @ term_doc_matrix).toarray()
+        with stage("search.batch.top_k"):
+            top_indices[start:end], top_scores[start:end] = top_k_rows(scores, k)
+    count("search.batch.queries", n_queries)
+    count("search.documents_scored", n_queries * n_docs)
+    return top_indices, top_scores
+
+@execute_time
+def batch_search_tfidf(matrix, vectorizer, queries, k=5, memory_bytes=BATCH_MEMORY_BYTES):
+    """
+    Recupera los k documentos más similares (coseno) para un conjunto de consultas a la vez.
+
+    Asume que las filas de la matriz y las consultas están normalizadas en L2 (comportamiento
+    por defecto de TfidfVectorizer), por lo que la similitud coseno es un producto punto.
+
+    Parámetros:
+        matrix (SparseTfidf | sparse matrix): Motor TF-IDF ya construido (sus postings se usan
+                                              sin copiarlas), o matriz TF-IDF (documentos x términos).
+        vectorizer (TfidfVectorizer): Vectorizador previamente entrenado.
+        queries (list[str]): Consultas preprocesadas como texto limpio.
+        k (int): Número de documentos a retornar por consulta.
+        memory_bytes (int): Tamaño máximo de cada bloque denso de puntajes.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de documentos (consultas x k) ordenados por similitud.
+            - np.ndarray: Similitudes correspondientes.
+    """
+    query_matrix = csr_matrix(vectorizer.transform(queries))
+    # La traspuesta de las postings CSC ya es CSR (términos x documentos), sin copia
+    postings = matrix.postings.T if isinstance(matrix, SparseTfidf) else csr_matrix(matrix.T)
+    return _batch_top_k(query_matrix, postings, k, memory_bytes)
+
+@execute_time
+def batch_search_bm25(bm25_model, queries_tokens, k=5, memory_bytes=BATCH_MEMORY_BYTES):
+    """
+    Recupera los k documentos con mayor puntaje BM25 para un conjunto de consultas a la vez.
+
+    Parámetros:
+        bm25_model (SparseBM25): Modelo BM25 previamente entrenado.
+        queries_tokens (list[list[str]]): Consultas tokenizadas.
+        k (int): Número de documentos a retornar por consulta.
+        memory_bytes (int): Tamaño máximo de cada bloque denso de puntajes.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices de documentos (consultas x k) ordenados por puntaje.
+            - np.ndarray: Puntajes correspondientes.
+    """
+    # Los términos repetidos de la consulta cuentan tantas veces como aparecen, igual que get_scores
+    query_counts, _ = build_count_matrix(queries_tokens, vocabulary=bm25_model.vocabulary)
+    query_matrix = query_counts.astype(np.float64)
+    return _batch_top_k(query_matrix, bm25_model.weights.T.tocsr(), k, memory_bytes)
@@ -0,0 +1,251 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.preprocessing import analyze_query, get_analyzer
+from src.search_engine import batch_search_bm25, batch_search_tfidf
+
+# Ventana de tiempo (segundos) durante la cual se agrupan consultas en un mismo lote
+BATCH_WINDOW = 0.005
+# Número máximo de consultas por lote
+MAX_BATCH_SIZE = 64
+# Número máximo de consultas en espera antes de rechazar nuevas (contrapresión)
+MAX_QUEUE_SIZE = 1024
+# Hilos que ejecutan la puntuación (NumPy/SciPy liberan el GIL en las operaciones pesadas)
+SCORING_THREADS = 4
+
+class ServiceOverloaded(Exception):
+    """
+    Se lanza cuando la cola de consultas está llena y el servicio no acepta más trabajo.
+    """
+
+def _warm_up_analyzer():
+    """
+    Crea el analizador compartido y fuerza la carga perezosa de WordNet en un solo hilo, antes de
+    que lleguen consultas concurrentes (la carga perezosa de NLTK no es segura entre hilos).
+    """
+    get_analyzer().lemmatizer.lemmatize("documents")
+
+class _Request:
+    """
+    Consulta pendiente dentro de la cola del servicio.
+    """
+
+    def __init__(self, model, query_clean, query_tokens, k, deadline, future):
+        self.model = model
+        self.query_clean = query_clean
+        self.query_tokens = query_tokens
+        self.k = k
+        self.deadline = deadline
+        self.future = future
+
+class SearchService:
+    """
+    Servicio de búsqueda asíncrono con planificador de micro-lotes.
+
+    Las consultas concurrentes se encolan; un planificador agrupa las que llegan dentro de
+    una ventana de tiempo corta y las puntúa con una sola multiplicación dispersa por lote
+    (batch_search_tfidf / batch_search_bm25) en un pool de hilos. Si la cola está llena, las
+    consultas nuevas se rechazan con ServiceOverloaded, y cada consulta puede tener un plazo.
+
+    Parámetros:
+        index (SearchIndex): Índice sobre el que se busca.
+        k (int): Número de resultados por defecto.
+        batch_window (float): Ventana de agrupamiento en segundos.
+        max_batch_size (int): Número máximo de consultas por lote.
+        max_queue_size (int): Número máximo de consultas en espera.
+        threads (int): Hilos del pool de puntuación.
+    """
+
+    def __init__(self, index, k=5, batch_window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE,
+                 max_queue_size=MAX_QUEUE_SIZE, threads=SCORING_THREADS):
+        self.index = index
+        # Postings TF-IDF del propio índice (CSC con sus cotas, sin copias)
+        self.tfidf = index.tfidf_engine
+        self.k = k
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.threads = threads
+        self._queue = None
+        self._executor = None
+        self._scheduler = None
+        self._slots = None
+        self._inflight = set()
+        self._stopping = False
+        self.batches = 0
+        self.queries = 0
+
+    async def start(self):
+        """
+        Crea la cola, el pool de hilos y lanza el planificador de lotes.
+        """
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="scoring")
+        self._slots = asyncio.Semaphore(self.threads)
+        await asyncio.get_running_loop().run_in_executor(self._executor, _warm_up_analyzer)
+        self._scheduler = asyncio.create_task(self._schedule())
+
+    async def stop(self):
+        """
+        Detiene el planificador, espera los lotes en curso y libera el pool de hilos.
+
+        Desde que empieza, search() no encola consultas nuevas: las que estaban preprocesándose
+        terminan con el mismo error que si el servicio no estuviera iniciado.
+        """
+        self._stopping = True
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            request = self._queue.get_nowait()
+            if not request.future.done():
+                request.future.cancel()
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            # shutdown(wait=True) bloquea hasta que terminen los hilos: se espera fuera del bucle
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown, True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def search(self, query, model="bm25", k=None, timeout=None):
+        """
+        Encola una consulta y espera su resultado.
+
+        Parámetros:
+            query (str): Texto crudo de la consulta.
+            model (str): 'bm25' o 'tfidf'.
+            k (int | None): Número de resultados; None usa el valor del servicio.
+            timeout (float | None): Plazo en segundos para obtener el resultado.
+
+        Retorna:
+            tuple:
+                - list[str]: IDs de los documentos ordenados por puntaje.
+                - np.ndarray: Puntajes correspondientes.
+
+        Lanza:
+            ServiceOverloaded: Si la cola de consultas está llena.
+            asyncio.TimeoutError: Si se vence el plazo.
+            RuntimeError: Si el servicio no está iniciado o se detiene antes de encolar la consulta.
+        """
+        if model not in ("bm25", "tfidf"):
+            raise ValueError(f"Modelo desconocido: {model}")
+        if self._scheduler is None or self._stopping:
+            raise RuntimeError("El servicio no está iniciado.")
+
+        loop = asyncio.get_running_loop()
+        # El preprocesamiento no debe bloquear el bucle de eventos
+        query_clean, query_tokens = await loop.run_in_executor(self._executor, analyze_query, query)
+        # stop() pudo empezar mientras tanto: nadie volvería a leer la cola
+        if self._stopping:
+            raise RuntimeError("El servicio no está iniciado.")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        request = _Request(model, query_clean, query_tokens, k or self.k, deadline, loop.create_future())
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            raise ServiceOverloaded("Demasiadas consultas en espera; intente nuevamente.") from None
+
+        if timeout is None:
+            return await request.future
+        return await asyncio.wait_for(request.future, timeout)
+
+    async def _schedule(self):
+        """
+        Bucle del planificador: arma lotes dentro de la ventana y los despacha al pool de hilos.
+
+        Si se cancela (stop), las consultas que ya salieron de la cola pero todavía no se
+        despacharon se cancelan, para que nadie quede esperando un resultado que no llegará.
+        """
+        loop = asyncio.get_running_loop()
+        # Consultas retiradas de la cola que aún no se entregaron a un lote en curso
+        pending = []
+        try:
+            while True:
+                pending = [await self._queue.get()]
+                window_end = loop.time() + self.batch_window
+                while len(pending) < self.max_batch_size:
+                    remaining = window_end - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                # Descartar consultas canceladas o con el plazo vencido antes de puntuar
+                now = time.monotonic()
+                live = []
+                for request in pending:
+                    if request.future.done():
+                        continue
+                    if request.deadline is not None and now >= request.deadline:
+                        request.future.set_exception(asyncio.TimeoutError())
+                        continue
+                    live.append(request)
+                pending = live
+
+                groups = {}
+                for request in live:
+                    groups.setdefault(request.model, []).append(request)
+                for model, requests in groups.items():
+                    await self._slots.acquire()
+                    task = asyncio.create_task(self._run_batch(model, requests))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+                    pending = [request for request in pending if request.model != model]
+        except asyncio.CancelledError:
+            for request in pending:
+                if not request.future.done():
+                    request.future.cancel()
+            raise
+
+    def _score(self, model, requests, k):
+        """
+        Puntúa un lote completo en un hilo del pool.
+        """
+        if model == "bm25":
+            (indices, scores), _ = batch_search_bm25(
+                self.index.bm25_model, [request.query_tokens for request in requests], k=k)
+        else:
+            (indices, scores), _ = batch_search_tfidf(
+                self.tfidf, self.index.tfidf_vectorizer,
+                [request.query_clean for request in requests], k=k)
+        return indices, scores
+
+    async def _run_batch(self, model, requests):
+        """
+        Ejecuta un lote en el pool de hilos y entrega a cada consulta su resultado.
+        """
+        try:
+            k = max(request.k for request in requests)
+            loop = asyncio.get_running_loop()
+            try:
+                indices, scores = await loop.run_in_executor(self._executor, self._score, model, requests, k)
+            except Exception as e:
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                return
+
+            document_ids = self.index.document_ids
+            for row, request in enumerate(requests):
+                if request.future.done():
+                    continue
+                top = indices[row, :request.k]
+                request.future.set_result(([document_ids[i] for i in top], scores[row, :request.k]))
+            self.batches += 1
+            self.queries += len(requests)
+        finally:
+            self._slots.release()
@@ -0,0 +1,327 @@
+import heapq
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz, save_npz
+from src.dataset_loader import iter_beir_documents, open_corpus_store
+from src.index_store import SearchIndex, load_index, save_index
+from src.preprocessing import iter_preprocessed
+from src.search_engine import (
+    CountMatrixBuilder,
+    SparseBM25,
+    TfidfQueryVectorizer,
+    batch_search_bm25,
+    batch_search_tfidf,
+    build_tf_idf_from_counts,
+)
+
+SHARD_DIR = "src/index_shards"
+SHARDS_FORMAT = "proyecto-ri-shards"
+SHARDS_VERSION = 1
+SHARDS_MANIFEST = "shards.json"
+NUM_SHARDS = 4
+
+# Fragmentos ya abiertos en el proceso actual (cada proceso del pool mapea los suyos una sola vez)
+_OPEN_SHARDS = {}
+
+def _shard_path(path, shard):
+    """
+    Retorna el directorio del fragmento número shard.
+    """
+    return os.path.join(path, f"shard_{shard:03d}")
+
+def _count_shard(shard_path, offset, limit):
+    """
+    Primera fase de la construcción: preprocesa un rango del corpus y guarda sus matrices de conteos.
+
+    Parámetros:
+        shard_path (str): Directorio del fragmento.
+        offset (int): Primer documento del rango.
+        limit (int): Número de documentos del rango.
+
+    Retorna:
+        dict: Términos y frecuencia documental locales (TF-IDF y BM25), suma de longitudes e IDs.
+    """
+    os.makedirs(shard_path, exist_ok=True)
+    tfidf_counts = CountMatrixBuilder()
+    bm25_counts = CountMatrixBuilder()
+    token_pattern = TfidfQueryVectorizer.token_pattern
+    document_ids = []
+    for prep_docs, token_docs, doc_ids in iter_preprocessed(iter_beir_documents(limit=limit, offset=offset)):
+        tfidf_counts.add(token_pattern.findall(text.lower()) for text in prep_docs)
+        bm25_counts.add(token_docs)
+        document_ids.extend(doc_ids)
+
+    stats = {"doc_ids": document_ids}
+    for name, builder in (("tfidf", tfidf_counts), ("bm25", bm25_counts)):
+        counts, vocabulary = builder.build()
+        save_npz(os.path.join(shard_path, f"_{name}_counts.npz"), counts)
+        stats[name + "_terms"] = sorted(vocabulary, key=vocabulary.get)
+        stats[name + "_df"] = np.bincount(counts.indices, minlength=counts.shape[1])
+        if name == "bm25":
+            stats["total_len"] = int(counts.sum())
+    return stats
+
+def _global_counts(shard_path, name, local_terms, global_vocabulary):
+    """
+    Carga los conteos de un fragmento y reasigna sus columnas al vocabulario global.
+
+    Como ambos vocabularios están ordenados alfabéticamente, la reasignación es monótona y los
+    índices de cada fila siguen ordenados.
+    """
+    counts = load_npz(os.path.join(shard_path, f"_{name}_counts.npz")).tocsr()
+    remap = np.array([global_vocabulary[term] for term in local_terms], dtype=np.int32)
+    indices = remap[counts.indices] if counts.nnz else counts.indices
+    os.remove(os.path.join(shard_path, f"_{name}_counts.npz"))
+    return csr_matrix((counts.data, indices, counts.indptr), shape=(counts.shape[0], len(global_vocabulary)))
+
+def _build_shard(shard_path, stats, collection, k1, b, epsilon):
+    """
+    Segunda fase de la construcción: calcula los pesos del fragmento con las estadísticas globales
+    y lo guarda con save_index.
+
+    Parámetros:
+        shard_path (str): Directorio del fragmento.
+        stats (dict): Resultado de _count_shard para este fragmento.
+        collection (dict): Vocabularios, frecuencias documentales, número de documentos y avgdl globales.
+        k1, b, epsilon (float): Parámetros de BM25.
+
+    Retorna:
+        int: Número de documentos del fragmento.
+    """
+    tfidf_counts = _global_counts(shard_path, "tfidf", stats["tfidf_terms"], collection["tfidf_vocabulary"])
+    tfidf_matrix, tfidf_vectorizer = build_tf_idf_from_counts(
+        tfidf_counts, collection["tfidf_vocabulary"],
+        doc_freq=collection["tfidf_df"], num_docs=collection["num_docs"],
+    )
+    bm25_counts = _global_counts(shard_path, "bm25", stats["bm25_terms"], collection["bm25_vocabulary"])
+    bm25_model = SparseBM25(
+        bm25_counts, collection["bm25_vocabulary"], k1=k1, b=b, epsilon=epsilon,
+        doc_freq=collection["bm25_df"], num_docs=collection["num_docs"], avgdl=collection["avgdl"],
+    )
+    save_index(SearchIndex(tfidf_matrix, tfidf_vectorizer, bm25_model, stats["doc_ids"]), shard_path)
+    return len(stats["doc_ids"])
+
+def _merge_statistics(shard_stats, prefix):
+    """
+    Une los vocabularios locales en uno global ordenado y suma las frecuencias documentales.
+    """
+    terms = sorted(set().union(*(stats[prefix + "_terms"] for stats in shard_stats)))
+    vocabulary = {term: i for i, term in enumerate(terms)}
+    doc_freq = np.zeros(len(terms), dtype=np.int64)
+    for stats in shard_stats:
+        columns = np.array([vocabulary[term] for term in stats[prefix + "_terms"]], dtype=np.int64)
+        np.add.at(doc_freq, columns, stats[prefix + "_df"])
+    return vocabulary, doc_freq
+
+def build_sharded_index(path=SHARD_DIR, num_shards=NUM_SHARDS, n_jobs=None, k1=1.5, b=0.75, epsilon=0.25):
+    """
+    Divide el corpus en fragmentos contiguos y construye el índice de cada uno en paralelo.
+
+    La construcción tiene dos fases: cada proceso preprocesa su rango del corpus y guarda sus
+    conteos; luego se combinan las frecuencias documentales, el número de documentos y la
+    longitud promedio de toda la colección, y cada proceso calcula sus pesos TF-IDF y BM25 con
+    esas estadísticas globales. Así los puntajes de cada fragmento son idénticos a los del
+    índice sin fragmentar.
+
+    Parámetros:
+        path (str): Directorio de destino.
+        num_shards (int): Número de fragmentos.
+        n_jobs (int | None): Número de procesos. None usa min(num_shards, núcleos disponibles).
+        k1, b, epsilon (float): Parámetros de BM25.
+
+    Retorna:
+        dict: Manifiesto de los fragmentos.
+    """
+    corpus = open_corpus_store()
+    num_docs = len(corpus)
+    corpus.close()
+    bounds = np.linspace(0, num_docs, num_shards + 1).astype(np.int64)
+    paths = [_shard_path(path, shard) for shard in range(num_shards)]
+    if n_jobs is None:
+        n_jobs = min(num_shards, os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        shard_stats = list(executor.map(
+            _count_shard, paths, bounds[:-1].tolist(), np.diff(bounds).tolist()))
+
+        tfidf_vocabulary, tfidf_df = _merge_statistics(shard_stats, "tfidf")
+        bm25_vocabulary, bm25_df = _merge_statistics(shard_stats, "bm25")
+        collection = {
+            "num_docs": num_docs,
+            "avgdl": sum(stats["total_len"] for stats in shard_stats) / num_docs,
+            "tfidf_vocabulary": tfidf_vocabulary,
+            "tfidf_df": tfidf_df,
+            "bm25_vocabulary": bm25_vocabulary,
+            "bm25_df": bm25_df,
+        }
+        sizes = list(executor.map(
+            _build_shard, paths, shard_stats, [collection] * num_shards,
+            [k1] * num_shards, [b] * num_shards, [epsilon] * num_shards))
+
+    manifest = {
+        "format": SHARDS_FORMAT,
+        "version": SHARDS_VERSION,
+        "build_id": uuid.uuid4().hex,
+        "num_docs": num_docs,
+        "shards": [
+            {"path": os.path.basename(shard_path), "offset": int(offset), "num_docs": size}
+            for shard_path, offset, size in zip(paths, bounds[:-1], sizes)
+        ],
+    }
+    tmp_path = os.path.join(path, SHARDS_MANIFEST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, SHARDS_MANIFEST))
+    return manifest
+
+def sharded_index_exists(path=SHARD_DIR):
+    """
+    Indica si existe un índice fragmentado (con manifiesto) en el directorio dado.
+    """
+    return os.path.exists(os.path.join(path, SHARDS_MANIFEST))
+
+def _open_shard(shard_path):
+    """
+    Retorna el índice de un fragmento, mapeándolo en memoria la primera vez que se usa en el proceso.
+
+    El índice queda en caché junto con su motor TF-IDF (postings CSC guardadas en disco), de modo
+    que las búsquedas siguientes no vuelven a preparar ninguna matriz.
+    """
+    index = _OPEN_SHARDS.get(shard_path)
+    if index is None:
+        index = _OPEN_SHARDS[shard_path] = load_index(shard_path, mmap=True)
+    return index
+
+def _search_shard(shard_path, offset, model, queries, k):
+    """
+    Busca un lote de consultas en un fragmento.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices globales de documentos (consultas x k).
+            - np.ndarray: Puntajes correspondientes.
+    """
+    index = _open_shard(shard_path)
+    if model == "bm25":
+        (indices, scores), _ = batch_search_bm25(index.bm25_model, queries, k=k)
+    else:
+        (indices, scores), _ = batch_search_tfidf(index.tfidf_engine, index.tfidf_vectorizer, queries, k=k)
+    return indices + offset, scores
+
+def merge_top_k(shard_results, k):
+    """
+    Une los top-k de cada fragmento en el top-k global con un heap.
+
+    Ante empates gana el documento con menor índice global. Como el top-k de cada fragmento
+    resuelve los empates de la misma forma (top_k_rows) y los fragmentos puntúan con estadísticas
+    globales, el resultado coincide con el de la búsqueda sin fragmentar.
+
+    Parámetros:
+        shard_results (list[tuple[np.ndarray, np.ndarray]]): (índices globales, puntajes) de cada
+                                                             fragmento, con una fila por consulta.
+        k (int): Número de documentos a retornar por consulta.
+
+    Retorna:
+        tuple:
+            - np.ndarray: Índices globales de documentos (consultas x k) ordenados por puntaje.
+            - np.ndarray: Puntajes correspondientes.
+    """
+    num_queries = shard_results[0][0].shape[0]
+    k = min(k, sum(indices.shape[1] for indices, _ in shard_results))
+    top_indices = np.empty((num_queries, k), dtype=np.int64)
+    top_scores = np.empty((num_queries, k), dtype=np.float64)
+    for row in range(num_queries):
+        # Cada lista ya viene ordenada por (-puntaje, índice), así que basta mezclarlas
+        runs = [zip((-scores[row]).tolist(), indices[row].tolist()) for indices, scores in shard_results]
+        for col, (neg_score, doc) in enumerate(islice(heapq.merge(*runs), k)):
+            top_indices[row, col] = doc
+            top_scores[row, col] = -neg_score
+    return top_indices, top_scores
+
+class ShardedSearcher:
+    """
+    Búsqueda scatter-gather sobre un índice fragmentado con un pool de procesos.
+
+    Cada lote de consultas se envía a todos los fragmentos en paralelo; cada proceso mapea en
+    memoria los fragmentos que le tocan (una sola vez) y retorna su top-k, que luego se une con
+    merge_top_k. Los índices retornados son filas globales del corpus (las mismas de CorpusStore).
+
+    Parámetros:
+        path (str): Directorio del índice fragmentado.
+        n_jobs (int | None): Número de procesos. None usa min(número de fragmentos, núcleos).
+
+    Lanza:
+        ValueError: Si el formato o la versión del manifiesto no son compatibles.
+    """
+
+    def __init__(self, path=SHARD_DIR, n_jobs=None):
+        with open(os.path.join(path, SHARDS_MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != SHARDS_FORMAT or manifest.get("version") != SHARDS_VERSION:
+            raise ValueError(
+                f"Índice fragmentado incompatible en '{path}': formato {manifest.get('format')} "
+                f"versión {manifest.get('version')} (se esperaba {SHARDS_FORMAT} versión {SHARDS_VERSION})."
+            )
+        self.manifest = manifest
+        self.version = manifest["build_id"]
+        self.num_docs = manifest["num_docs"]
+        self.shards = [(os.path.join(path, shard["path"]), shard["offset"]) for shard in manifest["shards"]]
+        if n_jobs is None:
+            n_jobs = min(len(self.shards), os.cpu_count() or 1)
+        self._executor = ProcessPoolExecutor(max_workers=n_jobs)
+
+    def _scatter_gather(self, model, queries, k):
+        """
+        Envía el lote a todos los fragmentos y une sus resultados.
+        """
+        futures = [
+            self._executor.submit(_search_shard, shard_path, offset, model, queries, k)
+            for shard_path, offset in self.shards
+        ]
+        return merge_top_k([future.result() for future in futures], k)
+
+    def search_bm25(self, queries_tokens, k=5):
+        """
+        Top-k BM25 de un lote de consultas sobre todos los fragmentos.
+
+        Parámetros:
+            queries_tokens (list[list[str]]): Consultas tokenizadas.
+            k (int): Número de documentos a retornar por consulta.
+
+        Retorna:
+            tuple:
+                - np.ndarray: Índices globales de documentos (consultas x k) ordenados por puntaje.
+                - np.ndarray: Puntajes correspondientes.
+        """
+        return self._scatter_gather("bm25", queries_tokens, k)
+
+    def search_tfidf(self, queries, k=5):
+        """
+        Top-k por similitud coseno de un lote de consultas sobre todos los fragmentos.
+
+        Parámetros:
+            queries (list[str]): Consultas preprocesadas como texto limpio.
+            k (int): Número de documentos a retornar por consulta.
+
+        Retorna:
+            tuple:
+                - np.ndarray: Índices globales de documentos (consultas x k) ordenados por similitud.
+                - np.ndarray: Similitudes correspondientes.
+        """
+        return self._scatter_gather("tfidf", queries, k)
+
+    def close(self):
+        """
+        Detiene el pool de procesos.
+        """
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()